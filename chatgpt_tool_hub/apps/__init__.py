@@ -1,7 +1,10 @@
 from .app import App
 from .app_factory import AppFactory
+from .runtime import AppRuntime, AppSession
 
 __all__ = [
     "App",
-    "AppFactory"
+    "AppFactory",
+    "AppRuntime",
+    "AppSession",
 ]
\ No newline at end of file
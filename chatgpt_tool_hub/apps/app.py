@@ -1,28 +1,42 @@
 from abc import abstractmethod
-from typing import List
+from typing import AsyncIterator, Iterator, List
 
 from ..engine.tool_engine import ToolEngine
+from ..common.concurrency import run_in_executor
 from ..common.log import LOG
-from ..common.singleton import Singleton
+from ..common.schema import StreamEvent
+from ..common.utils import get_from_dict_or_env
 from ..tools.base_tool import BaseTool
 
 
-class App(Singleton):
+class App:
     engine: ToolEngine = None
 
-    # 当前已加载工具
-    tools: set = set()
-    tools_kwargs: dict = {}
-
     # 创建时必须包含的工具列表
     mandatory_tools: list = []
 
+    # app settings read from app_kwargs, everything else in them configures the llm
+    setting_keys: tuple = ("request_deadline",)
+
     @classmethod
     def get_class_name(cls) -> str:
         return str(cls.__name__)
 
+    @classmethod
+    def pick_settings(cls, kwargs: dict) -> dict:
+        """The app settings among `kwargs`, to pass on next to the model params."""
+        return {key: kwargs[key] for key in cls.setting_keys if key in kwargs}
+
+    def model_kwargs(self, app_kwargs: dict) -> dict:
+        """`app_kwargs` without the app settings, the llm doesn't need them."""
+        return {key: value for key, value in app_kwargs.items() if key not in self.setting_keys}
+
     def __init__(self, **app_kwargs):
-        super().__init__()
+        # 当前已加载工具
+        self.tools: set = set()
+        self.tools_kwargs: dict = {}
+        # seconds one ask may take in total (llm calls, tools, retries), 0 means no limit
+        self.request_deadline = float(get_from_dict_or_env(app_kwargs, "request_deadline", "REQUEST_DEADLINE", 0))
         return
 
     @abstractmethod
@@ -57,6 +71,17 @@ class App(Singleton):
     def ask(self, query: str, chat_history: list = None, retry_num: int = 0) -> str:
         """use this method to interactive with bot"""
 
+    async def aask(self, query: str, chat_history: list = None, retry_num: int = 0) -> str:
+        """async version of ask, apps without an async path run ask on the shared executor"""
+        return await run_in_executor(self.ask, query, chat_history, retry_num)
+
+    def ask_stream(self, query: str, chat_history: list = None) -> Iterator[StreamEvent]:
+        """like ask, but yield the progress and the answer tokens as they come"""
+        raise ValueError("ask_stream not implemented for this app.")
+
+    def aask_stream(self, query: str, chat_history: list = None) -> AsyncIterator[StreamEvent]:
+        raise ValueError("aask_stream not implemented for this app.")
+
     def _check_mandatory_tools(self, use_tools: list) -> bool:
         for tool in self.mandatory_tools:
             if tool not in use_tools:
@@ -38,6 +38,18 @@ class AppFactory:
             from ..tools.meteo.tool import default_tool_name as meteo_name
             self.default_tools_list = [python_tool_name, terminal_tool_name, get_tool_name, meteo_name]
 
+        # persistent llm cache
+        llm_cache_path = get_from_dict_or_env(kwargs, "llm_cache_path", "LLM_CACHE_PATH", "")
+        if llm_cache_path:
+            from .. import models
+            from ..common.cache import SQLiteCache
+            if not isinstance(models.llm_cache, SQLiteCache) or models.llm_cache.database_path != llm_cache_path:
+                models.llm_cache = SQLiteCache(
+                    database_path=llm_cache_path,
+                    max_size=int(get_from_dict_or_env(kwargs, "llm_cache_max_size", "LLM_CACHE_MAX_SIZE", 10000)),
+                    ttl=float(get_from_dict_or_env(kwargs, "llm_cache_ttl", "LLM_CACHE_TTL", 0)),
+                )
+
         # dynamic loading tool
         dynamic_tool_loader(**kwargs)
 
@@ -54,7 +66,7 @@ class AppFactory:
 
         if app_type == 'lite':
             from ..apps.lite_app import LiteApp
-            app = LiteApp(**build_model_params(kwargs))
+            app = LiteApp(**build_model_params(kwargs), **LiteApp.pick_settings(kwargs))
             app.create(tools_list, **kwargs)
             return app
 
@@ -69,7 +81,7 @@ class AppFactory:
             if "browser" in main_tool_register.get_registered_tool_names():
                 tools_list = ["browser" if tool == "url-get" else tool for tool in tools_list]
 
-            app = Victorinox(self.console, **build_model_params(kwargs))
+            app = Victorinox(self.console, **build_model_params(kwargs), **Victorinox.pick_settings(kwargs))
             app.create(tools_list, **kwargs)
             return app
         else:
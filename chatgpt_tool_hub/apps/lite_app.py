@@ -1,6 +1,7 @@
 from ..apps import App
 from ..apps import AppFactory
 from ..chains import LLMChain
+from ..common.deadline import deadline, deadline_expired
 from ..common.log import LOG
 from ..models.model_factory import ModelFactory
 from ..prompts import PromptTemplate
@@ -9,9 +10,9 @@ from ..prompts import PromptTemplate
 class LiteApp(App):
 
     def __init__(self, **app_kwargs):
-        super().__init__()
+        super().__init__(**app_kwargs)
         
-        self.llm = ModelFactory.create_llm_model(temperature=0.9, **app_kwargs)
+        self.llm = ModelFactory().create_llm_model(**{**self.model_kwargs(app_kwargs), "temperature": 0.9})
 
         self.prompt = PromptTemplate(
             input_variables=["question"],
@@ -35,16 +36,17 @@ class LiteApp(App):
             LOG.warning("[APP]: query is zero value")
             raise ValueError("请求为空")
 
-        try:
-            response = self.bot.run(query)
-            LOG.info(f"[APP] response: {str(response)}")
-            return str(response)
-        except ValueError as e:
-            LOG.error(f"[APP] catch a ValueError: {str(e)}")
-            if retry_num < 1:
-                return self.ask(query, chat_history, retry_num + 1)
-            LOG.error("exceed retry_num")
-            raise TimeoutError("超过重试次数")
+        with deadline(self.request_deadline):
+            try:
+                response = self.bot.run(query)
+                LOG.info(f"[APP] response: {str(response)}")
+                return str(response)
+            except ValueError as e:
+                LOG.error(f"[APP] catch a ValueError: {str(e)}")
+                if retry_num < 1 and not deadline_expired():
+                    return self.ask(query, chat_history, retry_num + 1)
+                LOG.error("exceed retry_num")
+                raise TimeoutError("超过重试次数")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,213 @@
+"""Shared runtime of an app and the lightweight sessions served by it."""
+import uuid
+from typing import AsyncIterator, Callable, Iterator, List, Optional, Sequence
+
+from rich.console import Console
+
+from ..bots.all_bot_list import BOT_TO_CLASS
+from ..common.callbacks import BaseCallbackManager, get_callback_manager
+from ..common.deadline import deadline
+from ..common.log import LOG
+from ..common.metrics import install_metrics_handler
+from ..common.schema import StreamEvent
+from ..common.tracing import request_context
+from ..database import BaseChatMessageHistory, ConversationSummaryBufferMemory, ConversationTokenBufferMemory
+from ..engine.tool_engine import ToolEngine
+from ..models.base import BaseLanguageModel
+from ..tools.base_tool import BaseTool
+
+
+class AppRuntime:
+    """Everything the sessions of an app share: the llm, the loaded tools and the bot prompt.
+
+    Built once (building the prompt lists every tool) and never changed afterwards,
+    so any number of sessions may use it at the same time from threads or an event
+    loop. To change the tools, build a new runtime; sessions of the old one keep
+    working with it.
+    """
+
+    def __init__(
+        self,
+        llm: BaseLanguageModel,
+        tools: Sequence[BaseTool],
+        bot_type: str = "chat-bot",
+        console: Console = Console(quiet=True),
+        max_iterations: int = 2,
+        early_stopping_method: str = "generate",
+        request_deadline: float = 0,
+        callback_manager: Optional[BaseCallbackManager] = None,
+        bot_kwargs: Optional[dict] = None,
+        history_factory: Optional[Callable[[str], BaseChatMessageHistory]] = None,
+        summarize_memory: bool = False,
+    ):
+        if bot_type not in BOT_TO_CLASS:
+            raise ValueError(f"Got unknown bot type: {bot_type}. Valid types are: {BOT_TO_CLASS.keys()}.")
+        self.llm = llm
+        self.tools = tuple(tools)
+        self.console = console
+        self.max_iterations = max_iterations
+        self.early_stopping_method = early_stopping_method
+        self.request_deadline = request_deadline
+        self.callback_manager = callback_manager or get_callback_manager()
+        # bot actions and chain errors are only seen by the callbacks
+        install_metrics_handler(self.callback_manager)
+        # session_id -> the history a session's memory keeps its messages in, None keeps them in process
+        self.history_factory = history_factory
+        # fold the turns memory drops into a summary in the background instead of forgetting them
+        self.summarize_memory = summarize_memory
+        # sessions run forks of this bot, its prompt and token budget are computed here once
+        self.bot = BOT_TO_CLASS[bot_type].from_llm_and_tools(
+            llm, self.tools, console, callback_manager=self.callback_manager, **(bot_kwargs or {})
+        )
+        self.memory_token_limit = self.bot.token_budget.memory_limit
+
+    def new_memory(self, session_id: Optional[str] = None) -> ConversationTokenBufferMemory:
+        kwargs = {}
+        if self.history_factory is not None and session_id is not None:
+            kwargs["chat_memory"] = self.history_factory(session_id)
+        memory_class = ConversationSummaryBufferMemory if self.summarize_memory else ConversationTokenBufferMemory
+        return memory_class(llm=self.llm, memory_key="chat_history", output_key="output",
+                            max_token_limit=self.memory_token_limit, **kwargs)
+
+    def new_engine(
+        self, memory: Optional[ConversationTokenBufferMemory] = None, session_id: Optional[str] = None
+    ) -> ToolEngine:
+        """An engine of its own around a fork of the shared bot."""
+        return ToolEngine.from_bot_and_tools(
+            self.bot.fork(), self.tools, console=self.console, callback_manager=self.callback_manager,
+            memory=memory, verbose=True, max_iterations=self.max_iterations,
+            early_stopping_method=self.early_stopping_method, checkpoint_namespace=session_id,
+        )
+
+    def new_session(self, session_id: Optional[str] = None) -> "AppSession":
+        return AppSession(self, session_id=session_id)
+
+    def get_tool_list(self) -> List[str]:
+        _tool_list = []
+        for tool in self.tools:
+            _tool_list.extend(tool.get_tool_list())
+        return _tool_list
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}(bot={self.bot.__class__.__name__}, tools={[t.name for t in self.tools]})"
+
+
+class AppSession:
+    """One conversation on an AppRuntime: its memory, its engine and the history already seen.
+
+    Creating a session builds no prompt and loads no tool. A session answers one
+    question at a time; serve concurrent users with one session each.
+    """
+
+    def __init__(
+        self,
+        runtime: AppRuntime,
+        memory: Optional[ConversationTokenBufferMemory] = None,
+        session_id: Optional[str] = None,
+    ):
+        self.runtime = runtime
+        self.session_id = session_id or uuid.uuid4().hex
+        self.memory = memory or runtime.new_memory(self.session_id)
+        self.engine = runtime.new_engine(self.memory, self.session_id)
+
+        # chat_history (role, content) already replayed into memory, None until
+        # the caller passes one, and a user message still waiting for its answer
+        self._loaded_history = None
+        self._pending_input = ""
+
+    def with_runtime(self, runtime: AppRuntime) -> "AppSession":
+        """This conversation carried over to another runtime, e.g. after the tools changed."""
+        session = AppSession(runtime, memory=self.memory, session_id=self.session_id)
+        session._loaded_history = self._loaded_history
+        session._pending_input = self._pending_input
+        return session
+
+    def _prepare_ask(self, query: str, chat_history: list = None):
+        if not query:
+            LOG.warning("[APP]: query is zero value")
+            raise ValueError("请求为空")
+
+        # 更新session
+        if chat_history is not None:
+            self._refresh_memory(chat_history)
+
+    def ask(self, query: str, chat_history: list = None, retry_num: int = 0) -> str:
+        """Answer `query`. A failed step is retried by the engine, so the run isn't;
+        asking the same again resumes from the last finished step. `retry_num` is
+        kept for compatibility and ignored."""
+        self._prepare_ask(query, chat_history)
+
+        with request_context(), deadline(self.runtime.request_deadline):
+            try:
+                LOG.info(f"提问: {query}")
+                answer = self.engine.run(query)
+            except Exception as e:
+                LOG.error(f"[APP] catch a Exception: {repr(e)}")
+                raise
+        self._remember_turn(query, answer)
+        return answer
+
+    async def aask(self, query: str, chat_history: list = None, retry_num: int = 0) -> str:
+        self._prepare_ask(query, chat_history)
+
+        with request_context(), deadline(self.runtime.request_deadline):
+            try:
+                LOG.info(f"提问: {query}")
+                answer = await self.engine.arun(query)
+            except Exception as e:
+                LOG.error(f"[APP] catch a Exception: {repr(e)}")
+                raise
+        self._remember_turn(query, answer)
+        return answer
+
+    def ask_stream(self, query: str, chat_history: list = None) -> Iterator[StreamEvent]:
+        """no retry here, events already sent can't be taken back"""
+        self._prepare_ask(query, chat_history)
+        LOG.info(f"提问(stream): {query}")
+        for event in self.engine.stream(query, timeout=self.runtime.request_deadline):
+            if event.type == "final":
+                self._remember_turn(query, event.data)
+            yield event
+
+    async def aask_stream(self, query: str, chat_history: list = None) -> AsyncIterator[StreamEvent]:
+        self._prepare_ask(query, chat_history)
+        LOG.info(f"提问(stream): {query}")
+        async for event in self.engine.astream(query, timeout=self.runtime.request_deadline):
+            if event.type == "final":
+                self._remember_turn(query, event.data)
+            yield event
+
+    def _refresh_memory(self, chat_history: list):
+        """Bring memory in line with chat_history, replaying only what is new."""
+        if self._loaded_history is None:
+            # the caller keeps the conversation from now on, memory only mirrors it;
+            # replaying it into a persistent history would duplicate or wipe what is stored
+            self.memory.detach_history()
+        history = [(item.get('role'), item.get('content')) for item in chat_history]
+        loaded = self._loaded_history or []
+        loaded_num = len(loaded)
+        if history[:loaded_num] != loaded:
+            # the caller's history diverged from ours, start over
+            self.memory.clear()
+            self._pending_input = ""
+            loaded_num = 0
+
+        for role, content in history[loaded_num:]:
+            if role == 'user':
+                self._pending_input = content
+            elif role == 'assistant':
+                self.memory.save_context({"input": self._pending_input}, {"output": content})
+        self._loaded_history = history
+
+        LOG.debug(f"Now memory: {repr(self.memory.chat_memory.messages)}")
+
+    def _remember_turn(self, query: str, answer: str):
+        # the engine saved this turn into memory itself, a caller passing it back
+        # in its next chat_history then needs no replay
+        if self._loaded_history is None:
+            return
+        self._loaded_history.extend([('user', query), ('assistant', answer)])
+        self._pending_input = query
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}({self.session_id}, runtime={self.runtime})"
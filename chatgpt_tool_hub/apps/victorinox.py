@@ -1,33 +1,56 @@
-from typing import List
+from typing import AsyncIterator, Iterator, List, Optional
 
 from rich.console import Console
 
 from ..apps import App
 from ..apps import AppFactory
 from ..common.log import LOG
+from ..common.metrics import start_metrics_server
+from ..common.schema import StreamEvent
 
 from ..common.utils import get_from_dict_or_env
-from ..database import ConversationTokenBufferMemory
-from ..engine.initialize import init_tool_engine as init_engine
-from ..models import MEMORY_MAX_TOKENS_NUM
+from ..database import ConversationTokenBufferMemory, SQLiteChatMessageHistory
+from ..engine.tool_engine import ToolEngine
 from ..models.model_factory import ModelFactory
+from .runtime import AppRuntime, AppSession
 from ..tools.tool_register import main_tool_register
 from ..tools.base_tool import BaseTool
 from ..tools.load_tools import load_tools
 
 class Victorinox(App):
     bot_type: str = "chat-bot"
+    setting_keys: tuple = App.setting_keys + (
+        "think_depth", "chat_history_db", "memory_summary", "session_id", "metrics_port",
+    )
 
     def __init__(self, console=Console(), **app_kwargs):
-        super().__init__()
-        self.llm = ModelFactory().create_llm_model(**app_kwargs)
-
-        self.memory = ConversationTokenBufferMemory(llm=self.llm, memory_key="chat_history",
-                                                    output_key='output', max_token_limit=MEMORY_MAX_TOKENS_NUM)
+        super().__init__(**app_kwargs)
+        self.llm = ModelFactory().create_llm_model(**self.model_kwargs(app_kwargs))
         self.think_depth = get_from_dict_or_env(app_kwargs, "think_depth", "THINK_DEPTH", 2)
+        # sqlite file keeping every session's chat history across restarts, empty keeps it in process
+        self.chat_history_db = get_from_dict_or_env(app_kwargs, "chat_history_db", "CHAT_HISTORY_DB", "")
+        self.memory_summary = str(get_from_dict_or_env(app_kwargs, "memory_summary", "MEMORY_SUMMARY", False)).lower() == "true"
+        self.session_id = get_from_dict_or_env(app_kwargs, "session_id", "SESSION_ID", "default")
+        # local port serving prometheus metrics on /metrics, 0 serves none
+        self.metrics_port = int(get_from_dict_or_env(app_kwargs, "metrics_port", "METRICS_PORT", 0))
+        if self.metrics_port > 0:
+            start_metrics_server(self.metrics_port)
 
         self.console = console
 
+        # shared by every session, rebuilt when the tools change
+        self.runtime: Optional[AppRuntime] = None
+        # the conversation ask() talks to, new_session() makes more
+        self.session: Optional[AppSession] = None
+
+    @property
+    def engine(self) -> Optional[ToolEngine]:
+        return self.session.engine if self.session else None
+
+    @property
+    def memory(self) -> Optional[ConversationTokenBufferMemory]:
+        return self.session.memory if self.session else None
+
     def create(self, tools_list: list, **tools_kwargs):
         if tools_list is None:
             tools_list = []
@@ -87,50 +110,50 @@ class Victorinox(App):
     def init_tool_engine(self, tools: List[BaseTool] = list, **bot_kwargs):
         # create bots
         # todo fix verbose params
-        self.engine = init_engine(tools, self.llm, bot=self.bot_type, verbose=True, memory=self.memory,
+        self.runtime = AppRuntime(self.llm, tools, bot_type=self.bot_type, console=self.console,
                                   max_iterations=self.think_depth, early_stopping_method="generate",
-                                  console=self.console, bot_kwargs=bot_kwargs)
-
-    def ask(self, query: str, chat_history: list = None, retry_num: int = 0) -> str:
-        if self.engine is None:
+                                  request_deadline=self.request_deadline, bot_kwargs=bot_kwargs,
+                                  history_factory=self._history_factory(), summarize_memory=self.memory_summary)
+        # the default conversation keeps its memory across tool changes
+        if self.session:
+            self.session = self.session.with_runtime(self.runtime)
+        else:
+            self.session = self.runtime.new_session(self.session_id)
+
+    def _history_factory(self):
+        if not self.chat_history_db:
+            return None
+        return lambda session_id: SQLiteChatMessageHistory(session_id=session_id,
+                                                           database_path=self.chat_history_db)
+
+    def new_session(self, session_id: Optional[str] = None) -> AppSession:
+        """A conversation of its own on the loaded tools, for serving several users at once."""
+        self._check_created()
+        return self.runtime.new_session(session_id)
+
+    def _check_created(self):
+        if self.runtime is None:
             LOG.error("before calling the ask method, you should use create bot firstly")
             raise RuntimeError("app初始化失败")
 
-        if not query:
-            LOG.warning("[APP]: query is zero value")
-            raise ValueError("请求为空")
+    def ask(self, query: str, chat_history: list = None, retry_num: int = 0) -> str:
+        self._check_created()
+        return self.session.ask(query, chat_history, retry_num)
 
-        # 更新session
-        if chat_history is not None:
-            self._refresh_memory(chat_history)
+    async def aask(self, query: str, chat_history: list = None, retry_num: int = 0) -> str:
+        self._check_created()
+        return await self.session.aask(query, chat_history, retry_num)
 
-        try:
-            LOG.info(f"提问: {query}")
-            return self.engine.run(query)
-        except Exception as e:
-            LOG.error(f"[APP] catch a Exception: {str(e)}")
-            if retry_num < 1:
-                return self.ask(query, chat_history, retry_num + 1)
-            LOG.error("exceed retry_num")
-            raise TimeoutError("超过重试次数")
-
-    def _refresh_memory(self, chat_history: list):
-        self.memory.chat_memory.clear()
-        inputs = {
-            "input": ""
-        }
-        outputs = {
-            "output": ""
-        }
-
-        for item in chat_history:
-            if item.get('role') == 'user':
-                inputs["input"] = item.get('content')
-            elif item.get('role') == 'assistant':
-                outputs["output"] = item.get('content')
-                self.memory.save_context(inputs, outputs)
-
-        LOG.debug(f"Now memory: {repr(self.memory.chat_memory.messages)}")
+    def ask_stream(self, query: str, chat_history: list = None) -> Iterator[StreamEvent]:
+        self._check_created()
+        return self.session.ask_stream(query, chat_history)
+
+    def aask_stream(self, query: str, chat_history: list = None) -> AsyncIterator[StreamEvent]:
+        self._check_created()
+        return self.session.aask_stream(query, chat_history)
+
+    def get_tool_list(self) -> List[str]:
+        return self.runtime.get_tool_list()
 
 
 if __name__ == "__main__":
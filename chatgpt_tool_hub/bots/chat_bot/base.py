@@ -11,8 +11,10 @@ from rich.panel import Panel
 from ...chains import LLMChain
 from ...common import json_utils
 from ...common.callbacks import BaseCallbackManager
+from ...common.concurrency import run_in_executor
 from ...common.log import LOG
 from ...common.schema import BotAction, BotFinish
+from ...common.stream import FinalAnswerStreamParser, JsonFieldFinalAnswerParser
 from ...engine import Bot
 from ...models.base import BaseLLM
 from ...prompts import PromptTemplate
@@ -91,33 +93,33 @@ class ChatBot(Bot):
 
     def plan(
         self, intermediate_steps: List[Tuple[BotAction, str]], **kwargs: Any
-    ) -> Union[BotAction, BotFinish]:
+    ) -> Union[BotAction, List[BotAction], BotFinish]:
         """Given input, decided what to do."""
         full_inputs = self.get_full_inputs(intermediate_steps, **kwargs)
-        action = self._get_next_action(full_inputs)
-        if action.tool == "answer-user":
-            return BotFinish({"output": action.tool_input}, action.log)
-        return action
+        return self._plan_result(self._get_next_actions(full_inputs), "answer-user")
+
+    def create_stream_parser(self) -> FinalAnswerStreamParser:
+        """Stream the tool input of an answer-user reply."""
+        return JsonFieldFinalAnswerParser("answer-user")
 
     def get_full_inputs(
         self, intermediate_steps: List[Tuple[BotAction, str]], **kwargs: Any
     ) -> Dict[str, Any]:
         """Create the full inputs for the LLMChain from intermediate steps."""
-        thoughts = self._construct_scratchpad(intermediate_steps)
         # todo remove stop
-        new_inputs = {"bot_scratchpad": self._crop_full_input(thoughts)}
+        new_inputs = {"bot_scratchpad": self._render_scratchpad(intermediate_steps, kwargs)}
         return {**kwargs, **new_inputs}
 
-    def _get_next_action(self, full_inputs: Dict[str, str]) -> BotAction:
+    def _get_next_actions(self, full_inputs: Dict[str, str]) -> List[BotAction]:
         llm_answer_str = self.llm_chain.predict(**full_inputs)
 
-        action, action_input = self._extract_tool_and_input(llm_answer_str)
+        tool_calls = self._extract_tool_calls(llm_answer_str)
 
-        LOG.info(f"输入: {action_input}")
+        LOG.info(f"输入: {[call[1] for call in tool_calls]}")
         
         # json 解析错误重试
         retry_num = 0
-        while not action:
+        while not tool_calls[0][0]:
             retry_num += 1
             if retry_num > self.max_parse_retry_num:
                 raise ValueError(f"Could not parse LLM output: `{llm_answer_str}`")
@@ -126,12 +128,40 @@ class ChatBot(Bot):
             full_inputs["bot_scratchpad"] += full_output
             output = self.llm_chain.predict(**full_inputs)
 
-            action, action_input = self._extract_tool_and_input(output)
+            tool_calls = self._extract_tool_calls(output)
 
-            LOG.info(f"重试输入: {action_input}")
-        return BotAction(
-            tool=action, tool_input=action_input, log=llm_answer_str
-        )
+            LOG.info(f"重试输入: {[call[1] for call in tool_calls]}")
+        return self._to_actions(tool_calls, llm_answer_str)
+
+    async def aplan(
+        self, intermediate_steps: List[Tuple[BotAction, str]], **kwargs: Any
+    ) -> Union[BotAction, List[BotAction], BotFinish]:
+        """Given input, decided what to do."""
+        full_inputs = await run_in_executor(self.get_full_inputs, intermediate_steps, **kwargs)
+        return self._plan_result(await self._aget_next_actions(full_inputs), "answer-user")
+
+    async def _aget_next_actions(self, full_inputs: Dict[str, str]) -> List[BotAction]:
+        llm_answer_str = await self.llm_chain.apredict(**full_inputs)
+
+        tool_calls = self._extract_tool_calls(llm_answer_str)
+
+        LOG.info(f"输入: {[call[1] for call in tool_calls]}")
+
+        # json 解析错误重试
+        retry_num = 0
+        while not tool_calls[0][0]:
+            retry_num += 1
+            if retry_num > self.max_parse_retry_num:
+                raise ValueError(f"Could not parse LLM output: `{llm_answer_str}`")
+
+            full_output = self._fix_text(llm_answer_str)
+            full_inputs["bot_scratchpad"] += full_output
+            output = await self.llm_chain.apredict(**full_inputs)
+
+            tool_calls = self._extract_tool_calls(output)
+
+            LOG.info(f"重试输入: {[call[1] for call in tool_calls]}")
+        return self._to_actions(tool_calls, llm_answer_str)
 
     @property
     def finish_tool_name(self) -> str:
@@ -139,8 +169,20 @@ class ChatBot(Bot):
         return self.ai_prefix
 
     def _extract_tool_and_input(self, llm_output: str) -> Optional[Tuple[str, str]]:
-        # 1. json loads and 修复 & 错误处理
+        return self._tool_call_from_reply(self.parse_reply_json(llm_output))
+
+    def _extract_tool_calls(self, llm_output: str) -> List[Tuple[str, str]]:
+        """Tool calls of the reply's "tools" list if it has one, else its single "tool"."""
         llm_reply_json = self.parse_reply_json(llm_output)
+        tool_list = llm_reply_json.get("tools") if isinstance(llm_reply_json, dict) else None
+        if not isinstance(tool_list, list) or not tool_list:
+            return [self._tool_call_from_reply(llm_reply_json)]
+
+        thoughts = llm_reply_json.get("thoughts", {})
+        return [self._tool_call_from_reply({"thoughts": thoughts, "tool": tool_dict}) for tool_dict in tool_list]
+
+    def _tool_call_from_reply(self, llm_reply_json: Any) -> Tuple[str, str]:
+        # 1. json loads and 修复 & 错误处理
         action, action_input = "", ""
 
         try:
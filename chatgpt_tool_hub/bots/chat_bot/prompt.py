@@ -34,6 +34,9 @@ Response Format:
 
 The strings corresponding to "text", "reasoning", "criticism", and "speak" in JSON should be described in Chinese.
 
+If the user input needs several tools whose inputs don't depend on each other's results, you can call them all at once:
+replace "tool" with "tools", a list like [{{{{"name": "tool name", "input": "tool input"}}}}, ...]. They will run at the same time.
+
 If you don't need to use a tool(like solely chat scene), or have already reasoned the final answer associated with user input from the tool, You must abide by the following rules: 
 1. "text", "reasoning", "criticism", and "speak" in JSON should be empty.
 2. The tool's name in json is "answer-user".
@@ -8,6 +8,7 @@ from rich.console import Console
 from ...chains import LLMChain
 from ...common.callbacks import BaseCallbackManager
 from ...common.log import LOG
+from ...common.stream import FinalAnswerStreamParser, PrefixFinalAnswerParser
 from ...engine import Bot
 from ...models.base import BaseLLM
 from ...prompts import PromptTemplate
@@ -35,6 +36,10 @@ class QABot(Bot):
         """Prefix to append the llm call with."""
         return "Thought:"
 
+    def create_stream_parser(self) -> FinalAnswerStreamParser:
+        """Stream everything after `Final Answer:`."""
+        return PrefixFinalAnswerParser(FINAL_ANSWER_ACTION)
+
     def _fix_text(self, text: str) -> str:
         tool_names = ", ".join(list(self.allowed_tools)) if self.allowed_tools else ""
         instruction_text = FORMAT_INSTRUCTIONS.format(tool_names=tool_names)
@@ -128,3 +133,15 @@ class QABot(Bot):
         LOG.info(f"执行Tool: {action}中...")
 
         return action, action_input
+
+    def _extract_tool_calls(self, text: str) -> Optional[List[Tuple[str, str]]]:
+        """Every Action / Action Input pair of the LLM output, in order."""
+        if FINAL_ANSWER_ACTION in text:
+            return [self._extract_tool_and_input(text)]
+        regex = r"Action: (.*?)[\n]*Action Input: (.*?)(?=\n\s*Action: |\Z)"
+        tool_calls = [(str(match[1]).strip(), str(match[2]).strip())
+                      for match in re.finditer(regex, text, re.DOTALL)]
+        if not tool_calls:
+            return None
+        LOG.info(f"执行Tool: {', '.join(call[0] for call in tool_calls)}中...")
+        return tool_calls
@@ -8,6 +8,7 @@ Action: the action to take, should be one of [{tool_names}]
 Action Input: the input to the action
 Observation: the result of the action
 ... (this Thought/Action/Action Input/Observation can repeat N times)
+(several Action/Action Input pairs may follow one Thought when their inputs don't depend on each other, they run at the same time)
 Thought: I now know the final answer
 Final Answer: the final answer to the original input question in chinese"""
 SUFFIX = """Begin!
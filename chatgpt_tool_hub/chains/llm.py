@@ -5,6 +5,7 @@ from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
 
 from pydantic import BaseModel
 
+from ..common.deadline import check_deadline
 from ..common.input import get_colored_text
 from ..common.schema import BaseLanguageModel, LLMResult, PromptValue
 from ..prompts.base import BasePromptTemplate
@@ -58,11 +59,14 @@ class LLMChain(Chain, BaseModel):
 
     def generate(self, input_list: List[Dict[str, Any]]) -> LLMResult:
         """Generate LLM result from inputs."""
+        # no llm call once the request is out of time
+        check_deadline()
         prompts, stop = self.prep_prompts(input_list)
         return self.llm.generate_prompt(prompts, stop)
 
     async def agenerate(self, input_list: List[Dict[str, Any]]) -> LLMResult:
         """Generate LLM result from inputs."""
+        check_deadline()
         prompts, stop = await self.aprep_prompts(input_list)
         return await self.llm.agenerate_prompt(prompts, stop)
 
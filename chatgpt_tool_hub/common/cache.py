@@ -1,8 +1,15 @@
 """Beta Feature: base interface for cache."""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
 from abc import ABC, abstractmethod
+from collections import OrderedDict
 from typing import Any, Dict, List, Optional, Tuple
 
-from .schema import Generation
+from .schema import ChatGeneration, Generation, _message_from_dict, _message_to_dict
 
 RETURN_VAL_TYPE = List[Generation]
 
@@ -32,4 +39,335 @@ class InMemoryCache(BaseCache):
 
     def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
         """Update cache based on prompt and llm_string."""
-        self._cache[(prompt, llm_string)] = return_val
\ No newline at end of file
+        self._cache[(prompt, llm_string)] = return_val
+
+
+def _dumps_generations(generations: RETURN_VAL_TYPE) -> str:
+    items = []
+    for gen in generations:
+        item: Dict[str, Any] = {"text": gen.text, "generation_info": gen.generation_info}
+        if isinstance(gen, ChatGeneration):
+            item["message"] = _message_to_dict(gen.message)
+        items.append(item)
+    return json.dumps(items, ensure_ascii=False)
+
+
+def _loads_generations(value: str) -> RETURN_VAL_TYPE:
+    generations: RETURN_VAL_TYPE = []
+    for item in json.loads(value):
+        if "message" in item:
+            generations.append(ChatGeneration(message=_message_from_dict(item["message"]),
+                                              generation_info=item.get("generation_info")))
+        else:
+            generations.append(Generation(text=item["text"], generation_info=item.get("generation_info")))
+    return generations
+
+
+class SQLiteCache(BaseCache):
+    """Cache that persists generations in a SQLite database.
+
+    Keys are sha256 hashes of (prompt, llm_string), so long prompts don't bloat the index.
+    Entries older than `ttl` seconds are treated as missing, and once the table holds more
+    than `max_size` rows the least recently used ones are evicted.
+
+    Example:
+        .. code-block:: python
+
+            from chatgpt_tool_hub import models
+            from chatgpt_tool_hub.common.cache import SQLiteCache
+            models.llm_cache = SQLiteCache(database_path=".llm_cache.db", ttl=86400)
+    """
+
+    # seconds between two sweeps of expired entries
+    SWEEP_INTERVAL = 60
+
+    def __init__(self, database_path: str = ".llm_cache.db",
+                 max_size: int = 10000, ttl: Optional[float] = None) -> None:
+        """Initialize by opening (or creating) the database at `database_path`.
+
+        Args:
+            database_path: sqlite file path, ":memory:" is allowed.
+            max_size: max number of entries to keep, 0 or None means unbounded.
+            ttl: seconds an entry stays valid, 0 or None means it never expires.
+        """
+        self.database_path = database_path
+        self.max_size = max_size or 0
+        self.ttl = ttl or 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        directory = os.path.dirname(os.path.abspath(database_path))
+        if database_path != ":memory:" and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(database_path, check_same_thread=False, isolation_level=None)
+        if database_path != ":memory:":
+            self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache ("
+            "  key TEXT PRIMARY KEY,"
+            "  value TEXT NOT NULL,"
+            "  created_at REAL NOT NULL,"
+            "  accessed_at REAL NOT NULL"
+            ")"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_accessed_at ON llm_cache (accessed_at)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_created_at ON llm_cache (created_at)")
+        self._last_sweep = 0.0
+
+    @staticmethod
+    def _hash_key(prompt: str, llm_string: str) -> str:
+        return hashlib.sha256(f"{llm_string}\x00{prompt}".encode("utf-8")).hexdigest()
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        """Look up based on prompt and llm_string."""
+        key = self._hash_key(prompt, llm_string)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created_at FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            value, created_at = row
+            if self.ttl and now - created_at > self.ttl:
+                self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                self.evictions += 1
+                self.misses += 1
+                return None
+            try:
+                generations = _loads_generations(value)
+            except Exception:
+                # entry written by an incompatible version, drop it and treat it as missing
+                self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                self.evictions += 1
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE llm_cache SET accessed_at = ? WHERE key = ?", (now, key))
+            self.hits += 1
+        return generations
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        """Update cache based on prompt and llm_string."""
+        key = self._hash_key(prompt, llm_string)
+        value = _dumps_generations(return_val)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, value, now, now),
+            )
+            self._evict()
+
+    def _evict(self) -> None:
+        """Drop expired entries first, then the least recently used ones. Caller holds the lock."""
+        now = time.time()
+        # lookups already skip expired entries, sweeping them out can wait a while
+        if self.ttl and now - self._last_sweep >= min(self.ttl, self.SWEEP_INTERVAL):
+            cursor = self._conn.execute("DELETE FROM llm_cache WHERE created_at < ?", (now - self.ttl,))
+            self.evictions += max(cursor.rowcount, 0)
+            self._last_sweep = now
+        if not self.max_size:
+            return
+        (size,) = self._conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()
+        if size <= self.max_size:
+            return
+        cursor = self._conn.execute(
+            "DELETE FROM llm_cache WHERE key IN "
+            "(SELECT key FROM llm_cache ORDER BY accessed_at ASC LIMIT ?)",
+            (size - self.max_size,),
+        )
+        self.evictions += max(cursor.rowcount, 0)
+
+    def clear(self) -> None:
+        """Remove every entry."""
+        with self._lock:
+            self._conn.execute("DELETE FROM llm_cache")
+
+    def __len__(self) -> int:
+        with self._lock:
+            (size,) = self._conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()
+        return size
+
+    def stats(self) -> Dict[str, int]:
+        """Return hit/miss/eviction counters."""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "size": len(self),
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class BaseObservationCache(ABC):
+    """Base interface for caches of tool observations.
+
+    Entries are keyed by a tool namespace (its name, version and relevant settings)
+    and the normalized tool input, and expire after the ttl given when stored.
+    """
+
+    def __init__(self) -> None:
+        self._stats_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self._by_tool: Dict[str, Dict[str, int]] = {}
+
+    @abstractmethod
+    def lookup(self, namespace: str, tool_input: str) -> Optional[str]:
+        """Return the cached observation, None if missing or expired."""
+
+    @abstractmethod
+    def update(self, namespace: str, tool_input: str, observation: str, ttl: float) -> None:
+        """Store an observation valid for `ttl` seconds."""
+
+    @abstractmethod
+    def clear(self) -> None:
+        """Remove every entry."""
+
+    def _record(self, namespace: str, hit: bool) -> None:
+        with self._stats_lock:
+            counters = self._by_tool.setdefault(namespace, {"hits": 0, "misses": 0})
+            if hit:
+                self.hits += 1
+                counters["hits"] += 1
+            else:
+                self.misses += 1
+                counters["misses"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters, in total and per tool namespace."""
+        with self._stats_lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "by_tool": {namespace: dict(counters) for namespace, counters in self._by_tool.items()},
+            }
+
+
+class InMemoryObservationCache(BaseObservationCache):
+    """LRU of tool observations kept in memory."""
+
+    def __init__(self, max_size: int = 1024) -> None:
+        super().__init__()
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._data: "OrderedDict[Tuple[str, str], Tuple[str, float]]" = OrderedDict()
+
+    def lookup(self, namespace: str, tool_input: str) -> Optional[str]:
+        key = (namespace, tool_input)
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[1] < time.monotonic():
+                del self._data[key]
+                entry = None
+            if entry is not None:
+                self._data.move_to_end(key)
+        self._record(namespace, entry is not None)
+        return None if entry is None else entry[0]
+
+    def update(self, namespace: str, tool_input: str, observation: str, ttl: float) -> None:
+        key = (namespace, tool_input)
+        with self._lock:
+            self._data[key] = (observation, time.monotonic() + ttl)
+            self._data.move_to_end(key)
+            while self.max_size and len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class SQLiteObservationCache(BaseObservationCache):
+    """Tool observations persisted in a SQLite database, shared across processes and restarts."""
+
+    def __init__(self, database_path: str = ".tool_cache.db", max_size: int = 10000) -> None:
+        super().__init__()
+        self.database_path = database_path
+        self.max_size = max_size or 0
+
+        directory = os.path.dirname(os.path.abspath(database_path))
+        if database_path != ":memory:" and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(database_path, check_same_thread=False, isolation_level=None)
+        if database_path != ":memory:":
+            self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS tool_cache ("
+            "  key TEXT PRIMARY KEY,"
+            "  value TEXT NOT NULL,"
+            "  expires_at REAL NOT NULL,"
+            "  accessed_at REAL NOT NULL"
+            ")"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_tool_cache_accessed_at ON tool_cache (accessed_at)")
+
+    @staticmethod
+    def _hash_key(namespace: str, tool_input: str) -> str:
+        return hashlib.sha256(f"{namespace}\x00{tool_input}".encode("utf-8")).hexdigest()
+
+    def lookup(self, namespace: str, tool_input: str) -> Optional[str]:
+        key = self._hash_key(namespace, tool_input)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM tool_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and row[1] < now:
+                self._conn.execute("DELETE FROM tool_cache WHERE key = ?", (key,))
+                row = None
+            if row is not None:
+                self._conn.execute("UPDATE tool_cache SET accessed_at = ? WHERE key = ?", (now, key))
+        self._record(namespace, row is not None)
+        return None if row is None else row[0]
+
+    def update(self, namespace: str, tool_input: str, observation: str, ttl: float) -> None:
+        key = self._hash_key(namespace, tool_input)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO tool_cache (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, observation, now + ttl, now),
+            )
+            self._evict(now)
+
+    def _evict(self, now: float) -> None:
+        """Drop expired entries first, then the least recently used ones. Caller holds the lock."""
+        self._conn.execute("DELETE FROM tool_cache WHERE expires_at < ?", (now,))
+        if not self.max_size:
+            return
+        (size,) = self._conn.execute("SELECT COUNT(*) FROM tool_cache").fetchone()
+        if size > self.max_size:
+            self._conn.execute(
+                "DELETE FROM tool_cache WHERE key IN "
+                "(SELECT key FROM tool_cache ORDER BY accessed_at ASC LIMIT ?)",
+                (size - self.max_size,),
+            )
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM tool_cache")
+
+    def __len__(self) -> int:
+        with self._lock:
+            (size,) = self._conn.execute("SELECT COUNT(*) FROM tool_cache").fetchone()
+        return size
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
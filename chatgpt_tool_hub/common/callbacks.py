@@ -83,6 +83,9 @@ class BaseCallbackHandler(ABC):
     ) -> Any:
         """Run when tool errors."""
 
+    def on_tool_cache(self, name: str, input_str: str, hit: bool, **kwargs: Any) -> Any:
+        """Run when a cacheable tool looked its observation up in the cache."""
+
     @abstractmethod
     def on_text(self, text: str, **kwargs: Any) -> Any:
         """Run on arbitrary text."""
@@ -235,6 +238,14 @@ class CallbackManager(BaseCallbackManager):
             if not handler.ignore_bot and (verbose or handler.always_verbose):
                 handler.on_tool_error(error)
 
+    def on_tool_cache(
+        self, name: str, input_str: str, hit: bool, verbose: bool = False, **kwargs: Any
+    ) -> None:
+        """Run when a cacheable tool looked its observation up in the cache."""
+        for handler in self.handlers:
+            if not handler.ignore_bot and (verbose or handler.always_verbose):
+                handler.on_tool_cache(name, input_str, hit, **kwargs)
+
     def on_text(self, text: str, verbose: bool = False, **kwargs: Any) -> None:
         """Run on additional input from  chains and bots."""
         for handler in self.handlers:
@@ -307,6 +318,9 @@ class AsyncCallbackHandler(BaseCallbackHandler):
     ) -> None:
         """Run when tool errors."""
 
+    async def on_tool_cache(self, name: str, input_str: str, hit: bool, **kwargs: Any) -> None:
+        """Run when a cacheable tool looked its observation up in the cache."""
+
     async def on_text(self, text: str, **kwargs: Any) -> None:
         """Run on arbitrary text."""
 
@@ -498,6 +512,20 @@ class AsyncCallbackManager(BaseCallbackManager):
                         functools.partial(handler.on_tool_error, error, **kwargs),
                     )
 
+    async def on_tool_cache(
+        self, name: str, input_str: str, hit: bool, verbose: bool = False, **kwargs: Any
+    ) -> None:
+        """Run when a cacheable tool looked its observation up in the cache."""
+        for handler in self.handlers:
+            if not handler.ignore_bot and (verbose or handler.always_verbose):
+                if asyncio.iscoroutinefunction(handler.on_tool_cache):
+                    await handler.on_tool_cache(name, input_str, hit, **kwargs)
+                else:
+                    await asyncio.get_event_loop().run_in_executor(
+                        None,
+                        functools.partial(handler.on_tool_cache, name, input_str, hit, **kwargs),
+                    )
+
     async def on_text(self, text: str, verbose: bool = False, **kwargs: Any) -> None:
         """Run when text is printed."""
         for handler in self.handlers:
@@ -637,6 +665,11 @@ class SharedCallbackManager(Singleton, BaseCallbackManager):
         with self._lock:
             self._callback_manager.on_tool_error(error, **kwargs)
 
+    def on_tool_cache(self, name: str, input_str: str, hit: bool, **kwargs: Any) -> None:
+        """Run when a cacheable tool looked its observation up in the cache."""
+        with self._lock:
+            self._callback_manager.on_tool_cache(name, input_str, hit, **kwargs)
+
     def on_text(self, text: str, **kwargs: Any) -> None:
         """Run on arbitrary text."""
         with self._lock:
@@ -0,0 +1,128 @@
+"""Shared executors and helpers for running work concurrently."""
+import asyncio
+import contextvars
+import functools
+import os
+import threading
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Awaitable, Callable, Iterable, List, Optional, TypeVar
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+_executor: Optional[ThreadPoolExecutor] = None
+_tool_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+DEFAULT_MAX_WORKERS = min(32, (os.cpu_count() or 1) + 4) * 2
+# tools block for long (terminals, browsers, remote apis), they get their own pool
+# so they can't starve the short llm / io work of the shared one
+TOOL_MAX_WORKERS = 16
+
+
+_worker_state = threading.local()
+
+
+def _mark_worker(pool: List[ThreadPoolExecutor]) -> None:
+    # runs first thing in every worker thread, the pool has been created by then
+    _worker_state.executor = pool[0]
+
+
+def _new_executor(max_workers: int, thread_name_prefix: str) -> ThreadPoolExecutor:
+    pool: List[ThreadPoolExecutor] = []
+    executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=thread_name_prefix,
+                                  initializer=_mark_worker, initargs=(pool,))
+    pool.append(executor)
+    return executor
+
+
+def in_worker_of(executor: Optional[ThreadPoolExecutor]) -> bool:
+    """Whether the calling thread is a worker of `executor`.
+
+    A worker that submits to its own bounded pool and then waits can deadlock
+    once every worker does the same, such work has to run inline instead.
+    """
+    return executor is not None and getattr(_worker_state, "executor", None) is executor
+
+
+def get_shared_executor() -> ThreadPoolExecutor:
+    """Return the process-wide thread pool, creating it on first use."""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = _new_executor(DEFAULT_MAX_WORKERS, "tool-hub")
+    return _executor
+
+
+def get_tool_executor() -> ThreadPoolExecutor:
+    """Return the process-wide thread pool sync-only tools run on."""
+    global _tool_executor
+    if _tool_executor is None:
+        with _executor_lock:
+            if _tool_executor is None:
+                _tool_executor = _new_executor(TOOL_MAX_WORKERS, "tool-hub-tool")
+    return _tool_executor
+
+
+def submit_with_context(executor: ThreadPoolExecutor, func: Callable[..., R], *args: Any, **kwargs: Any) -> Future:
+    """Submit `func` so that it runs inside a copy of the caller's contextvars."""
+    ctx = contextvars.copy_context()
+    return executor.submit(ctx.run, func, *args, **kwargs)
+
+
+async def run_in_executor(
+    func: Callable[..., R], *args: Any, executor: Optional[ThreadPoolExecutor] = None, **kwargs: Any
+) -> R:
+    """Await `func(*args, **kwargs)` run on `executor` (the shared pool by default) with the caller's contextvars."""
+    ctx = contextvars.copy_context()
+    call = functools.partial(ctx.run, func, *args, **kwargs)
+    return await asyncio.get_running_loop().run_in_executor(executor or get_shared_executor(), call)
+
+
+def map_with_concurrency(
+    func: Callable[[T], R],
+    items: Iterable[T],
+    max_concurrency: int = 4,
+    executor: Optional[ThreadPoolExecutor] = None,
+) -> List[R]:
+    """Apply `func` to every item with at most `max_concurrency` calls in flight.
+
+    Results keep the order of `items`. The first exception cancels work that
+    has not started yet and is re-raised. Called from a worker of `executor`
+    itself, the items run one after another on the calling thread.
+    """
+    items = list(items)
+    executor = executor or get_shared_executor()
+    if len(items) <= 1 or max_concurrency <= 1 or in_worker_of(executor):
+        return [func(item) for item in items]
+
+    results: List[Any] = [None] * len(items)
+    pending = {}
+    next_idx = 0
+    try:
+        while next_idx < len(items) or pending:
+            while next_idx < len(items) and len(pending) < max_concurrency:
+                future = submit_with_context(executor, func, items[next_idx])
+                pending[future] = next_idx
+                next_idx += 1
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                results[pending.pop(future)] = future.result()
+    finally:
+        for future in pending:
+            future.cancel()
+    return results
+
+
+async def gather_with_concurrency(
+    aws: Iterable[Awaitable[R]], max_concurrency: int = 4
+) -> List[R]:
+    """`asyncio.gather` with at most `max_concurrency` awaitables running at once."""
+    semaphore = asyncio.Semaphore(max(max_concurrency, 1))
+
+    async def _run(aw: Awaitable[R]) -> R:
+        async with semaphore:
+            return await aw
+
+    return list(await asyncio.gather(*(_run(aw) for aw in aws)))
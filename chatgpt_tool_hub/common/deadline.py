@@ -0,0 +1,164 @@
+"""Request-wide deadlines, carried through the llm and tool calls of one run."""
+import asyncio
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Iterator, Optional, TypeVar
+
+R = TypeVar("R")
+
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when the deadline of the current request is reached or it was cancelled."""
+
+
+class Deadline:
+    """Point in time the current request must be answered by.
+
+    Nothing is interrupted by force: llm calls and tools read `remaining()` to
+    bound their own timeouts, and loops call `check()` between steps. `cancel()`
+    (from any thread) makes the deadline expire right away.
+    """
+
+    def __init__(self, timeout: float, parent: Optional["Deadline"] = None):
+        if parent is not None:
+            timeout = min(timeout, parent.remaining())
+        self.timeout = timeout
+        self.expires_at = time.monotonic() + timeout
+        self.parent = parent
+        self._cancelled = threading.Event()
+
+    def remaining(self) -> float:
+        """Seconds left, 0 once expired or cancelled."""
+        if self.cancelled:
+            return 0.0
+        return max(self.expires_at - time.monotonic(), 0.0)
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set() or (self.parent is not None and self.parent.cancelled)
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def cancel(self) -> None:
+        self._cancelled.set()
+
+    def check(self) -> None:
+        """Raise DeadlineExceeded if there is no time left."""
+        if self.cancelled:
+            raise DeadlineExceeded("request cancelled")
+        if self.expired:
+            raise DeadlineExceeded(f"request deadline of {self.timeout:.1f}s exceeded")
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}(timeout={self.timeout:.1f}, remaining={self.remaining():.1f})"
+
+
+_current_deadline: contextvars.ContextVar[Optional[Deadline]] = contextvars.ContextVar(
+    "tool_hub_deadline", default=None
+)
+
+
+def get_deadline() -> Optional[Deadline]:
+    return _current_deadline.get()
+
+
+@contextmanager
+def deadline(timeout: Optional[float]) -> Iterator[Optional[Deadline]]:
+    """Run the block under a deadline `timeout` seconds from now.
+
+    A nested deadline never outlives the enclosing one. A falsy `timeout` sets
+    no new deadline and yields the current one, if any.
+    """
+    current = _current_deadline.get()
+    if not timeout or timeout <= 0:
+        yield current
+        return
+    token = _current_deadline.set(Deadline(float(timeout), parent=current))
+    try:
+        yield _current_deadline.get()
+    finally:
+        _current_deadline.reset(token)
+
+
+def remaining_time() -> Optional[float]:
+    """Seconds left before the current deadline, None without one."""
+    current = _current_deadline.get()
+    return None if current is None else current.remaining()
+
+
+def deadline_expired() -> bool:
+    """Whether the current request ran out of time, False without a deadline."""
+    current = _current_deadline.get()
+    return current is not None and current.expired
+
+
+def check_deadline() -> None:
+    """Raise DeadlineExceeded if the current request ran out of time."""
+    current = _current_deadline.get()
+    if current is not None:
+        current.check()
+
+
+def bound_timeout(timeout: Optional[float]) -> Optional[float]:
+    """`timeout` shortened to the time left, raises DeadlineExceeded if none is left."""
+    current = _current_deadline.get()
+    if current is None:
+        return timeout
+    current.check()
+    remaining = current.remaining()
+    return remaining if not timeout else min(timeout, remaining)
+
+
+def call_with_deadline(func: Callable[..., R], *args: Any, **kwargs: Any) -> R:
+    """Call `func`, giving up with DeadlineExceeded once the current deadline passes.
+
+    Without a deadline `func` runs in the caller's thread. Otherwise it runs in a
+    thread of its own that is left behind on timeout: Python threads can't be
+    killed, the result is dropped and the expired deadline tells `func` to wrap up.
+    """
+    current = _current_deadline.get()
+    if current is None:
+        return func(*args, **kwargs)
+    current.check()
+
+    outcome = {}
+    ctx = contextvars.copy_context()
+
+    def _target() -> None:
+        try:
+            outcome["result"] = ctx.run(func, *args, **kwargs)
+        except BaseException as e:
+            outcome["error"] = e
+
+    thread = threading.Thread(target=_target, name="tool-hub-deadline", daemon=True)
+    thread.start()
+    thread.join(current.remaining())
+    if thread.is_alive():
+        current.check()
+        raise DeadlineExceeded(f"{getattr(func, '__name__', func)} still running at the deadline")
+    if "error" in outcome:
+        raise outcome["error"]
+    return outcome["result"]
+
+
+async def await_with_deadline(aw: Awaitable[R]) -> R:
+    """Await `aw`, cancelling it with DeadlineExceeded once the current deadline passes."""
+    current = _current_deadline.get()
+    if current is None:
+        return await aw
+    try:
+        current.check()
+        return await asyncio.wait_for(aw, current.remaining())
+    except asyncio.TimeoutError:
+        if not current.expired:
+            # a timeout of `aw` itself
+            raise
+        raise DeadlineExceeded(f"request deadline of {current.timeout:.1f}s exceeded")
+    finally:
+        if asyncio.iscoroutine(aw):
+            # never awaited when the deadline had already passed
+            aw.close()
@@ -0,0 +1,356 @@
+"""In-process counters and histograms, exposed in the Prometheus text format."""
+import itertools
+import math
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+from .callbacks import BaseCallbackHandler, BaseCallbackManager, get_callback_manager
+from .log import LOG
+from .schema import BotAction, BotFinish, LLMResult
+
+# writers of a metric are spread over this many shards, each behind its own lock, so
+# threads recording at the same time seldom wait on each other
+SHARD_NUM = 16
+
+_thread_shard = threading.local()
+_next_shard = itertools.count()
+
+
+def _shard_index() -> int:
+    """The shard of the calling thread, handed out round robin on its first record."""
+    try:
+        return _thread_shard.index
+    except AttributeError:
+        _thread_shard.index = next(_next_shard) % SHARD_NUM
+        return _thread_shard.index
+
+
+LabelValues = Tuple[str, ...]
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._locks = [threading.Lock() for _ in range(SHARD_NUM)]
+        self._shards: List[Dict[LabelValues, Any]] = [{} for _ in range(SHARD_NUM)]
+
+    def _key(self, labels: Dict[str, Any]) -> LabelValues:
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _format_labels(self, key: LabelValues, extra: Optional[Tuple[str, str]] = None) -> str:
+        pairs = list(zip(self.labelnames, key))
+        if extra is not None:
+            pairs.append(extra)
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+    def clear(self) -> None:
+        for lock, shard in zip(self._locks, self._shards):
+            with lock:
+                shard.clear()
+
+    def expose(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """A value that only goes up, e.g. requests or tokens."""
+
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels: Any) -> None:
+        key = self._key(labels)
+        index = _shard_index()
+        with self._locks[index]:
+            shard = self._shards[index]
+            shard[key] = shard.get(key, 0) + amount
+
+    def collect(self) -> Dict[LabelValues, float]:
+        totals: Dict[LabelValues, float] = {}
+        for lock, shard in zip(self._locks, self._shards):
+            with lock:
+                for key, value in shard.items():
+                    totals[key] = totals.get(key, 0) + value
+        return totals
+
+    def get(self, **labels: Any) -> float:
+        return self.collect().get(self._key(labels), 0)
+
+    def expose(self) -> List[str]:
+        return [f"{self.name}{self._format_labels(key)} {_format_value(value)}"
+                for key, value in sorted(self.collect().items())]
+
+
+# seconds, from a cached tool observation to a slow llm answer
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+class Histogram(_Metric):
+    """Observations counted into buckets, e.g. latencies."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        # per bucket (the last one is +Inf) counts, then sum and count
+        position = bisect_left(self.buckets, value)
+        index = _shard_index()
+        with self._locks[index]:
+            shard = self._shards[index]
+            entry = shard.get(key)
+            if entry is None:
+                entry = shard[key] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            entry[position] += 1
+            entry[-2] += value
+            entry[-1] += 1
+
+    @contextmanager
+    def time(self, **labels: Any) -> Iterator[None]:
+        """Observe the seconds the block takes, also when it raises."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def collect(self) -> Dict[LabelValues, List[float]]:
+        totals: Dict[LabelValues, List[float]] = {}
+        for lock, shard in zip(self._locks, self._shards):
+            with lock:
+                for key, entry in shard.items():
+                    total = totals.get(key)
+                    if total is None:
+                        totals[key] = list(entry)
+                    else:
+                        for i, value in enumerate(entry):
+                            total[i] += value
+        return totals
+
+    def expose(self) -> List[str]:
+        lines = []
+        for key, entry in sorted(self.collect().items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), entry):
+                cumulative += count
+                le = "+Inf" if bound == math.inf else _format_value(bound)
+                lines.append(f"{self.name}_bucket{self._format_labels(key, ('le', le))} {cumulative}")
+            lines.append(f"{self.name}_sum{self._format_labels(key)} {_format_value(entry[-2])}")
+            lines.append(f"{self.name}_count{self._format_labels(key)} {entry[-1]}")
+        return lines
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: Union[int, float]) -> str:
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class MetricsRegistry:
+    """Metrics by name. Asking twice for a metric returns the one registered first."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics: Dict[str, _Metric] = {}
+
+    def _register(self, metric: _Metric) -> Any:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                if existing.kind != metric.kind or existing.labelnames != metric.labelnames:
+                    raise ValueError(f"metric {metric.name} already registered as another {existing.kind}")
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def get(self, name: str) -> Optional[_Metric]:
+        return self._metrics.get(name)
+
+    def clear(self) -> None:
+        """Zero every metric, e.g. between benchmark runs."""
+        for metric in list(self._metrics.values()):
+            metric.clear()
+
+    def render(self) -> str:
+        """Every metric in the Prometheus text exposition format (version 0.0.4)."""
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda m: m.name)
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.expose())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+
+def render_prometheus() -> str:
+    """Text of the process-wide registry, what a Prometheus scrape of /metrics returns."""
+    return registry.render()
+
+
+# model layer
+LLM_REQUEST_SECONDS = registry.histogram(
+    "tool_hub_llm_request_seconds", "Latency of llm generations, retries included.", ["model"])
+LLM_REQUESTS = registry.counter(
+    "tool_hub_llm_requests_total", "Llm generations by outcome.", ["model", "status"])
+LLM_TOKENS = registry.counter(
+    "tool_hub_llm_tokens_total", "Tokens the llm api reported, direction is prompt or completion.",
+    ["model", "direction"])
+LLM_RETRIES = registry.counter(
+    "tool_hub_llm_retries_total", "Retried llm api calls by error kind.", ["kind"])
+LLM_CACHE_LOOKUPS = registry.counter(
+    "tool_hub_llm_cache_lookups_total", "Prompts looked up in the llm cache.", ["result"])
+# tool layer
+TOOL_SECONDS = registry.histogram(
+    "tool_hub_tool_seconds", "Latency of tool runs, cached answers included.", ["tool"])
+TOOL_CALLS = registry.counter(
+    "tool_hub_tool_calls_total", "Tool runs by outcome.", ["tool", "status"])
+TOOL_CACHE_LOOKUPS = registry.counter(
+    "tool_hub_tool_cache_lookups_total", "Observation cache lookups of cacheable tools.", ["tool", "result"])
+# engine and memory
+ENGINE_ITERATIONS = registry.histogram(
+    "tool_hub_engine_iterations", "Bot steps (llm plans) per ToolEngine run.", [],
+    buckets=(1, 2, 3, 4, 5, 6, 8, 10, 15, 20))
+SUMMARY_ROUNDS = registry.histogram(
+    "tool_hub_summary_rounds", "Map-reduce rounds per summary.", [], buckets=(0, 1, 2, 3, 4))
+# callback system
+BOT_ACTIONS = registry.counter(
+    "tool_hub_bot_actions_total", "Tools the bot asked for.", ["tool"])
+CHAIN_ERRORS = registry.counter(
+    "tool_hub_chain_errors_total", "Chains that raised, by exception class.", ["error"])
+
+
+class MetricsCallbackHandler(BaseCallbackHandler):
+    """Count what only the callbacks see: bot actions and chain errors."""
+
+    @property
+    def always_verbose(self) -> bool:
+        return True
+
+    @property
+    def ignore_llm(self) -> bool:
+        return True
+
+    def on_llm_start(self, serialized: Dict[str, Any], prompts: List[str], **kwargs: Any) -> None:
+        pass
+
+    def on_llm_new_token(self, token: str, **kwargs: Any) -> None:
+        pass
+
+    def on_llm_end(self, response: LLMResult, **kwargs: Any) -> None:
+        pass
+
+    def on_llm_error(self, error: Union[Exception, KeyboardInterrupt], **kwargs: Any) -> None:
+        pass
+
+    def on_chain_start(self, serialized: Dict[str, Any], inputs: Dict[str, Any], **kwargs: Any) -> None:
+        pass
+
+    def on_chain_end(self, outputs: Dict[str, Any], **kwargs: Any) -> None:
+        pass
+
+    def on_chain_error(self, error: Union[Exception, KeyboardInterrupt], **kwargs: Any) -> None:
+        CHAIN_ERRORS.inc(error=error.__class__.__name__)
+
+    def on_tool_start(self, serialized: Dict[str, Any], input_str: str, **kwargs: Any) -> None:
+        pass
+
+    def on_tool_end(self, output: str, **kwargs: Any) -> None:
+        pass
+
+    def on_tool_error(self, error: Union[Exception, KeyboardInterrupt], **kwargs: Any) -> None:
+        pass
+
+    def on_text(self, text: str, **kwargs: Any) -> None:
+        pass
+
+    def on_bot_action(self, action: BotAction, **kwargs: Any) -> None:
+        BOT_ACTIONS.inc(tool=action.tool)
+
+    def on_bot_finish(self, finish: BotFinish, **kwargs: Any) -> None:
+        pass
+
+
+_metrics_handler = MetricsCallbackHandler()
+_installed_managers = set()
+_servers: Dict[Tuple[str, int], ThreadingHTTPServer] = {}
+_servers_lock = threading.Lock()
+
+
+def install_metrics_handler(callback_manager: Optional[BaseCallbackManager] = None) -> None:
+    """Register the metrics callback handler on `callback_manager` (the shared one by default), once."""
+    callback_manager = callback_manager or get_callback_manager()
+    with _servers_lock:
+        if id(callback_manager) in _installed_managers:
+            return
+        callback_manager.add_handler(_metrics_handler)
+        _installed_managers.add(id(callback_manager))
+
+
+class _MetricsRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self) -> None:
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        LOG.debug(f"[metrics] {self.address_string()} {format % args}")
+
+
+def start_metrics_server(port: int = 9464, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """Serve /metrics from a daemon thread; calling it again for the same address returns the running server."""
+    with _servers_lock:
+        server = _servers.get((host, port))
+        if server is not None:
+            return server
+        server = ThreadingHTTPServer((host, port), _MetricsRequestHandler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name="tool-hub-metrics", daemon=True).start()
+        _servers[(host, port)] = server
+    LOG.info(f"[metrics] serving prometheus metrics on http://{host}:{server.server_port}/metrics")
+    return server
+
+
+if __name__ == "__main__":
+    import timeit
+
+    bench = registry.counter("bench_total", "benchmark counter", ["tool"])
+    number = 200000
+    seconds = timeit.timeit(lambda: bench.inc(tool="python"), number=number)
+    print(f"Counter.inc: {seconds / number * 1e9:.0f} ns")
+    print(render_prometheus())
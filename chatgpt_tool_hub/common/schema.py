@@ -42,6 +42,17 @@ class BotFinish(NamedTuple):
     log: str
 
 
+class StreamEvent(NamedTuple):
+    """Progress of a streamed engine run.
+
+    type is one of step_start, tool_start, tool_end, token and final.
+    """
+
+    type: str
+    data: Any
+    step: int
+
+
 class Generation(BaseModel):
     """Output of a single generation."""
 
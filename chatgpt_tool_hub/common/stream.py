@@ -0,0 +1,334 @@
+"""Stream the progress of a tool engine run as structured events."""
+import asyncio
+import contextvars
+import queue
+import re
+import threading
+from contextlib import contextmanager
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Union
+
+from .callbacks import BaseCallbackHandler, BaseCallbackManager
+from .schema import LLMResult, StreamEvent
+
+STEP_START = "step_start"
+TOOL_START = "tool_start"
+TOOL_END = "tool_end"
+TOKEN = "token"
+FINAL = "final"
+
+
+class StreamClosed(Exception):
+    """Raised inside the run once the consumer stopped reading the stream."""
+
+
+class FinalAnswerStreamParser:
+    """Pick the final-answer text out of the tokens of one llm completion.
+
+    `feed` receives raw tokens and returns the part of the final answer they
+    complete, "" if none. This base parser never recognizes an answer.
+    """
+
+    def feed(self, token: str) -> str:
+        return ""
+
+    def reset(self) -> None:
+        pass
+
+
+class PrefixFinalAnswerParser(FinalAnswerStreamParser):
+    """Everything after `prefix` (e.g. "Final Answer:") is the answer."""
+
+    def __init__(self, prefix: str):
+        self.prefix = prefix
+        self.reset()
+
+    def reset(self) -> None:
+        self._buffer = ""
+        self._found = False
+        self._started = False
+
+    def feed(self, token: str) -> str:
+        if self._found:
+            text = token
+        else:
+            self._buffer += token
+            idx = self._buffer.find(self.prefix)
+            if idx < 0:
+                return ""
+            self._found = True
+            text = self._buffer[idx + len(self.prefix):]
+        if not self._started:
+            text = text.lstrip()
+            self._started = bool(text)
+        return text
+
+
+_JSON_ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+
+
+class JsonFieldFinalAnswerParser(FinalAnswerStreamParser):
+    """Stream the string value of `value_key` once `name_key` equals `name`.
+
+    Meant for replies like {"tool": {"name": "answer-user", "input": "..."}},
+    decoding JSON escapes on the fly. If the value comes before the name the
+    answer can't be recognized early and nothing is streamed.
+    """
+
+    def __init__(self, name: str, name_key: str = "name", value_key: str = "input"):
+        self._name_re = re.compile(rf'"{re.escape(name_key)}"\s*:\s*"{re.escape(name)}"')
+        self._value_re = re.compile(rf'"{re.escape(value_key)}"\s*:\s*"')
+        self.reset()
+
+    def reset(self) -> None:
+        self._buffer = ""
+        self._search_from = -1  # end of the name match, -1 until found
+        self._pos = -1          # cursor inside the value string, -1 until found
+        self._done = False
+
+    def feed(self, token: str) -> str:
+        if self._done:
+            return ""
+        self._buffer += token
+        if self._search_from < 0:
+            match = self._name_re.search(self._buffer)
+            if not match:
+                return ""
+            self._search_from = match.end()
+        if self._pos < 0:
+            match = self._value_re.search(self._buffer, self._search_from)
+            if not match:
+                return ""
+            self._pos = match.end()
+        return self._decode()
+
+    def _decode(self) -> str:
+        out: List[str] = []
+        buf, pos = self._buffer, self._pos
+        while pos < len(buf):
+            char = buf[pos]
+            if char == '"':
+                self._done = True
+                break
+            if char != "\\":
+                out.append(char)
+                pos += 1
+                continue
+            # escape sequence, wait for the rest of it if the token split it
+            if pos + 1 >= len(buf):
+                break
+            code = buf[pos + 1]
+            if code == "u":
+                if pos + 6 > len(buf):
+                    break
+                try:
+                    out.append(chr(int(buf[pos + 2:pos + 6], 16)))
+                except ValueError:
+                    out.append(buf[pos:pos + 6])
+                pos += 6
+            else:
+                out.append(_JSON_ESCAPES.get(code, code))
+                pos += 2
+        self._pos = pos
+        return "".join(out)
+
+
+class StreamContext:
+    """State of one streamed run, bound to the run through a contextvar."""
+
+    def __init__(self, emit: Callable[[StreamEvent], None]):
+        self._emit = emit
+        self.step = 0
+        self.parser: FinalAnswerStreamParser = FinalAnswerStreamParser()
+        # only tokens of the bot's own planning calls may be part of the answer,
+        # not those of llm calls made by tools
+        self.listening = False
+        self.streamed_text = ""
+        self.closed = False
+
+    def emit(self, event_type: str, data: Any) -> None:
+        if self.closed:
+            raise StreamClosed()
+        self._emit(StreamEvent(type=event_type, data=data, step=self.step))
+
+
+_stream_context: contextvars.ContextVar[Optional[StreamContext]] = contextvars.ContextVar(
+    "tool_hub_stream_context", default=None
+)
+
+
+def get_stream_context() -> Optional[StreamContext]:
+    return _stream_context.get()
+
+
+def streaming_requested() -> bool:
+    """Whether the current llm call should stream its tokens to a consumer."""
+    ctx = _stream_context.get()
+    return ctx is not None and ctx.listening
+
+
+def emit_stream_event(event_type: str, data: Any, step: Optional[int] = None) -> None:
+    """Emit an event to the current stream, a no-op outside of one."""
+    ctx = _stream_context.get()
+    if ctx is None:
+        return
+    if step is not None:
+        ctx.step = step
+    ctx.emit(event_type, data)
+
+
+@contextmanager
+def listen_for_final_answer(parser: FinalAnswerStreamParser) -> Iterator[None]:
+    """Stream final-answer tokens of the llm calls made inside this block."""
+    ctx = _stream_context.get()
+    if ctx is None:
+        yield
+        return
+    ctx.parser = parser
+    ctx.listening = True
+    try:
+        yield
+    finally:
+        ctx.listening = False
+
+
+def emit_final_answer(answer: str) -> None:
+    """Emit whatever part of `answer` was not streamed as tokens, then the final event."""
+    ctx = _stream_context.get()
+    if ctx is None:
+        return
+    answer = str(answer)
+    # the answer may differ from what was streamed (parse retries, fixed-up
+    # empty answers), send the missing tail or the whole answer if we can't
+    if not ctx.streamed_text:
+        ctx.emit(TOKEN, answer)
+    elif answer.startswith(ctx.streamed_text) and len(answer) > len(ctx.streamed_text):
+        ctx.emit(TOKEN, answer[len(ctx.streamed_text):])
+    ctx.emit(FINAL, answer)
+
+
+class StreamTokenHandler(BaseCallbackHandler):
+    """Forward final-answer tokens of the current stream, if any."""
+
+    @property
+    def always_verbose(self) -> bool:
+        return True
+
+    def on_llm_start(self, serialized: Dict[str, Any], prompts: List[str], **kwargs: Any) -> None:
+        ctx = _stream_context.get()
+        if ctx is not None and ctx.listening:
+            ctx.parser.reset()
+
+    def on_llm_new_token(self, token: str, **kwargs: Any) -> None:
+        ctx = _stream_context.get()
+        if ctx is None or not ctx.listening:
+            return
+        text = ctx.parser.feed(token)
+        if text:
+            ctx.streamed_text += text
+            ctx.emit(TOKEN, text)
+
+    def on_llm_end(self, response: LLMResult, **kwargs: Any) -> None:
+        pass
+
+    def on_llm_error(self, error: Union[Exception, KeyboardInterrupt], **kwargs: Any) -> None:
+        pass
+
+    def on_chain_start(self, serialized: Dict[str, Any], inputs: Dict[str, Any], **kwargs: Any) -> None:
+        pass
+
+    def on_chain_end(self, outputs: Dict[str, Any], **kwargs: Any) -> None:
+        pass
+
+    def on_chain_error(self, error: Union[Exception, KeyboardInterrupt], **kwargs: Any) -> None:
+        pass
+
+    def on_tool_start(self, serialized: Dict[str, Any], input_str: str, **kwargs: Any) -> None:
+        pass
+
+    def on_tool_end(self, output: str, **kwargs: Any) -> None:
+        pass
+
+    def on_tool_error(self, error: Union[Exception, KeyboardInterrupt], **kwargs: Any) -> None:
+        pass
+
+    def on_text(self, text: str, **kwargs: Any) -> None:
+        pass
+
+    def on_bot_action(self, action: Any, **kwargs: Any) -> None:
+        pass
+
+    def on_bot_finish(self, finish: Any, **kwargs: Any) -> None:
+        pass
+
+
+_stream_handler = StreamTokenHandler()
+_registered_managers = set()
+_registered_lock = threading.Lock()
+
+
+def ensure_stream_handler(callback_manager: BaseCallbackManager) -> None:
+    """Register the token handler on `callback_manager` once."""
+    with _registered_lock:
+        if id(callback_manager) in _registered_managers:
+            return
+        callback_manager.add_handler(_stream_handler)
+        _registered_managers.add(id(callback_manager))
+
+
+_DONE = object()
+
+
+def _start_run(run: Callable[[], Any], emit: Callable[[Any], None]) -> StreamContext:
+    """Run `run` in its own thread inside a fresh stream context."""
+    ctx = StreamContext(emit)
+
+    def _target() -> None:
+        _stream_context.set(ctx)
+        try:
+            run()
+            result = _DONE
+        except BaseException as e:
+            result = e
+        if not ctx.closed:
+            emit(result)
+
+    # a dedicated thread: a long agent loop must not hold a shared pool worker
+    # that the tools it calls may need themselves
+    thread = threading.Thread(target=contextvars.copy_context().run, args=(_target,),
+                              name="tool-hub-stream", daemon=True)
+    thread.start()
+    return ctx
+
+
+def stream_events(run: Callable[[], Any]) -> Iterator[StreamEvent]:
+    """Call `run` and yield the StreamEvents it emits as they happen."""
+    events: "queue.Queue[Any]" = queue.Queue()
+    ctx = _start_run(run, events.put)
+    try:
+        while True:
+            item = events.get()
+            if item is _DONE:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        # consumer went away early, stop the run at its next event
+        ctx.closed = True
+
+
+async def astream_events(run: Callable[[], Any]) -> AsyncIterator[StreamEvent]:
+    """Async version of `stream_events`, `run` still executes in a thread."""
+    loop = asyncio.get_running_loop()
+    events: "asyncio.Queue[Any]" = asyncio.Queue()
+    ctx = _start_run(run, lambda item: loop.call_soon_threadsafe(events.put_nowait, item))
+    try:
+        while True:
+            item = await events.get()
+            if item is _DONE:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        ctx.closed = True
@@ -140,16 +140,17 @@ class TextSplitter(ABC):
     ) -> TextSplitter:
         """Text splitter that uses tiktoken encoder to count length."""
         try:
-            import tiktoken
+            import tiktoken  # noqa: F401
         except ImportError:
             raise ValueError(
                 "Could not import tiktoken python package. "
                 "This is needed in order to calculate max_tokens_for_prompt. "
                 "Please it install it with `pip install tiktoken`."
             )
+        from ..models.tokenizer import get_encoding
 
-        # create a GPT-3 encoder instance
-        enc = tiktoken.get_encoding(encoding_name)
+        # the encoder instance is shared process-wide
+        enc = get_encoding(encoding_name)
 
         def _tiktoken_encoder(text: str, **kwargs: Any) -> int:
             return len(
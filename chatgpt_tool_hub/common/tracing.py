@@ -0,0 +1,336 @@
+"""Span based tracing of engine runs, exported as Chrome trace events or OTLP JSON."""
+import contextvars
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Deque, Dict, Iterator, List, Optional, Tuple, Union
+
+from .callbacks import BaseCallbackHandler
+from .schema import BotAction, BotFinish, LLMResult
+
+CHAIN = "chain"
+LLM = "llm"
+TOOL = "tool"
+INTERNAL = "internal"
+
+# the span callbacks and trace_span nest under, copied into worker threads with the rest of the context
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("tool_hub_span", default=None)
+_request_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("tool_hub_request_id", default=None)
+
+_HEX32 = re.compile(r"^[0-9a-f]{32}$")
+
+
+def get_request_id() -> Optional[str]:
+    """Id of the request being served in this context, None outside of one."""
+    return _request_id.get()
+
+
+@contextmanager
+def request_context(request_id: Optional[str] = None) -> Iterator[str]:
+    """Serve a request under `request_id` (a new one if None), which becomes the trace id of its spans."""
+    request_id = request_id or uuid.uuid4().hex
+    token = _request_id.set(request_id)
+    try:
+        yield request_id
+    finally:
+        _request_id.reset(token)
+
+
+def _trace_id(request_id: Optional[str]) -> str:
+    if request_id is None:
+        return uuid.uuid4().hex
+    if _HEX32.match(request_id):
+        return request_id
+    # OTLP wants 32 hex digits, derive them from any other request id
+    return hashlib.md5(request_id.encode("utf-8")).hexdigest()
+
+
+class Span:
+    """A timed operation of a trace. Times are unix epoch nanoseconds."""
+
+    __slots__ = ("tracer", "name", "kind", "trace_id", "span_id", "parent", "start_ns", "end_ns",
+                 "attributes", "events", "error", "thread_id", "thread_name")
+
+    def __init__(self, tracer: "TracingCallbackHandler", name: str, kind: str,
+                 parent: Optional["Span"], attributes: Dict[str, Any]):
+        self.tracer = tracer
+        self.name = name
+        self.kind = kind
+        self.parent = parent
+        self.trace_id = parent.trace_id if parent is not None else _trace_id(_request_id.get())
+        self.span_id = os.urandom(8).hex()
+        self.attributes = attributes
+        self.events: List[Tuple[int, str, Dict[str, Any]]] = []
+        self.error: Optional[str] = None
+        thread = threading.current_thread()
+        self.thread_id = thread.ident
+        self.thread_name = thread.name
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+
+    @property
+    def duration_ms(self) -> Optional[float]:
+        return None if self.end_ns is None else (self.end_ns - self.start_ns) / 1e6
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def add_event(self, name: str, **attributes: Any) -> None:
+        self.events.append((time.time_ns(), name, attributes))
+
+    def __repr__(self) -> str:
+        return f"Span({self.kind}:{self.name}, {self.duration_ms}ms)"
+
+
+class TracingCallbackHandler(BaseCallbackHandler):
+    """Record nested spans of chains, llm calls and tools, plus inner phases opened with `trace_span`.
+
+    Spans nest along contextvars, so work handed to other threads with a copy of
+    the context (tools, parallel llm calls) lands under the span that started it,
+    and a root span takes the request id of `request_context` as its trace id.
+    Nesting follows the callbacks of the (default) synchronous callback manager;
+    an AsyncCallbackManager runs sync handlers in an executor, where it is lost.
+
+    Example:
+        .. code-block:: python
+
+            tracer = TracingCallbackHandler()
+            get_callback_manager().add_handler(tracer)
+            app.ask("...")
+            tracer.export_chrome_trace("trace.json")  # open in chrome://tracing or ui.perfetto.dev
+            tracer.export_otlp_json("trace.otlp.json")
+    """
+
+    def __init__(self, max_spans: int = 100000, record_payloads: bool = False, payload_limit: int = 500):
+        """
+        Args:
+            max_spans: finished spans kept, the oldest are dropped beyond it.
+            record_payloads: also keep (truncated) tool inputs/outputs and the prompt of llm calls.
+            payload_limit: characters kept of each payload.
+        """
+        self.record_payloads = record_payloads
+        self.payload_limit = payload_limit
+        self._lock = threading.Lock()
+        self._finished: Deque[Span] = deque(maxlen=max_spans)
+
+    @property
+    def always_verbose(self) -> bool:
+        return True
+
+    @property
+    def spans(self) -> List[Span]:
+        """Finished spans, in the order they finished."""
+        with self._lock:
+            return list(self._finished)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._finished.clear()
+
+    # spans
+
+    def start_span(self, name: str, kind: str = INTERNAL, **attributes: Any) -> Span:
+        span = Span(self, name, kind, _current_span.get(), attributes)
+        _current_span.set(span)
+        return span
+
+    def end_span(self, span: Span, error: Optional[BaseException] = None, **attributes: Any) -> None:
+        span.end_ns = time.time_ns()
+        span.attributes.update(attributes)
+        if error is not None:
+            span.error = f"{error.__class__.__name__}: {error}"
+        with self._lock:
+            self._finished.append(span)
+        if _current_span.get() is span:
+            _current_span.set(span.parent)
+
+    @contextmanager
+    def span(self, name: str, kind: str = INTERNAL, **attributes: Any) -> Iterator[Span]:
+        span = self.start_span(name, kind, **attributes)
+        try:
+            yield span
+        except BaseException as e:
+            self.end_span(span, error=e)
+            raise
+        self.end_span(span)
+
+    def _open_span(self, kind: str) -> Optional[Span]:
+        """Innermost unfinished span of ours of this kind in the current context."""
+        span = _current_span.get()
+        while span is not None and (span.tracer is not self or span.kind != kind):
+            span = span.parent
+        return span
+
+    def _close(self, kind: str, error: Optional[BaseException] = None, **attributes: Any) -> None:
+        span = self._open_span(kind)
+        if span is None:
+            return
+        self.end_span(span, error=error, **attributes)
+        # spans left open inside it (a callback that never came) end with it
+        _current_span.set(span.parent)
+
+    def _payload(self, text: Any) -> str:
+        text = str(text)
+        return text if len(text) <= self.payload_limit else text[:self.payload_limit] + "..."
+
+    # callbacks
+
+    def on_llm_start(self, serialized: Dict[str, Any], prompts: List[str], **kwargs: Any) -> None:
+        attributes = {"llm.prompts": len(prompts), "llm.prompt_chars": sum(len(p) for p in prompts)}
+        if self.record_payloads and prompts:
+            attributes["llm.prompt"] = self._payload(prompts[-1])
+        self.start_span(serialized.get("name", "llm"), LLM, **attributes)
+
+    def on_llm_new_token(self, token: str, **kwargs: Any) -> None:
+        pass
+
+    def on_llm_end(self, response: LLMResult, **kwargs: Any) -> None:
+        attributes: Dict[str, Any] = {}
+        llm_output = response.llm_output or {}
+        usage = llm_output.get("token_usage") or {}
+        for key in ("prompt_tokens", "completion_tokens", "total_tokens"):
+            if key in usage:
+                attributes[f"llm.{key}"] = usage[key]
+        if llm_output.get("model_name"):
+            attributes["llm.model_name"] = llm_output["model_name"]
+        self._close(LLM, **attributes)
+
+    def on_llm_error(self, error: Union[Exception, KeyboardInterrupt], **kwargs: Any) -> None:
+        self._close(LLM, error=error)
+
+    def on_chain_start(self, serialized: Dict[str, Any], inputs: Dict[str, Any], **kwargs: Any) -> None:
+        self.start_span(serialized.get("name", "chain"), CHAIN, **{"chain.inputs": ",".join(inputs)})
+
+    def on_chain_end(self, outputs: Dict[str, Any], **kwargs: Any) -> None:
+        self._close(CHAIN)
+
+    def on_chain_error(self, error: Union[Exception, KeyboardInterrupt], **kwargs: Any) -> None:
+        self._close(CHAIN, error=error)
+
+    def on_tool_start(self, serialized: Dict[str, Any], input_str: str, **kwargs: Any) -> None:
+        attributes = {"tool.name": serialized.get("name", "tool")}
+        if self.record_payloads:
+            attributes["tool.input"] = self._payload(input_str)
+        self.start_span(f"tool:{attributes['tool.name']}", TOOL, **attributes)
+
+    def on_tool_end(self, output: str, **kwargs: Any) -> None:
+        attributes: Dict[str, Any] = {"tool.output_chars": len(str(output))}
+        if self.record_payloads:
+            attributes["tool.output"] = self._payload(output)
+        self._close(TOOL, **attributes)
+
+    def on_tool_error(self, error: Union[Exception, KeyboardInterrupt], **kwargs: Any) -> None:
+        self._close(TOOL, error=error)
+
+    def on_tool_cache(self, name: str, input_str: str, hit: bool, **kwargs: Any) -> None:
+        span = self._open_span(TOOL)
+        if span is not None:
+            span.set_attribute("tool.cache_hit", hit)
+
+    def on_text(self, text: str, **kwargs: Any) -> None:
+        pass
+
+    def on_bot_action(self, action: BotAction, **kwargs: Any) -> None:
+        span = _current_span.get()
+        if span is not None:
+            attributes = {"tool": action.tool}
+            if self.record_payloads:
+                attributes["tool_input"] = self._payload(action.tool_input)
+            span.add_event("bot_action", **attributes)
+
+    def on_bot_finish(self, finish: BotFinish, **kwargs: Any) -> None:
+        span = _current_span.get()
+        if span is not None:
+            span.add_event("bot_finish")
+
+    # export
+
+    def to_chrome_trace(self) -> Dict[str, Any]:
+        """The finished spans in Chrome's trace_event format."""
+        pid = os.getpid()
+        events: List[Dict[str, Any]] = []
+        threads: Dict[int, str] = {}
+        for span in self.spans:
+            threads[span.thread_id] = span.thread_name
+            args = {"trace_id": span.trace_id, "span_id": span.span_id, **span.attributes}
+            if span.parent is not None:
+                args["parent_span_id"] = span.parent.span_id
+            if span.error:
+                args["error"] = span.error
+            events.append({"name": span.name, "cat": span.kind, "ph": "X", "pid": pid, "tid": span.thread_id,
+                           "ts": span.start_ns / 1000, "dur": (span.end_ns - span.start_ns) / 1000, "args": args})
+            for time_ns, name, attributes in span.events:
+                events.append({"name": name, "cat": span.kind, "ph": "i", "s": "t", "pid": pid,
+                               "tid": span.thread_id, "ts": time_ns / 1000, "args": attributes})
+        for tid, name in threads.items():
+            events.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": name}})
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def to_otlp(self, service_name: str = "chatgpt-tool-hub") -> Dict[str, Any]:
+        """The finished spans as an OTLP/JSON ExportTraceServiceRequest."""
+        spans = []
+        for span in self.spans:
+            otlp_span = {
+                "traceId": span.trace_id,
+                "spanId": span.span_id,
+                "name": span.name,
+                # llm and tool calls leave the process, the rest is internal work
+                "kind": 3 if span.kind in (LLM, TOOL) else 1,
+                "startTimeUnixNano": str(span.start_ns),
+                "endTimeUnixNano": str(span.end_ns),
+                "attributes": _otlp_attributes({"span.kind": span.kind, "thread.name": span.thread_name,
+                                                **span.attributes}),
+                "events": [{"timeUnixNano": str(time_ns), "name": name, "attributes": _otlp_attributes(attributes)}
+                           for time_ns, name, attributes in span.events],
+                "status": {"code": 2, "message": span.error} if span.error else {"code": 1},
+            }
+            if span.parent is not None:
+                otlp_span["parentSpanId"] = span.parent.span_id
+            spans.append(otlp_span)
+        return {
+            "resourceSpans": [{
+                "resource": {"attributes": _otlp_attributes({"service.name": service_name})},
+                "scopeSpans": [{"scope": {"name": __name__}, "spans": spans}],
+            }]
+        }
+
+    def export_chrome_trace(self, path: str) -> None:
+        """Write the Chrome trace, open it in chrome://tracing or ui.perfetto.dev."""
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_chrome_trace(), f, ensure_ascii=False)
+
+    def export_otlp_json(self, path: str, service_name: str = "chatgpt-tool-hub") -> None:
+        """Write OTLP/JSON, e.g. for the OpenTelemetry collector's otlpjsonfile receiver."""
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_otlp(service_name), f, ensure_ascii=False)
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_attributes(attributes: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return [{"key": key, "value": _otlp_value(value)} for key, value in attributes.items()]
+
+
+@contextmanager
+def trace_span(name: str, **attributes: Any) -> Iterator[Optional[Span]]:
+    """Time an inner phase as a child of the current span; does nothing when nothing is being traced."""
+    parent = _current_span.get()
+    if parent is None:
+        yield None
+        return
+    with parent.tracer.span(name, INTERNAL, **attributes) as span:
+        yield span
@@ -1,5 +1,12 @@
+from .chat_memory import BaseChatMessageHistory, ChatMessageHistory
+from .sqlite_history import SQLiteChatMessageHistory
+from .summary_buffer import ConversationSummaryBufferMemory
 from .token_buffer import ConversationTokenBufferMemory
 
 __all__ = [
+    "BaseChatMessageHistory",
+    "ChatMessageHistory",
+    "ConversationSummaryBufferMemory",
     "ConversationTokenBufferMemory",
+    "SQLiteChatMessageHistory",
 ]
@@ -1,5 +1,5 @@
-from abc import ABC
-from typing import Any, Dict, List, Optional
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Dict, List, Optional
 
 from .utils import get_prompt_input_key
 from pydantic import BaseModel, Field
@@ -7,21 +7,63 @@ from pydantic import BaseModel, Field
 from ..common.schema import AIMessage, BaseMemory, BaseMessage, HumanMessage
 
 
-class ChatMessageHistory(BaseModel):
+class BaseChatMessageHistory(BaseModel, ABC):
+    """Where a chat memory keeps its messages."""
+
     messages: List[BaseMessage] = Field(default_factory=list)
+    # rolling summary of the messages no longer kept, see ConversationSummaryBufferMemory
+    summary: str = ""
 
     def add_user_message(self, message: str) -> None:
-        self.messages.append(HumanMessage(content=message))
+        self.add_message(HumanMessage(content=message))
 
     def add_ai_message(self, message: str) -> None:
-        self.messages.append(AIMessage(content=message))
+        self.add_message(AIMessage(content=message))
+
+    @abstractmethod
+    def add_message(self, message: BaseMessage) -> None:
+        """Append a message to the history."""
+
+    @abstractmethod
+    def clear(self) -> None:
+        """Remove every message."""
+
+    def attach(self, token_counter: Callable[[BaseMessage], int], max_tokens: int) -> None:
+        """Called by a memory using this history with its token counter and budget."""
+
+    def token_counts(self) -> Optional[List[int]]:
+        """Cached token count of each of `messages`, None if this history keeps none."""
+        return None
+
+    def drop_oldest(self, num: int) -> Optional[int]:
+        """Forget the `num` oldest messages once they no longer fit the memory.
+
+        Histories numbering their messages return the number of the last one
+        dropped, to pass to save_summary once it is folded in.
+        """
+        del self.messages[:num]
+        return None
+
+    def save_summary(self, summary: str, folded_through: Optional[int] = None) -> None:
+        """Keep the summary of this session next to its messages.
+
+        `folded_through` is the number of the last message the summary covers,
+        a persistent history doesn't load those again.
+        """
+        self.summary = summary
+
+
+class ChatMessageHistory(BaseChatMessageHistory):
+    def add_message(self, message: BaseMessage) -> None:
+        self.messages.append(message)
 
     def clear(self) -> None:
         self.messages = []
+        self.summary = ""
 
 
 class BaseChatMemory(BaseMemory, ABC):
-    chat_memory: ChatMessageHistory = Field(default_factory=ChatMessageHistory)
+    chat_memory: BaseChatMessageHistory = Field(default_factory=ChatMessageHistory)
     output_key: Optional[str] = None
     input_key: Optional[str] = None
     return_messages: bool = False
@@ -44,3 +86,14 @@ class BaseChatMemory(BaseMemory, ABC):
     def clear(self) -> None:
         """Clear memory contents."""
         self.chat_memory.clear()
+
+    def detach_history(self) -> None:
+        """Keep the conversation in process from now on, starting empty.
+
+        A persistent history is left as it is: nothing more is written to it
+        and nothing already stored is deleted.
+        """
+        if isinstance(self.chat_memory, ChatMessageHistory):
+            return
+        self.chat_memory = ChatMessageHistory()
+        self.clear()
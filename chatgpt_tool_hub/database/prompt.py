@@ -0,0 +1,19 @@
+from ..prompts import PromptTemplate
+
+SUMMARY_PROMPT = """
+你是一名对话记录员。逐步总结下面提供的对话内容：在已有总结的基础上加入新的对话，返回一份新的总结。
+保留对后续对话有用的事实、用户的偏好和尚未完成的事项，丢弃寒暄和重复的内容，字数尽可能少。
+
+已有总结:
+{summary}
+
+新的对话:
+{new_lines}
+
+新的总结:
+"""
+
+SUMMARY_QUERY_PROMPT = PromptTemplate(
+    input_variables=["summary", "new_lines"],
+    template=SUMMARY_PROMPT,
+)
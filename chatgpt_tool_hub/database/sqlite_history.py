@@ -0,0 +1,212 @@
+"""Chat history persisted in SQLite, one append-only log per session."""
+import os
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from pydantic import Field, PrivateAttr
+
+from ..common.log import LOG
+from ..common.schema import AIMessage, BaseMessage, ChatMessage, HumanMessage, SystemMessage, get_buffer_string
+from ..models.tokenizer import count_tokens
+from .chat_memory import BaseChatMessageHistory
+
+_connections: Dict[str, Tuple[sqlite3.Connection, threading.Lock]] = {}
+_connections_lock = threading.Lock()
+
+
+def _get_connection(database_path: str) -> Tuple[sqlite3.Connection, threading.Lock]:
+    """One connection (and the lock guarding it) per database file, shared by every session."""
+    with _connections_lock:
+        if database_path in _connections:
+            return _connections[database_path]
+
+        directory = os.path.dirname(os.path.abspath(database_path))
+        if database_path != ":memory:" and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(database_path, check_same_thread=False, isolation_level=None)
+        if database_path != ":memory:":
+            conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS chat_history ("
+            "  id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            "  session_id TEXT NOT NULL,"
+            "  role TEXT NOT NULL,"
+            "  content TEXT NOT NULL,"
+            "  tokens INTEGER NOT NULL,"
+            "  created_at REAL NOT NULL"
+            ")"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_chat_history_session ON chat_history (session_id, id)")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS chat_summary ("
+            "  session_id TEXT PRIMARY KEY,"
+            "  summary TEXT NOT NULL,"
+            "  folded_id INTEGER NOT NULL DEFAULT 0,"
+            "  updated_at REAL NOT NULL"
+            ")"
+        )
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(chat_summary)")]
+        if "folded_id" not in columns:
+            # databases written before the summary kept its watermark
+            conn.execute("ALTER TABLE chat_summary ADD COLUMN folded_id INTEGER NOT NULL DEFAULT 0")
+        _connections[database_path] = (conn, threading.Lock())
+        return _connections[database_path]
+
+
+def _message_to_row(message: BaseMessage) -> Tuple[str, str]:
+    role = message.role if isinstance(message, ChatMessage) else message.type
+    return role, message.content
+
+
+def _row_to_message(role: str, content: str) -> BaseMessage:
+    if role == "human":
+        return HumanMessage(content=content)
+    if role == "ai":
+        return AIMessage(content=content)
+    if role == "system":
+        return SystemMessage(content=content)
+    return ChatMessage(role=role, content=content)
+
+
+def _default_token_counter(message: BaseMessage) -> int:
+    return count_tokens(get_buffer_string([message]))
+
+
+class SQLiteChatMessageHistory(BaseChatMessageHistory):
+    """Chat history of one session in a SQLite database.
+
+    Only the tail of the conversation is loaded: the latest messages fitting
+    `max_load_tokens` (at most `max_load_messages` of them). Each message is stored
+    with its token count, so loading counts nothing again, and a new message is a
+    single INSERT. Messages a memory prunes stay in the database; those folded
+    into the session's summary are not loaded again.
+
+    Example:
+        .. code-block:: python
+
+            history = SQLiteChatMessageHistory(session_id="user-1", database_path=".chat_history.db")
+            memory = ConversationTokenBufferMemory(llm=llm, chat_memory=history, max_token_limit=1000)
+    """
+
+    session_id: str
+    database_path: str = ".chat_history.db"
+    max_load_tokens: Optional[int] = None
+    max_load_messages: int = 200
+    token_counter: Optional[Callable[[BaseMessage], int]] = Field(default=None, exclude=True)
+
+    _token_counts: List[int] = PrivateAttr(default_factory=list)
+    # row ids of the messages, parallel to them
+    _ids: List[Optional[int]] = PrivateAttr(default_factory=list)
+    _loaded: bool = PrivateAttr(default=False)
+
+    def _connection(self) -> Tuple[sqlite3.Connection, threading.Lock]:
+        return _get_connection(self.database_path)
+
+    def _count(self, message: BaseMessage) -> int:
+        return (self.token_counter or _default_token_counter)(message)
+
+    def attach(self, token_counter: Callable[[BaseMessage], int], max_tokens: int) -> None:
+        """Count with the memory's counter and load no more than its budget."""
+        if self.token_counter is None:
+            self.token_counter = token_counter
+        if self.max_load_tokens is None:
+            self.max_load_tokens = max_tokens
+        self.load()
+
+    def load(self) -> None:
+        """Read the tail of the session, once."""
+        if self._loaded:
+            return
+        conn, lock = self._connection()
+        messages: List[BaseMessage] = []
+        counts: List[int] = []
+        ids: List[Optional[int]] = []
+        total = 0
+        with lock:
+            row = conn.execute(
+                "SELECT summary, folded_id FROM chat_summary WHERE session_id = ?", (self.session_id,)
+            ).fetchone()
+            folded_id = row[1] if row else 0
+            # newest first, the (session_id, id) index makes this read only the tail
+            rows = conn.execute(
+                "SELECT id, role, content, tokens FROM chat_history WHERE session_id = ? AND id > ? "
+                "ORDER BY id DESC LIMIT ?",
+                (self.session_id, folded_id, self.max_load_messages),
+            )
+            for row_id, role, content, tokens in rows:
+                if self.max_load_tokens is not None and total + tokens > self.max_load_tokens:
+                    break
+                messages.append(_row_to_message(role, content))
+                counts.append(tokens)
+                ids.append(row_id)
+                total += tokens
+        messages.reverse()
+        counts.reverse()
+        ids.reverse()
+        # messages added before loading are newer than anything stored
+        self.messages[:0] = messages
+        self._token_counts[:0] = counts
+        self._ids[:0] = ids
+        if row and not self.summary:
+            self.summary = row[0]
+        self._loaded = True
+        LOG.debug(f"[chat history] {self.session_id}: loaded {len(messages)} messages, {total} tokens")
+
+    def add_message(self, message: BaseMessage) -> None:
+        self.load()
+        tokens = self._count(message)
+        role, content = _message_to_row(message)
+        conn, lock = self._connection()
+        with lock:
+            cursor = conn.execute(
+                "INSERT INTO chat_history (session_id, role, content, tokens, created_at) VALUES (?, ?, ?, ?, ?)",
+                (self.session_id, role, content, tokens, time.time()),
+            )
+        self.messages.append(message)
+        self._token_counts.append(tokens)
+        self._ids.append(cursor.lastrowid)
+
+    def token_counts(self) -> Optional[List[int]]:
+        self.load()
+        return self._token_counts
+
+    def drop_oldest(self, num: int) -> Optional[int]:
+        dropped_ids = self._ids[:num]
+        del self.messages[:num]
+        del self._token_counts[:num]
+        del self._ids[:num]
+        return dropped_ids[-1] if dropped_ids else None
+
+    def save_summary(self, summary: str, folded_through: Optional[int] = None) -> None:
+        conn, lock = self._connection()
+        with lock:
+            # the watermark only moves forward, a summary saved without one keeps it
+            conn.execute(
+                "INSERT INTO chat_summary (session_id, summary, folded_id, updated_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (session_id) DO UPDATE SET summary = excluded.summary, "
+                "folded_id = MAX(folded_id, excluded.folded_id), updated_at = excluded.updated_at",
+                (self.session_id, summary, folded_through or 0, time.time()),
+            )
+        self.summary = summary
+
+    def clear(self) -> None:
+        conn, lock = self._connection()
+        with lock:
+            conn.execute("DELETE FROM chat_history WHERE session_id = ?", (self.session_id,))
+            conn.execute("DELETE FROM chat_summary WHERE session_id = ?", (self.session_id,))
+        self.messages = []
+        self.summary = ""
+        self._token_counts = []
+        self._ids = []
+        self._loaded = True
+
+    def __len__(self) -> int:
+        """Messages stored for this session, loaded or not."""
+        conn, lock = self._connection()
+        with lock:
+            return conn.execute(
+                "SELECT COUNT(*) FROM chat_history WHERE session_id = ?", (self.session_id,)
+            ).fetchone()[0]
@@ -0,0 +1,164 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from pydantic import PrivateAttr, model_validator
+
+from ..chains.llm import LLMChain
+from ..common.log import LOG
+from ..common.schema import BaseMessage, SystemMessage, get_buffer_string
+from ..models.tokenizer import truncate_tokens
+from .prompt import SUMMARY_QUERY_PROMPT
+from .token_buffer import ConversationTokenBufferMemory
+
+# folds of every session share these workers, they wait on llm calls only
+SUMMARY_MAX_WORKERS = 4
+
+_fold_executor: Optional[ThreadPoolExecutor] = None
+_fold_executor_lock = threading.Lock()
+
+
+def get_fold_executor() -> ThreadPoolExecutor:
+    """Return the pool summary folds run on.
+
+    Not the shared pool: a fold is a slow llm call, queued behind request work
+    it would hold up the requests waiting for that pool.
+    """
+    global _fold_executor
+    if _fold_executor is None:
+        with _fold_executor_lock:
+            if _fold_executor is None:
+                _fold_executor = ThreadPoolExecutor(max_workers=SUMMARY_MAX_WORKERS,
+                                                    thread_name_prefix="tool-hub-summary")
+    return _fold_executor
+
+
+class ConversationSummaryBufferMemory(ConversationTokenBufferMemory):
+    """Token buffer that folds the turns it drops into a rolling summary.
+
+    Folding runs on its own workers after save_context returns, so no request
+    waits for the summarizing llm call: the next request sees whatever summary is
+    ready plus the recent turns, and turns still being folded are in neither for a
+    moment. The summary is kept with the session's chat history, so a
+    SQLiteChatMessageHistory brings it back after a restart, together with only
+    the messages it doesn't cover yet.
+    """
+
+    max_summary_tokens: int = 400
+    summary_chain: Optional[LLMChain] = None
+
+    # dropped messages waiting for the worker, guarded by _summary_lock
+    _pending: List[BaseMessage] = PrivateAttr(default_factory=list)
+    # number of the last pending message, for histories numbering them
+    _pending_through: Optional[int] = PrivateAttr(default=None)
+    _folding: bool = PrivateAttr(default=False)
+    _idle: threading.Event = PrivateAttr(default_factory=threading.Event)
+    _summary_lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+    # bumped by clear() so that a fold in flight doesn't bring back the old summary
+    _generation: int = PrivateAttr(default=0)
+    # (summary, its token count), counted once per summary
+    _summary_tokens: Tuple[str, int] = PrivateAttr(default=("", 0))
+
+    @model_validator(mode="after")
+    def build_summary_chain(self):
+        if self.summary_chain is None:
+            self.summary_chain = LLMChain(llm=self.llm, prompt=SUMMARY_QUERY_PROMPT)
+        self._idle.set()
+        return self
+
+    @property
+    def summary(self) -> str:
+        return self.chat_memory.summary
+
+    @property
+    def summary_tokens(self) -> int:
+        summary = self.chat_memory.summary
+        if not summary:
+            return 0
+        cached_summary, tokens = self._summary_tokens
+        if cached_summary is not summary:
+            tokens = self.llm.get_num_tokens(summary)
+            self._summary_tokens = (summary, tokens)
+        return tokens
+
+    @property
+    def num_tokens(self) -> int:
+        return super().num_tokens + self.summary_tokens
+
+    def load_memory_variables(self, inputs: Dict[str, Any]) -> Dict[str, Any]:
+        """Return the summary followed by the recent turns."""
+        buffer: List[BaseMessage] = list(self.buffer)
+        summary = self.chat_memory.summary
+        if summary:
+            buffer.insert(0, SystemMessage(content=summary))
+        if self.return_messages:
+            return {self.memory_key: buffer}
+        return {self.memory_key: get_buffer_string(buffer, human_prefix=self.human_prefix, ai_prefix=self.ai_prefix)}
+
+    def _buffer_token_limit(self) -> int:
+        # the summary takes its share of the memory budget
+        return self.max_token_limit - self.summary_tokens
+
+    def _prune(self) -> List[BaseMessage]:
+        drop_num = self._overflow()
+        if not drop_num:
+            return []
+        dropped = self.chat_memory.messages[:drop_num]
+        folded_through = self.chat_memory.drop_oldest(drop_num)
+        self._schedule_fold(dropped, folded_through)
+        return dropped
+
+    def _schedule_fold(self, messages: List[BaseMessage], folded_through: Optional[int] = None) -> None:
+        with self._summary_lock:
+            self._pending.extend(messages)
+            if folded_through is not None:
+                self._pending_through = folded_through
+            if self._folding:
+                # the running worker picks them up before it exits
+                return
+            self._folding = True
+            self._idle.clear()
+            # not submit_with_context: the fold must outlive the request's deadline
+            get_fold_executor().submit(self._fold)
+
+    def _fold(self) -> None:
+        while True:
+            with self._summary_lock:
+                if not self._pending:
+                    self._folding = False
+                    self._idle.set()
+                    return
+                batch, self._pending = self._pending, []
+                folded_through, self._pending_through = self._pending_through, None
+                summary = self.chat_memory.summary
+                generation = self._generation
+
+            try:
+                new_summary = self._summarize(summary, batch)
+            except Exception as e:
+                LOG.warning(f"[MEMORY] summarizing {len(batch)} messages failed, they are forgotten: {repr(e)}")
+                new_summary = summary
+
+            with self._summary_lock:
+                if generation == self._generation:
+                    self.chat_memory.save_summary(new_summary, folded_through)
+            LOG.debug(f"[MEMORY] folded {len(batch)} messages into summary: {new_summary}")
+
+    def _summarize(self, summary: str, messages: List[BaseMessage]) -> str:
+        new_lines = get_buffer_string(messages, human_prefix=self.human_prefix, ai_prefix=self.ai_prefix)
+        new_summary = self.summary_chain.predict(summary=summary or "无", new_lines=new_lines).strip()
+        if self.llm.get_num_tokens(new_summary) > self.max_summary_tokens:
+            new_summary = truncate_tokens(new_summary, self.max_summary_tokens)
+        return new_summary
+
+    def wait_for_summary(self, timeout: Optional[float] = None) -> bool:
+        """Block until every dropped turn is folded in, False on timeout. Meant for tests and shutdown."""
+        return self._idle.wait(timeout)
+
+    def clear(self) -> None:
+        with self._summary_lock:
+            self._generation += 1
+            self._pending = []
+            self._pending_through = None
+        super().clear()
+        self._summary_tokens = ("", 0)
@@ -1,6 +1,7 @@
-from typing import Any, Dict, List
+from collections import deque
+from typing import Any, Deque, Dict, List
 
-from pydantic import BaseModel
+from pydantic import BaseModel, PrivateAttr, model_validator
 
 from ..common.log import LOG
 from ..common.schema import BaseLanguageModel, BaseMessage, get_buffer_string
@@ -17,6 +18,18 @@ class ConversationTokenBufferMemory(BaseChatMemory, BaseModel):
     filter_key_list: list = []
     max_token_limit: int = 2000
 
+    # token count of each message in chat_memory.messages, and their sum
+    _token_counts: Deque[int] = PrivateAttr(default_factory=deque)
+    _total_tokens: int = PrivateAttr(default=0)
+    _priming_tokens: int = PrivateAttr(default=-1)
+
+    @model_validator(mode="after")
+    def attach_history(self):
+        """Let a persistent history count with our counter and load only what fits."""
+        self._count_priming()
+        self.chat_memory.attach(self._count_message, self.max_token_limit - self._priming_tokens)
+        return self
+
     @property
     def buffer(self) -> List[BaseMessage]:
         """String buffer of memory."""
@@ -47,14 +60,67 @@ class ConversationTokenBufferMemory(BaseChatMemory, BaseModel):
         """Save context from this conversation to buffer. Pruned."""
         inputs = self._filter_inputs(inputs)
         super().save_context(inputs, outputs)
-        # Prune buffer if it exceeds max token limit
+        self._sync_token_counts()
+        self._prune()
+
+    @property
+    def num_tokens(self) -> int:
+        """Tokens the buffer takes in a prompt."""
+        self._sync_token_counts()
+        return self._priming_tokens + self._total_tokens
+
+    def _count_priming(self) -> None:
+        if self._priming_tokens < 0:
+            # per-request overhead counted once for the whole buffer, not per message
+            self._priming_tokens = self.llm.get_num_tokens_from_messages([])
+
+    def _count_message(self, message: BaseMessage) -> int:
+        self._count_priming()
+        return self.llm.get_num_tokens_from_messages([message]) - self._priming_tokens
+
+    def _sync_token_counts(self) -> None:
+        """Count only the messages added since the last call."""
         buffer = self.chat_memory.messages
-        curr_buffer_length = self.llm.get_num_tokens_from_messages(buffer)
-        if curr_buffer_length > self.max_token_limit:
-            pruned_memory = []
-            while curr_buffer_length > self.max_token_limit:
-                pruned_memory.append(buffer.pop(0))
-                curr_buffer_length = self.llm.get_num_tokens_from_messages(buffer)
+        if len(self._token_counts) > len(buffer):
+            # the history was changed behind our back, count it again
+            self._token_counts.clear()
+            self._total_tokens = 0
+        # a history that stores token counts spares counting its messages again
+        cached = self.chat_memory.token_counts()
+        if cached is not None and len(cached) != len(buffer):
+            cached = None
+        self._count_priming()
+        for i in range(len(self._token_counts), len(buffer)):
+            count = cached[i] if cached is not None else self._count_message(buffer[i])
+            self._token_counts.append(count)
+            self._total_tokens += count
+
+    def _buffer_token_limit(self) -> int:
+        return self.max_token_limit
+
+    def _overflow(self) -> int:
+        """Uncount the oldest messages until the buffer fits, return how many."""
+        drop_num = 0
+        limit = self._buffer_token_limit()
+        while self._token_counts and self._priming_tokens + self._total_tokens > limit:
+            self._total_tokens -= self._token_counts.popleft()
+            drop_num += 1
+        return drop_num
+
+    def _prune(self) -> List[BaseMessage]:
+        """Drop the oldest messages until the buffer fits, return the dropped ones."""
+        drop_num = self._overflow()
+        if not drop_num:
+            return []
+        dropped = self.chat_memory.messages[:drop_num]
+        self.chat_memory.drop_oldest(drop_num)
+        return dropped
+
+    def clear(self) -> None:
+        """Clear memory contents."""
+        super().clear()
+        self._token_counts.clear()
+        self._total_tokens = 0
 
     def _filter_inputs(self, inputs: Dict[str, Any]):
         _inputs = inputs.copy()
@@ -2,28 +2,38 @@
 from __future__ import annotations
 
 import json
-import os
-import tempfile
+import threading
 from abc import abstractmethod
 from pathlib import Path
 from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
 
 import yaml
-from pydantic import BaseModel, model_validator, field_validator
+from pydantic import BaseModel, PrivateAttr, model_validator, field_validator
 from rich.console import Console
 
 from ..chains import LLMChain
-from ..models.calculate_token import count_string_tokens
 from ..common.callbacks import BaseCallbackManager
+from ..common.concurrency import run_in_executor
+from ..common.deadline import deadline_expired
 from ..common.log import LOG
-from ..common.schema import BotAction, BotFinish, BaseMessage
-from ..models import ALL_MAX_TOKENS_NUM, BOT_SCRATCHPAD_MAX_TOKENS_NUM
+from ..common.schema import BotAction, BotFinish
+from ..common.stream import FinalAnswerStreamParser
+from .scratchpad import Scratchpad
+from ..models import ALL_MAX_TOKENS_NUM
 from ..models.base import BaseLLM
+from ..models.token_budget import TokenBudget, get_token_budget
+from ..models.tokenizer import count_tokens, truncate_tokens
 from ..prompts import BasePromptTemplate
 from ..prompts import PromptTemplate
-from ..tools import SummaryTool
+from ..tools.summary import get_summary_tool
 from ..tools.base_tool import BaseTool
 
+TIMEOUT_INSTRUCTION = (
+    "你的时间用完了，不能再使用其他tool。"
+    "你现在需要总结当前你了解到的所有信息，来反馈给人类，本次你必须使用answer-user工具!"
+    "你需要生成一个final answer:"
+)
+
 
 class Bot(BaseModel):
     """Class responsible for calling the language model and deciding the action.
@@ -42,6 +52,10 @@ class Bot(BaseModel):
 
     console: Console = None
 
+    _token_budget: Optional[TokenBudget] = PrivateAttr(default=None)
+    _scratchpad: Optional[Scratchpad] = PrivateAttr(default=None)
+    _scratchpad_lock: Any = PrivateAttr(default_factory=threading.Lock)
+
     class Config:
         """Configuration for this pydantic object."""
 
@@ -59,6 +73,40 @@ class Bot(BaseModel):
         """Fix the text."""
         raise ValueError("fix_text not implemented for this bot.")
 
+    @property
+    def token_budget(self) -> TokenBudget:
+        """Token budget of this bot's prompt, its static part is measured on first use."""
+        if self._token_budget is None:
+            self._token_budget = get_token_budget(self.llm_chain.llm, self.llm_chain.prompt)
+            LOG.debug(f"bot token budget: {self._token_budget}")
+        return self._token_budget
+
+    def fork(self) -> Bot:
+        """A bot sharing this one's llm chain, prompt and settings but not its per-run state.
+
+        Two runs of the same bot can't overlap, give each concurrent session a fork.
+        """
+        bot = self.model_copy()
+        # the budget only depends on the prompt, measure it once for every fork
+        bot._token_budget = self.token_budget
+        bot._scratchpad = None
+        bot._scratchpad_lock = threading.Lock()
+        return bot
+
+    @property
+    def _model_name(self) -> str:
+        return self.token_budget.model_name
+
+    def _clip_observation(self, observation: str) -> str:
+        """Cut an observation too large to ever fit in the scratchpad."""
+        observation = str(observation)
+        limit = self.token_budget.observation_limit
+        clipped = truncate_tokens(observation, limit, self._model_name)
+        if clipped != observation:
+            LOG.debug(f"observation clipped to {limit} tokens")
+            clipped += "\n...(truncated)"
+        return clipped
+
     @property
     def _stop(self) -> List[str]:
         return [
@@ -66,64 +114,96 @@ class Bot(BaseModel):
             f"\n\t{self.observation_prefix.rstrip()}",
         ]
 
-    def _construct_scratchpad(
-        self, intermediate_steps: List[Tuple[BotAction, str]]
-    ) -> Union[str, List[BaseMessage]]:
-        """Construct the scratchpad that lets the bot continue its thought process."""
+    def _format_step(self, action: BotAction, observation: str, show_log: bool = True) -> str:
+        """One step of the scratchpad, `show_log` is False for the other tools of a reply already shown."""
         thoughts = ""
-        # todo 区分当前对话和历史对话的scratchpad描述
-        for action, observation in intermediate_steps:
+        if show_log:
             thoughts += f"previous constructed JSON: {action.log}\n"
-            thoughts += f"{action.tool} tool was called and it returned: {observation}\n\n"
+        thoughts += f"{action.tool} tool was called and it returned: {self._clip_observation(observation)}\n\n"
         return thoughts
 
-    def _crop_full_input(self, inputs: str) -> str:
-        """ crop too long text """
-        if not inputs:
-            return inputs
-        _input = inputs
-
-        while count_string_tokens(_input) >= BOT_SCRATCHPAD_MAX_TOKENS_NUM:
-
-            # compress text size
-            temp_file = tempfile.mkstemp()
-            file_path = temp_file[1]
-
-            with open(file_path, "w") as f:
-                f.write(_input + "\n")
-            # 总结
-            _input = SummaryTool(self.console, max_segment_length=2000).run(f"{str(file_path)}, 0")
-            try:
-                os.remove(file_path)
-            except Exception as e:
-                LOG.debug(f"remove {file_path} failed... error_info: {repr(e)}")
-
-        return _input
-
-    def _get_next_action(self, full_inputs: Dict[str, str]) -> BotAction:
+    def _format_compact_step(self, action: BotAction, observation: str) -> str:
+        """An earlier step of the scratchpad, without the raw llm output."""
+        return (f"{action.tool} tool was called with input: {action.tool_input}\n"
+                f"it returned: {self._clip_observation(observation)}\n\n")
+
+    def _get_scratchpad(self, intermediate_steps: List[Tuple[BotAction, str]]) -> Scratchpad:
+        """The incremental scratchpad of the current run, brought up to date."""
+        with self._scratchpad_lock:
+            if self._scratchpad is None or not self._scratchpad.continues(intermediate_steps):
+                self._scratchpad = Scratchpad(self._format_step, self._format_compact_step,
+                                              self._summarize, self._model_name)
+            scratchpad = self._scratchpad
+        scratchpad.update(intermediate_steps)
+        return scratchpad
+
+    def _scratchpad_limit(self, other_inputs: Optional[Dict[str, Any]] = None) -> int:
+        """Tokens the scratchpad may use next to `other_inputs`, the rest of the prompt variables."""
+        if other_inputs is None:
+            return self.token_budget.scratchpad_limit
+        return self.token_budget.remaining(*[
+            value for key, value in other_inputs.items()
+            if key in self.llm_chain.prompt.input_variables and key != "bot_scratchpad"
+        ])
+
+    def _render_scratchpad(
+        self, intermediate_steps: List[Tuple[BotAction, str]], other_inputs: Dict[str, Any], suffix: str = ""
+    ) -> str:
+        """Scratchpad text of `intermediate_steps` (then `suffix`) within the budget."""
+        limit = self._scratchpad_limit(other_inputs) - count_tokens(suffix, self._model_name)
+        return self._get_scratchpad(intermediate_steps).render(limit) + suffix
+
+    def _summarize(self, text: str, max_tokens: Optional[int] = None) -> str:
+        return get_summary_tool(self.console, llm=self.llm_chain.llm,
+                                summary_max_segment_length=2000).text(text, max_tokens)
+
+    def _extract_tool_calls(self, text: str) -> Optional[List[Tuple[str, str]]]:
+        """Extract every (tool, tool input) of llm output, override for formats allowing several."""
+        parsed_output = self._extract_tool_and_input(text)
+        return None if parsed_output is None else [parsed_output]
+
+    @staticmethod
+    def _to_actions(tool_calls: List[Tuple[str, str]], log: str) -> List[BotAction]:
+        return [BotAction(tool=tool, tool_input=tool_input, log=log) for tool, tool_input in tool_calls]
+
+    def _get_next_actions(self, full_inputs: Dict[str, str]) -> List[BotAction]:
         full_output = self.llm_chain.predict(**full_inputs)
-        parsed_output = self._extract_tool_and_input(full_output)
+        tool_calls = self._extract_tool_calls(full_output)
 
-        action_input = "None" if parsed_output is None else parsed_output[1]
+        action_input = "None" if tool_calls is None else [call[1] for call in tool_calls]
         LOG.info(f"输入: {action_input}")
         retry_num = 0
-        while parsed_output is None:
+        while tool_calls is None:
             retry_num += 1
             if retry_num > self.max_parse_retry_num:
-                raise ValueError(f"Could not parse LLM output: `{parsed_output}`")
+                raise ValueError(f"Could not parse LLM output: `{tool_calls}`")
 
             full_output = self._fix_text(full_output)
             full_inputs["bot_scratchpad"] += full_output
             output = self.llm_chain.predict(**full_inputs)
             # LOG.debug("(fix_text): retry response: " + str(output))
-            parsed_output = self._extract_tool_and_input(output)
-        return BotAction(
-            tool=parsed_output[0], tool_input=parsed_output[1], log=full_output
-        )
+            tool_calls = self._extract_tool_calls(output)
+        return self._to_actions(tool_calls, full_output)
+
+    def _get_next_action(self, full_inputs: Dict[str, str]) -> BotAction:
+        return self._get_next_actions(full_inputs)[0]
+
+    def _plan_result(
+        self, actions: List[BotAction], finish_tool_name: Optional[str] = None
+    ) -> Union[BotAction, List[BotAction], BotFinish]:
+        """Finish if the bot only answered, otherwise the tool call(s) to run."""
+        finish_tool_name = finish_tool_name or self.finish_tool_name
+        # answering while asking for tools makes no sense, run the tools first
+        tool_actions = [action for action in actions if action.tool != finish_tool_name]
+        if not tool_actions:
+            return BotFinish({"output": actions[0].tool_input}, actions[0].log)
+        if len(tool_actions) == 1:
+            return tool_actions[0]
+        return tool_actions
 
     def plan(
         self, intermediate_steps: List[Tuple[BotAction, str]], **kwargs: Any
-    ) -> Union[BotAction, BotFinish]:
+    ) -> Union[BotAction, List[BotAction], BotFinish]:
         """Given input, decided what to do.
 
         Args:
@@ -132,25 +212,27 @@ class Bot(BaseModel):
             **kwargs: User inputs.
 
         Returns:
-            Action specifying what tool to use.
+            Action specifying what tool to use, or a list of independent
+            actions the engine may run at the same time.
         """
         full_inputs = self.get_full_inputs(intermediate_steps, **kwargs)
-        action = self._get_next_action(full_inputs)
-        if action.tool == self.finish_tool_name:
-            return BotFinish({"output": action.tool_input}, action.log)
-        return action
+        return self._plan_result(self._get_next_actions(full_inputs))
 
     def get_full_inputs(
         self, intermediate_steps: List[Tuple[BotAction, str]], **kwargs: Any
     ) -> Dict[str, Any]:
         """Create the full inputs for the LLMChain from intermediate steps."""
-        thoughts = self._construct_scratchpad(intermediate_steps)
-        new_inputs = {"bot_scratchpad": self._crop_full_input(thoughts), "stop": self._stop}
+        new_inputs = {"bot_scratchpad": self._render_scratchpad(intermediate_steps, kwargs), "stop": self._stop}
         return {**kwargs, **new_inputs}
 
+    def create_stream_parser(self) -> FinalAnswerStreamParser:
+        """Parser picking the final answer out of streamed llm tokens, override per reply format."""
+        return FinalAnswerStreamParser()
+
     def prepare_for_new_call(self) -> None:
         """Prepare the bot for new call, if needed."""
-        pass
+        with self._scratchpad_lock:
+            self._scratchpad = None
 
     @property
     def finish_tool_name(self) -> str:
@@ -232,36 +314,100 @@ class Bot(BaseModel):
             # `force` just returns a constant string
             return BotFinish({"output": "Bot stopped due to max iterations."}, "")
         elif early_stopping_method == "generate":
-            # Adding to the previous steps, we now tell the LLM to make a final pred
-            thoughts = self._construct_scratchpad(intermediate_steps)
-            thoughts += (
-                f"你超过了tool使用次数限制: 最多{max_iterations}次。"
-                "你现在需要总结当前你了解到的所有信息，来反馈给人类，本次你必须使用answer-user工具!"
-                "你需要生成一个final answer:"
-            )
-
-            new_inputs = {"bot_scratchpad": self._crop_full_input(thoughts), "stop": self._stop}
-            full_inputs = {**kwargs, **new_inputs}
+            full_inputs = self._stopped_inputs(intermediate_steps, max_iterations, **kwargs)
             full_output = self.llm_chain.predict(**full_inputs)
-            # We try to extract a final answer
-            action, action_input = self._extract_tool_and_input(full_output)
-
-            if action:
-                return (
-                    BotFinish({"output": action_input}, full_output)
-                    if str(action).lower() in ['answer-user']
-                    else BotFinish({"output": "受think_depth限制，系统强制终止了LLM-OS"}, full_output)
-                )
-            else:
-                # If we cannot extract, we just return the full output
-                return BotFinish({"output": full_output}, full_output)
-
+            return self._stopped_finish(full_output)
         else:
             raise ValueError(
                 "early_stopping_method should be one of `force` or `generate`, "
                 f"got {early_stopping_method}"
             )
 
+    async def areturn_stopped_response(
+        self,
+        early_stopping_method: str,
+        intermediate_steps: List[Tuple[BotAction, str]],
+        max_iterations: int,
+        **kwargs: Any,
+    ) -> BotFinish:
+        """Async version of `return_stopped_response`."""
+        if early_stopping_method != "generate":
+            return self.return_stopped_response(early_stopping_method, intermediate_steps, max_iterations, **kwargs)
+        full_inputs = await run_in_executor(self._stopped_inputs, intermediate_steps, max_iterations, **kwargs)
+        full_output = await self.llm_chain.apredict(**full_inputs)
+        return self._stopped_finish(full_output)
+
+    def return_timeout_response(
+        self,
+        early_stopping_method: str,
+        intermediate_steps: List[Tuple[BotAction, str]],
+        **kwargs: Any,
+    ) -> BotFinish:
+        """Best answer so far, when the request deadline leaves no time for more steps."""
+        if early_stopping_method == "generate" and not deadline_expired():
+            try:
+                full_inputs = self._stopped_inputs(intermediate_steps, instruction=TIMEOUT_INSTRUCTION, **kwargs)
+                return self._stopped_finish(self.llm_chain.predict(**full_inputs))
+            except Exception as e:
+                LOG.warning(f"no time left to generate an answer: {repr(e)}")
+        return self._timeout_finish(intermediate_steps)
+
+    async def areturn_timeout_response(
+        self,
+        early_stopping_method: str,
+        intermediate_steps: List[Tuple[BotAction, str]],
+        **kwargs: Any,
+    ) -> BotFinish:
+        """Async version of `return_timeout_response`."""
+        if early_stopping_method == "generate" and not deadline_expired():
+            try:
+                full_inputs = await run_in_executor(
+                    self._stopped_inputs, intermediate_steps, instruction=TIMEOUT_INSTRUCTION, **kwargs
+                )
+                return self._stopped_finish(await self.llm_chain.apredict(**full_inputs))
+            except Exception as e:
+                LOG.warning(f"no time left to generate an answer: {repr(e)}")
+        return self._timeout_finish(intermediate_steps)
+
+    def _timeout_finish(self, intermediate_steps: List[Tuple[BotAction, str]]) -> BotFinish:
+        # without an llm call, the last observation is the closest thing to an answer
+        output = "请求超时，系统强制终止了LLM-OS"
+        if intermediate_steps:
+            output += f"，目前获得的信息: {intermediate_steps[-1][1]}"
+        return BotFinish({"output": output}, "")
+
+    def _stopped_inputs(
+        self,
+        intermediate_steps: List[Tuple[BotAction, str]],
+        max_iterations: Optional[int] = None,
+        instruction: Optional[str] = None,
+        **kwargs: Any,
+    ) -> Dict[str, Any]:
+        # Adding to the previous steps, we now tell the LLM to make a final pred
+        instruction = instruction or (
+            f"你超过了tool使用次数限制: 最多{max_iterations}次。"
+            "你现在需要总结当前你了解到的所有信息，来反馈给人类，本次你必须使用answer-user工具!"
+            "你需要生成一个final answer:"
+        )
+
+        new_inputs = {"bot_scratchpad": self._render_scratchpad(intermediate_steps, kwargs, instruction),
+                      "stop": self._stop}
+        return {**kwargs, **new_inputs}
+
+    def _stopped_finish(self, full_output: str) -> BotFinish:
+        # We try to extract a final answer
+        action, action_input = self._extract_tool_and_input(full_output) or ("", "")
+
+        if action:
+            return (
+                BotFinish({"output": action_input}, full_output)
+                if str(action).lower() in ['answer-user']
+                else BotFinish({"output": "受think_depth限制，系统强制终止了LLM-OS"}, full_output)
+            )
+        else:
+            # If we cannot extract, we just return the full output
+            return BotFinish({"output": full_output}, full_output)
+
     @property
     @abstractmethod
     def _bot_type(self) -> str:
@@ -304,7 +450,7 @@ class Bot(BaseModel):
 
     async def aplan(
         self, intermediate_steps: List[Tuple[BotAction, str]], **kwargs: Any
-    ) -> Union[BotAction, BotFinish]:
+    ) -> Union[BotAction, List[BotAction], BotFinish]:
         """Given input, decided what to do.
 
         Args:
@@ -313,28 +459,28 @@ class Bot(BaseModel):
             **kwargs: User inputs.
 
         Returns:
-            Action specifying what tool to use.
+            Action specifying what tool to use, or a list of independent
+            actions the engine may run at the same time.
         """
-        full_inputs = self.get_full_inputs(intermediate_steps, **kwargs)
-        action = await self._aget_next_action(full_inputs)
-        if action.tool == self.finish_tool_name:
-            return BotFinish({"output": action.tool_input}, action.log)
-        return action
+        # cropping may summarize the scratchpad with blocking llm calls
+        full_inputs = await run_in_executor(self.get_full_inputs, intermediate_steps, **kwargs)
+        return self._plan_result(await self._aget_next_actions(full_inputs))
 
-    async def _aget_next_action(self, full_inputs: Dict[str, str]) -> BotAction:
+    async def _aget_next_actions(self, full_inputs: Dict[str, str]) -> List[BotAction]:
         full_output = await self.llm_chain.apredict(**full_inputs)
-        parsed_output = self._extract_tool_and_input(full_output)
+        tool_calls = self._extract_tool_calls(full_output)
         retry_num = 0
-        while parsed_output is None:
+        while tool_calls is None:
             retry_num += 1
             if retry_num > self.max_parse_retry_num:
-                raise ValueError(f"Could not parse LLM output: `{parsed_output}`")
+                raise ValueError(f"Could not parse LLM output: `{tool_calls}`")
 
             full_output = self._fix_text(full_output)
             full_inputs["bot_scratchpad"] += full_output
             output = await self.llm_chain.apredict(**full_inputs)
             full_output += output
-            parsed_output = self._extract_tool_and_input(full_output)
-        return BotAction(
-            tool=parsed_output[0], tool_input=parsed_output[1], log=full_output
-        )
+            tool_calls = self._extract_tool_calls(full_output)
+        return self._to_actions(tool_calls, full_output)
+
+    async def _aget_next_action(self, full_inputs: Dict[str, str]) -> BotAction:
+        return (await self._aget_next_actions(full_inputs))[0]
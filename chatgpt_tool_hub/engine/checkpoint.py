@@ -0,0 +1,157 @@
+"""Checkpoints of ToolEngine runs, so a failed step doesn't throw away the steps already done."""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from ..common.schema import BotAction
+
+
+class StepCheckpoint(NamedTuple):
+    """The (action, observation) steps a run finished and the iterations they took."""
+
+    steps: List[Tuple[BotAction, str]]
+    iterations: int
+
+
+def checkpoint_key(namespace: str, inputs: Dict[str, Any]) -> str:
+    """Key of a run: who runs it and everything its prompt is built from."""
+    payload = json.dumps(inputs, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(f"{namespace}\x00{payload}".encode("utf-8")).hexdigest()
+
+
+class BaseCheckpointStore(ABC):
+    """Base interface for stores of run checkpoints.
+
+    A run saves a checkpoint after every step and deletes it once it answers, so
+    a checkpoint found when a run starts belongs to an attempt that failed.
+    Checkpoints older than `ttl` seconds are ignored: the tools may answer
+    differently by now.
+    """
+
+    def __init__(self, ttl: float = 600) -> None:
+        self.ttl = ttl
+
+    @abstractmethod
+    def load(self, key: str) -> Optional[StepCheckpoint]:
+        """Return the checkpoint saved under `key`, None if missing or expired."""
+
+    @abstractmethod
+    def save(self, key: str, checkpoint: StepCheckpoint) -> None:
+        """Save `checkpoint`, replacing the one under `key`."""
+
+    @abstractmethod
+    def delete(self, key: str) -> None:
+        """Forget the checkpoint under `key`."""
+
+
+class InMemoryCheckpointStore(BaseCheckpointStore):
+    """Checkpoints kept in memory, at most `max_size` of them."""
+
+    def __init__(self, ttl: float = 600, max_size: int = 256) -> None:
+        super().__init__(ttl)
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._data: "OrderedDict[str, Tuple[StepCheckpoint, float]]" = OrderedDict()
+
+    def load(self, key: str) -> Optional[StepCheckpoint]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[1] + self.ttl < time.monotonic():
+                del self._data[key]
+                entry = None
+        return None if entry is None else entry[0]
+
+    def save(self, key: str, checkpoint: StepCheckpoint) -> None:
+        # a copy, the run keeps appending to its own list
+        checkpoint = StepCheckpoint(list(checkpoint.steps), checkpoint.iterations)
+        with self._lock:
+            self._data[key] = (checkpoint, time.monotonic())
+            self._data.move_to_end(key)
+            while self.max_size and len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+def _dumps_checkpoint(checkpoint: StepCheckpoint) -> str:
+    steps = [{"tool": action.tool, "tool_input": action.tool_input, "log": action.log, "observation": observation}
+             for action, observation in checkpoint.steps]
+    return json.dumps({"steps": steps, "iterations": checkpoint.iterations}, ensure_ascii=False)
+
+
+def _loads_checkpoint(value: str) -> StepCheckpoint:
+    data = json.loads(value)
+    steps = [(BotAction(step["tool"], step["tool_input"], step["log"]), step["observation"])
+             for step in data["steps"]]
+    return StepCheckpoint(steps, data["iterations"])
+
+
+class SQLiteCheckpointStore(BaseCheckpointStore):
+    """Checkpoints persisted in a SQLite database, so a run can resume after a restart."""
+
+    def __init__(self, database_path: str = ".checkpoints.db", ttl: float = 600) -> None:
+        super().__init__(ttl)
+        self.database_path = database_path
+
+        directory = os.path.dirname(os.path.abspath(database_path))
+        if database_path != ":memory:" and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(database_path, check_same_thread=False, isolation_level=None)
+        if database_path != ":memory:":
+            self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS engine_checkpoint ("
+            "  key TEXT PRIMARY KEY,"
+            "  value TEXT NOT NULL,"
+            "  updated_at REAL NOT NULL"
+            ")"
+        )
+
+    def load(self, key: str) -> Optional[StepCheckpoint]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, updated_at FROM engine_checkpoint WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and row[1] + self.ttl < time.time():
+                self._conn.execute("DELETE FROM engine_checkpoint WHERE key = ?", (key,))
+                row = None
+        return None if row is None else _loads_checkpoint(row[0])
+
+    def save(self, key: str, checkpoint: StepCheckpoint) -> None:
+        value = _dumps_checkpoint(checkpoint)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO engine_checkpoint (key, value, updated_at) VALUES (?, ?, ?)",
+                (key, value, time.time()),
+            )
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM engine_checkpoint WHERE key = ?", (key,))
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+# set to None to turn checkpoints off, or to a SQLiteCheckpointStore to keep them across restarts
+checkpoint_store: Optional[BaseCheckpointStore] = InMemoryCheckpointStore()
+
+
+def get_checkpoint_store() -> Optional[BaseCheckpointStore]:
+    """Return the store currently assigned to `checkpoint.checkpoint_store`."""
+    return checkpoint_store
@@ -0,0 +1,130 @@
+"""Incremental scratchpad of one engine run."""
+from typing import Callable, List, Optional, Sequence, Tuple
+
+from ..common.log import LOG
+from ..common.schema import BotAction
+from ..models.tokenizer import count_tokens, truncate_tokens
+
+# don't ask for summaries shorter than this, they lose too much
+MIN_SUMMARY_TOKENS = 100
+
+
+class _Step:
+    """One intermediate step rendered both ways, with the token count of each."""
+
+    __slots__ = ("action", "full", "compact", "full_tokens", "compact_tokens")
+
+    def __init__(self, action: BotAction, full: str, compact: str, model_name: str):
+        self.action = action
+        self.full = full
+        self.compact = compact
+        self.full_tokens = count_tokens(full, model_name)
+        self.compact_tokens = count_tokens(compact, model_name)
+
+
+class Scratchpad:
+    """Append-only scratchpad of the intermediate steps of one run.
+
+    Steps are rendered and counted once, when they are added. The latest reply
+    (the steps sharing the last llm output) is shown in full, earlier steps in
+    their compact form. When the scratchpad outgrows its limit the oldest steps
+    are folded into a running summary, so each step is summarized at most once.
+    """
+
+    def __init__(
+        self,
+        format_step: Callable[[BotAction, str, bool], str],
+        format_compact_step: Callable[[BotAction, str], str],
+        summarize: Callable[[str, int], str],
+        model_name: str,
+    ):
+        self.format_step = format_step
+        self.format_compact_step = format_compact_step
+        self.summarize = summarize
+        self.model_name = model_name
+
+        self._source: List[Tuple[BotAction, str]] = []
+        self._steps: List[_Step] = []
+        # steps before this index live in the summary only
+        self._folded = 0
+        self._summary = ""
+        self._summary_tokens = 0
+
+    def continues(self, intermediate_steps: Sequence[Tuple[BotAction, str]]) -> bool:
+        """Whether `intermediate_steps` extends the steps seen so far."""
+        if len(intermediate_steps) < len(self._source):
+            return False
+        return all(seen is step for seen, step in zip(self._source, intermediate_steps))
+
+    def update(self, intermediate_steps: Sequence[Tuple[BotAction, str]]) -> None:
+        """Render the steps added since the last call."""
+        for step in intermediate_steps[len(self._source):]:
+            action, observation = step
+            previous_log = self._source[-1][0].log if self._source else None
+            self._steps.append(_Step(
+                action,
+                self.format_step(action, observation, action.log != previous_log),
+                self.format_compact_step(action, observation),
+                self.model_name,
+            ))
+            self._source.append(step)
+
+    def _last_reply_start(self) -> int:
+        """Index of the first step planned by the latest llm reply."""
+        last_log = self._steps[-1].action.log
+        idx = len(self._steps) - 1
+        while idx > self._folded and self._steps[idx - 1].action.log == last_log:
+            idx -= 1
+        return idx
+
+    def _tokens(self, last_start: int, compact_last: bool) -> int:
+        tokens = self._summary_tokens
+        tokens += sum(step.compact_tokens for step in self._steps[self._folded:last_start])
+        last = self._steps[last_start:]
+        tokens += sum(step.compact_tokens if compact_last else step.full_tokens for step in last)
+        return tokens
+
+    def _fold(self, tokens: int, limit: int, last_start: int) -> None:
+        """Summarize the oldest steps into the summary, enough of them to fit `limit`.
+
+        A quarter of `limit` is freed on top, so the scratchpad isn't summarized
+        again on every iteration once it is full.
+        """
+        overflow, headroom = tokens - limit, limit // 4
+        end, freed = self._folded, 0
+        while end < last_start and freed <= overflow + headroom:
+            freed += self._steps[end].compact_tokens
+            end += 1
+        if end == self._folded:
+            return
+        LOG.info(f"scratchpad over its limit by {overflow} tokens, summarize {end - self._folded} oldest steps")
+        text = self._summary + "".join(step.compact for step in self._steps[self._folded:end])
+        kept_tokens = tokens - self._summary_tokens - freed
+        max_tokens = max(limit - headroom - kept_tokens, MIN_SUMMARY_TOKENS)
+        self._summary = f"summary of the earlier steps: {self.summarize(text, max_tokens).strip()}\n\n"
+        self._summary_tokens = count_tokens(self._summary, self.model_name)
+        self._folded = end
+
+    def render(self, limit: Optional[int] = None) -> str:
+        """The scratchpad text, compacted to stay under `limit` tokens if given."""
+        if not self._steps:
+            return ""
+        last_start = self._last_reply_start()
+        compact_last = False
+        if limit is not None:
+            tokens = self._tokens(last_start, compact_last)
+            if tokens > limit:
+                self._fold(tokens, limit, last_start)
+                tokens = self._tokens(last_start, compact_last)
+            if tokens > limit:
+                compact_last = True
+                tokens = self._tokens(last_start, compact_last)
+
+        parts = [self._summary]
+        parts.extend(step.compact for step in self._steps[self._folded:last_start])
+        parts.extend(step.compact if compact_last else step.full for step in self._steps[last_start:])
+        text = "".join(parts)
+        if limit is not None and tokens > limit:
+            # a single reply too large for the whole budget, nothing left to summarize
+            text = truncate_tokens(text, limit, self.model_name)
+        return text
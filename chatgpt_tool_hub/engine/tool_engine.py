@@ -1,5 +1,8 @@
+import asyncio
+import threading
+import time
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Sequence, Tuple, Union
 
 from pydantic import BaseModel, model_validator
 from rich.console import Console
@@ -8,11 +11,35 @@ from rich.panel import Panel
 from . import Bot
 from ..chains.base import Chain
 from ..common.callbacks import BaseCallbackManager
+from ..common.concurrency import gather_with_concurrency, get_tool_executor, map_with_concurrency
+from ..common.deadline import (
+    DeadlineExceeded,
+    await_with_deadline,
+    call_with_deadline,
+    deadline,
+    deadline_expired,
+    get_deadline,
+    remaining_time,
+)
 from ..common.input import get_color_mapping
 from ..common.log import LOG
-from ..common.schema import BotAction, BotFinish
-from ..tools.base_tool import BaseTool
+from ..common.metrics import ENGINE_ITERATIONS
+from ..common.schema import BotAction, BotFinish, StreamEvent
+from ..common.stream import (
+    STEP_START,
+    TOOL_END,
+    TOOL_START,
+    astream_events,
+    emit_final_answer,
+    emit_stream_event,
+    ensure_stream_handler,
+    listen_for_final_answer,
+    stream_events,
+)
+from ..common.tracing import get_request_id, request_context, trace_span
+from ..tools.base_tool import BaseTool, ErrorObservation
 from ..tools.tool import InvalidTool
+from .checkpoint import BaseCheckpointStore, StepCheckpoint, checkpoint_key, get_checkpoint_store
 
 
 class ToolEngine(Chain, BaseModel):
@@ -23,6 +50,22 @@ class ToolEngine(Chain, BaseModel):
     return_intermediate_steps: bool = False
     max_iterations: Optional[int] = 10
     early_stopping_method: str = "force"
+    # tools of one step the bot asked for together run at most this many at once
+    max_parallel_tools: int = 4
+    # under a request deadline, stop planning with this many seconds left (at most a
+    # quarter of the whole deadline) to answer with what the tools returned so far
+    deadline_reserve: float = 10.0
+    # a step whose llm call raises runs again up to this many times, waiting
+    # step_retry_delay seconds, doubled on each retry. A tool that raises is run
+    # again alone the same way, unless it has side effects; once it gives up, the
+    # bot gets the error as its observation
+    step_retries: int = 2
+    step_retry_delay: float = 1.0
+    # observations are checkpointed as they arrive, a run with the same inputs in the
+    # same namespace (a session) picks up where a failed one stopped. None uses the
+    # store of checkpoint.checkpoint_store
+    checkpoint_store: Optional[BaseCheckpointStore] = None
+    checkpoint_namespace: Optional[str] = None
 
     console: Console = None
 
@@ -96,10 +139,63 @@ class ToolEngine(Chain, BaseModel):
         else:
             return iterations < self.max_iterations
 
-    def _return(self, output: BotFinish, intermediate_steps: list) -> Dict[str, Any]:
+    def _out_of_time(self) -> bool:
+        current = get_deadline()
+        if current is None:
+            return False
+        return current.remaining() <= min(self.deadline_reserve, current.timeout / 4)
+
+    def _step_retry_wait(self, attempt: int, error: Exception, what: str = "step") -> Optional[float]:
+        """Seconds to wait before running a failed step (or tool) again, None to give up."""
+        if attempt >= self.step_retries or self._out_of_time():
+            return None
+        wait = self.step_retry_delay * 2 ** attempt
+        remaining = remaining_time()
+        if remaining is not None:
+            wait = min(wait, remaining / 2)
+        LOG.warning(f"{what} failed with {repr(error)}, retry {attempt + 1}/{self.step_retries} in {wait:.1f}s")
+        return wait
+
+    def _checkpoint_store(self) -> Optional[BaseCheckpointStore]:
+        return self.checkpoint_store or get_checkpoint_store()
+
+    def _checkpoint_key(self, inputs: Dict[str, str]) -> str:
+        return checkpoint_key(self.checkpoint_namespace or f"engine-{id(self):x}", inputs)
+
+    def _restore_checkpoint(self, key: str) -> Tuple[List[Tuple[BotAction, str]], int]:
+        store = self._checkpoint_store()
+        checkpoint = store.load(key) if store is not None else None
+        if checkpoint is None:
+            return [], 0
+        LOG.info(f"resume from checkpoint, {len(checkpoint.steps)} steps already done")
+        return list(checkpoint.steps), checkpoint.iterations
+
+    def _save_checkpoint(self, key: str, intermediate_steps: List[Tuple[BotAction, str]], iterations: int) -> None:
+        store = self._checkpoint_store()
+        if store is not None:
+            store.save(key, StepCheckpoint(intermediate_steps, iterations))
+
+    def _drop_checkpoint(self, key: str) -> None:
+        store = self._checkpoint_store()
+        if store is not None:
+            store.delete(key)
+
+    def _timeout_response(self, inputs: Dict[str, str], intermediate_steps: list) -> BotFinish:
+        LOG.warning(f"request deadline reached after {len(intermediate_steps)} steps, answer with what we have")
+        with listen_for_final_answer(self.bot.create_stream_parser()):
+            return self.bot.return_timeout_response(self.early_stopping_method, intermediate_steps, **inputs)
+
+    async def _atimeout_response(self, inputs: Dict[str, str], intermediate_steps: list) -> BotFinish:
+        LOG.warning(f"request deadline reached after {len(intermediate_steps)} steps, answer with what we have")
+        with listen_for_final_answer(self.bot.create_stream_parser()):
+            return await self.bot.areturn_timeout_response(self.early_stopping_method, intermediate_steps, **inputs)
+
+    def _return(self, output: BotFinish, intermediate_steps: list, iterations: int) -> Dict[str, Any]:
+        ENGINE_ITERATIONS.observe(iterations)
         self.callback_manager.on_bot_finish(
             output, color="green", verbose=self.verbose
         )
+        emit_final_answer(output.return_values.get(self.bot.return_values[0], ""))
         final_output = output.return_values
         if self.return_intermediate_steps:
             final_output["intermediate_steps"] = intermediate_steps
@@ -111,20 +207,112 @@ class ToolEngine(Chain, BaseModel):
         color_mapping: Dict[str, str],
         inputs: Dict[str, str],
         intermediate_steps: List[Tuple[BotAction, str]],
-    ) -> Union[BotFinish, Tuple[BotAction, str]]:
+        on_observation: Optional[Callable[[int, BotAction, str], None]] = None,
+    ) -> Union[BotFinish, Tuple[BotAction, str], List[Tuple[BotAction, str]]]:
         """Take a single step in the thought-action-observation loop.
 
+        Several independent actions planned together run at the same time and
+        come back as a list of (action, observation), in the order planned.
+        `on_observation` is called with each one, and the position of its action
+        in the plan, as soon as it is there.
+
         Override this to take control of how the bot makes and acts on choices.
         """
         # Call the LLM to see what to do.
-        output = self.bot.plan(intermediate_steps, **inputs)
+        with listen_for_final_answer(self.bot.create_stream_parser()):
+            output = self.bot.plan(intermediate_steps, **inputs)
         # If the tool chosen is the finishing tool, then we end and return.
         if isinstance(output, BotFinish):
             return output
 
-        self.callback_manager.on_bot_action(
-            output, verbose=self.verbose, color="green"
+        actions = output if isinstance(output, list) else [output]
+        for action in actions:
+            self.callback_manager.on_bot_action(
+                action, verbose=self.verbose, color="green"
+            )
+        if not isinstance(output, list):
+            return output, self._run_action(output, name_to_tool_map, on_observation)
+
+        LOG.info(f"并行执行工具: {[action.tool for action in actions]}")
+        semaphores = self._tool_semaphores(actions, name_to_tool_map, threading.Semaphore)
+
+        def _run(index: int) -> str:
+            action = actions[index]
+            semaphore = semaphores.get(action.tool)
+            if semaphore is None:
+                return self._run_action(action, name_to_tool_map, on_observation, index)
+            with semaphore:
+                return self._run_action(action, name_to_tool_map, on_observation, index)
+
+        observations = map_with_concurrency(
+            _run, list(range(len(actions))), self.max_parallel_tools, executor=get_tool_executor()
         )
+        return list(zip(actions, observations))
+
+    @staticmethod
+    def _tool_semaphores(
+        actions: List[BotAction], name_to_tool_map: Dict[str, BaseTool], factory: Any
+    ) -> Dict[str, Any]:
+        """A semaphore per tool of `actions` that limits its own concurrency.
+
+        Tools with side effects share one semaphore of 1: they run one after
+        another, in no particular order.
+        """
+        serial = factory(1)
+        semaphores = {}
+        for action in actions:
+            tool = name_to_tool_map.get(action.tool)
+            if tool is None or action.tool in semaphores:
+                continue
+            if tool.side_effects:
+                semaphores[action.tool] = serial
+            elif tool.max_concurrency:
+                semaphores[action.tool] = factory(max(tool.max_concurrency, 1))
+        return semaphores
+
+    def _run_action(
+        self,
+        action: BotAction,
+        name_to_tool_map: Dict[str, BaseTool],
+        on_observation: Optional[Callable[[int, BotAction, str], None]] = None,
+        index: int = 0,
+    ) -> str:
+        """Run the tool of `action`, again alone if it raises, and hand on its observation.
+
+        `index` is the position of `action` in the plan of its step.
+        """
+        attempt = 0
+        while True:
+            try:
+                observation = self._run_tool(action, name_to_tool_map)
+                break
+            except Exception as e:
+                wait = self._tool_retry_wait(action, name_to_tool_map, attempt, e)
+                if wait is None:
+                    observation = self._error_observation(action.tool, e)
+                    break
+                time.sleep(wait)
+                attempt += 1
+        if on_observation is not None:
+            on_observation(index, action, observation)
+        return observation
+
+    def _tool_retry_wait(
+        self, action: BotAction, name_to_tool_map: Dict[str, BaseTool], attempt: int, error: Exception
+    ) -> Optional[float]:
+        tool = name_to_tool_map.get(action.tool)
+        if tool is not None and tool.side_effects:
+            # it may have done part of its work, running it again is the bot's call
+            return None
+        return self._step_retry_wait(attempt, error, what=f"tool {action.tool}")
+
+    @staticmethod
+    def _error_observation(tool_name: str, error: Exception) -> str:
+        LOG.error(f"tool {tool_name} failed: {repr(error)}")
+        return ErrorObservation(f"{tool_name} failed: {repr(error)}")
+
+    def _run_tool(self, output: BotAction, name_to_tool_map: Dict[str, BaseTool]) -> str:
+        """Call the tool of `output` and return its observation."""
         # Otherwise we lookup the tool
         if output.tool in name_to_tool_map:
             if self.console:
@@ -133,24 +321,29 @@ class ToolEngine(Chain, BaseModel):
                                         highlight=True))
             
             LOG.info(f"我将给工具发送如下信息: \n{output.tool_input}")
+            emit_stream_event(TOOL_START, {"tool": output.tool, "input": output.tool_input})
             tool = name_to_tool_map[output.tool]
             return_direct = tool.return_direct
             # color = color_mapping[output.tool]
             llm_prefix = "" if return_direct else self.bot.llm_prefix
             # We then call the tool on the tool input to get an observation
-            observation = tool.run(
-                output.tool_input,
-                verbose=self.verbose,
-                color=None,
-                llm_prefix=llm_prefix,
-                observation_prefix=self.bot.observation_prefix,
-            )
+            try:
+                observation = call_with_deadline(
+                    tool.run,
+                    output.tool_input,
+                    verbose=self.verbose,
+                    color=None,
+                    llm_prefix=llm_prefix,
+                    observation_prefix=self.bot.observation_prefix,
+                )
+            except DeadlineExceeded:
+                observation = self._deadline_observation(output.tool)
         else:
             if self.console:
                 self.console.print(f"× 该工具 [bright_magenta]{output.tool}[/] 无效")
             
             LOG.info(f"该工具 {output.tool} 无效")
-            observation = InvalidTool().run(
+            observation = InvalidTool(console=self.console).run(
                 output.tool,
                 verbose=self.verbose,
                 color=None,
@@ -163,10 +356,23 @@ class ToolEngine(Chain, BaseModel):
                                     highlight=True, style='dim'))
         
         LOG.info(f"工具 {output.tool} 返回内容: {observation}")
-        return output, observation
+        emit_stream_event(TOOL_END, {"tool": output.tool, "observation": observation})
+        return observation
+
+    @staticmethod
+    def _deadline_observation(tool_name: str) -> str:
+        LOG.warning(f"tool {tool_name} didn't return before the request deadline")
+        return f"{tool_name} did not return before the request deadline."
 
     def _call(self, inputs: Dict[str, str]) -> Dict[str, Any]:
-        """Run text through and get bot response."""
+        """Run text through and get bot response, resuming the checkpoint of a failed attempt."""
+        key = self._checkpoint_key(inputs)
+        outputs = self._run_steps(inputs, key)
+        # answered, nothing left to resume
+        self._drop_checkpoint(key)
+        return outputs
+
+    def _run_steps(self, inputs: Dict[str, str], key: str) -> Dict[str, Any]:
         # Do any preparation necessary when receiving a new input.
         self.bot.prepare_for_new_call()
         # Construct a mapping of tool name to tool for easy lookup
@@ -175,38 +381,99 @@ class ToolEngine(Chain, BaseModel):
         color_mapping = get_color_mapping(
             [tool.name for tool in self.tools], excluded_colors=["green"]
         )
-        intermediate_steps: List[Tuple[BotAction, str]] = []
         # Let's start tracking the iterations the bot has gone through
-        iterations = 0
+        intermediate_steps, iterations = self._restore_checkpoint(key)
         # We now enter the bot loop (until it returns something).
         while self._should_continue(iterations):
             # LOG.debug("CoT 迭代次数: {}\n".format(str(iterations+1)))
-            next_step_output = self._take_next_step(
-                name_to_tool_map,
-                color_mapping,
-                inputs, intermediate_steps
-            )
+            if self._out_of_time():
+                return self._return(self._timeout_response(inputs, intermediate_steps), intermediate_steps, iterations)
+            emit_stream_event(STEP_START, {"iteration": iterations + 1}, step=iterations + 1)
+            on_observation, observed_steps = self._observation_checkpointer(key, intermediate_steps, iterations)
+            attempt = 0
+            while True:
+                try:
+                    with trace_span("engine.step", iteration=iterations + 1, attempt=attempt + 1):
+                        next_step_output = self._take_next_step(
+                            name_to_tool_map,
+                            color_mapping,
+                            inputs, intermediate_steps,
+                            on_observation=on_observation,
+                        )
+                    break
+                except Exception as e:
+                    # the llm call of this step was cut short by the deadline
+                    if deadline_expired():
+                        LOG.debug(f"step {iterations + 1} interrupted: {repr(e)}")
+                        intermediate_steps.extend(observed_steps())
+                        output = self._timeout_response(inputs, intermediate_steps)
+                        return self._return(output, intermediate_steps, iterations + 1)
+                    observed = observed_steps()
+                    if observed:
+                        # tools already ran, keep what they returned instead of running them again
+                        LOG.warning(f"step {iterations + 1} failed after its tools ran: {repr(e)}")
+                        next_step_output = observed
+                        break
+                    wait = self._step_retry_wait(attempt, e)
+                    if wait is None:
+                        raise
+                    time.sleep(wait)
+                    attempt += 1
             if isinstance(next_step_output, BotFinish):
-                return self._return(next_step_output, intermediate_steps)
+                return self._return(next_step_output, intermediate_steps, iterations + 1)
 
+            next_steps = next_step_output if isinstance(next_step_output, list) else [next_step_output]
             # todo test below
             try:
-                action, observation = next_step_output
-                LOG.info(f"我从[{action.tool}]中获得了一些信息：\n{repr(observation.strip())}")
+                for action, observation in next_steps:
+                    LOG.info(f"我从[{action.tool}]中获得了一些信息：\n{repr(observation.strip())}")
             except Exception as e:
                 LOG.debug(f"parsing next_step_output error: {repr(e)}")
 
-            intermediate_steps.append(next_step_output)
+            intermediate_steps.extend(next_steps)
+            self._save_checkpoint(key, intermediate_steps, iterations + 1)
             # See if tool should return directly
-            tool_return = self._get_tool_return(next_step_output)
+            tool_return = self._get_steps_return(next_steps)
             if tool_return is not None:
-                return self._return(tool_return, intermediate_steps)
+                return self._return(tool_return, intermediate_steps, iterations + 1)
             iterations += 1
         # 超出迭代次数
-        output = self.bot.return_stopped_response(
-            self.early_stopping_method, intermediate_steps, self.max_iterations, **inputs
-        )
-        return self._return(output, intermediate_steps)
+        if self._out_of_time():
+            return self._return(self._timeout_response(inputs, intermediate_steps), intermediate_steps, iterations)
+        with listen_for_final_answer(self.bot.create_stream_parser()):
+            output = self.bot.return_stopped_response(
+                self.early_stopping_method, intermediate_steps, self.max_iterations, **inputs
+            )
+        return self._return(output, intermediate_steps, iterations)
+
+    def _observation_checkpointer(
+        self, key: str, intermediate_steps: List[Tuple[BotAction, str]], iterations: int
+    ) -> Tuple[Callable[[int, BotAction, str], None], Callable[[], List[Tuple[BotAction, str]]]]:
+        """A callback checkpointing each observation of a step as it arrives, and a
+        function returning those observed so far, in the order planned."""
+        observed: Dict[int, Tuple[BotAction, str]] = {}
+        lock = threading.Lock()
+
+        def observed_steps() -> List[Tuple[BotAction, str]]:
+            with lock:
+                return [observed[i] for i in sorted(observed)]
+
+        def on_observation(index: int, action: BotAction, observation: str) -> None:
+            with lock:
+                observed[index] = (action, observation)
+                steps = [observed[i] for i in sorted(observed)]
+                # the step isn't done, a resumed run plans it again seeing these
+                self._save_checkpoint(key, intermediate_steps + steps, iterations)
+
+        return on_observation, observed_steps
+
+    def _get_steps_return(self, next_steps: List[Tuple[BotAction, str]]) -> Optional[BotFinish]:
+        """The first of `next_steps` whose tool returns directly, if any."""
+        for next_step in next_steps:
+            tool_return = self._get_tool_return(next_step)
+            if tool_return is not None:
+                return tool_return
+        return None
 
     def _get_tool_return(
         self, next_step_output: Tuple[BotAction, str]
@@ -226,7 +493,13 @@ class ToolEngine(Chain, BaseModel):
         return None
 
     async def _acall(self, inputs: Dict[str, str]) -> Dict[str, str]:
-        """Run text through and get bot response."""
+        """Async version of `_call`."""
+        key = self._checkpoint_key(inputs)
+        outputs = await self._arun_steps(inputs, key)
+        self._drop_checkpoint(key)
+        return outputs
+
+    async def _arun_steps(self, inputs: Dict[str, str], key: str) -> Dict[str, str]:
         # Do any preparation necessary when receiving a new input.
         self.bot.prepare_for_new_call()
         # Construct a mapping of tool name to tool for easy lookup
@@ -235,28 +508,60 @@ class ToolEngine(Chain, BaseModel):
         color_mapping = get_color_mapping(
             [tool.name for tool in self.tools], excluded_colors=["green"]
         )
-        intermediate_steps: List[Tuple[BotAction, str]] = []
         # Let's start tracking the iterations the bot has gone through
-        iterations = 0
+        intermediate_steps, iterations = self._restore_checkpoint(key)
         # We now enter the bot loop (until it returns something).
         while self._should_continue(iterations):
-            next_step_output = await self._atake_next_step(
-                name_to_tool_map, color_mapping, inputs, intermediate_steps
-            )
+            if self._out_of_time():
+                output = await self._atimeout_response(inputs, intermediate_steps)
+                return await self._areturn(output, intermediate_steps, iterations)
+            emit_stream_event(STEP_START, {"iteration": iterations + 1}, step=iterations + 1)
+            on_observation, observed_steps = self._observation_checkpointer(key, intermediate_steps, iterations)
+            attempt = 0
+            while True:
+                try:
+                    with trace_span("engine.step", iteration=iterations + 1, attempt=attempt + 1):
+                        next_step_output = await self._atake_next_step(
+                            name_to_tool_map, color_mapping, inputs, intermediate_steps,
+                            on_observation=on_observation,
+                        )
+                    break
+                except Exception as e:
+                    if deadline_expired():
+                        LOG.debug(f"step {iterations + 1} interrupted: {repr(e)}")
+                        intermediate_steps.extend(observed_steps())
+                        output = await self._atimeout_response(inputs, intermediate_steps)
+                        return await self._areturn(output, intermediate_steps, iterations + 1)
+                    observed = observed_steps()
+                    if observed:
+                        LOG.warning(f"step {iterations + 1} failed after its tools ran: {repr(e)}")
+                        next_step_output = observed
+                        break
+                    wait = self._step_retry_wait(attempt, e)
+                    if wait is None:
+                        raise
+                    await asyncio.sleep(wait)
+                    attempt += 1
             if isinstance(next_step_output, BotFinish):
-                return await self._areturn(next_step_output, intermediate_steps)
+                return await self._areturn(next_step_output, intermediate_steps, iterations + 1)
 
-            intermediate_steps.append(next_step_output)
+            next_steps = next_step_output if isinstance(next_step_output, list) else [next_step_output]
+            intermediate_steps.extend(next_steps)
+            self._save_checkpoint(key, intermediate_steps, iterations + 1)
             # See if tool should return directly
-            tool_return = self._get_tool_return(next_step_output)
+            tool_return = self._get_steps_return(next_steps)
             if tool_return is not None:
-                return await self._areturn(tool_return, intermediate_steps)
+                return await self._areturn(tool_return, intermediate_steps, iterations + 1)
 
             iterations += 1
-        output = self.bot.return_stopped_response(
-            self.early_stopping_method, intermediate_steps, self.max_iterations, **inputs
-        )
-        return await self._areturn(output, intermediate_steps)
+        if self._out_of_time():
+            output = await self._atimeout_response(inputs, intermediate_steps)
+            return await self._areturn(output, intermediate_steps, iterations)
+        with listen_for_final_answer(self.bot.create_stream_parser()):
+            output = await self.bot.areturn_stopped_response(
+                self.early_stopping_method, intermediate_steps, self.max_iterations, **inputs
+            )
+        return await self._areturn(output, intermediate_steps, iterations)
 
     async def _atake_next_step(
         self,
@@ -264,53 +569,109 @@ class ToolEngine(Chain, BaseModel):
         color_mapping: Dict[str, str],
         inputs: Dict[str, str],
         intermediate_steps: List[Tuple[BotAction, str]],
-    ) -> Union[BotFinish, Tuple[BotAction, str]]:
+        on_observation: Optional[Callable[[int, BotAction, str], None]] = None,
+    ) -> Union[BotFinish, Tuple[BotAction, str], List[Tuple[BotAction, str]]]:
         """Take a single step in the thought-action-observation loop.
 
         Override this to take control of how the bot makes and acts on choices.
         """
         # Call the LLM to see what to do.
-        output = await self.bot.aplan(intermediate_steps, **inputs)
+        with listen_for_final_answer(self.bot.create_stream_parser()):
+            output = await self.bot.aplan(intermediate_steps, **inputs)
         # If the tool chosen is the finishing tool, then we end and return.
         if isinstance(output, BotFinish):
             return output
-        if self.callback_manager.is_async:
-            await self.callback_manager.on_bot_action(
-                output, verbose=self.verbose, color="green"
-            )
-        else:
-            self.callback_manager.on_bot_action(
-                output, verbose=self.verbose, color="green"
-            )
 
+        actions = output if isinstance(output, list) else [output]
+        for action in actions:
+            if self.callback_manager.is_async:
+                await self.callback_manager.on_bot_action(
+                    action, verbose=self.verbose, color="green"
+                )
+            else:
+                self.callback_manager.on_bot_action(
+                    action, verbose=self.verbose, color="green"
+                )
+        if not isinstance(output, list):
+            return output, await self._arun_action(output, name_to_tool_map, color_mapping, on_observation)
+
+        semaphores = self._tool_semaphores(actions, name_to_tool_map, asyncio.Semaphore)
+
+        async def _run(index: int) -> str:
+            action = actions[index]
+            semaphore = semaphores.get(action.tool)
+            if semaphore is None:
+                return await self._arun_action(action, name_to_tool_map, color_mapping, on_observation, index)
+            async with semaphore:
+                return await self._arun_action(action, name_to_tool_map, color_mapping, on_observation, index)
+
+        observations = await gather_with_concurrency(
+            [_run(index) for index in range(len(actions))], self.max_parallel_tools
+        )
+        return list(zip(actions, observations))
+
+    async def _arun_action(
+        self,
+        action: BotAction,
+        name_to_tool_map: Dict[str, BaseTool],
+        color_mapping: Dict[str, str],
+        on_observation: Optional[Callable[[int, BotAction, str], None]] = None,
+        index: int = 0,
+    ) -> str:
+        """Async version of `_run_action`."""
+        attempt = 0
+        while True:
+            try:
+                observation = await self._arun_tool(action, name_to_tool_map, color_mapping)
+                break
+            except Exception as e:
+                wait = self._tool_retry_wait(action, name_to_tool_map, attempt, e)
+                if wait is None:
+                    observation = self._error_observation(action.tool, e)
+                    break
+                await asyncio.sleep(wait)
+                attempt += 1
+        if on_observation is not None:
+            on_observation(index, action, observation)
+        return observation
+
+    async def _arun_tool(
+        self, output: BotAction, name_to_tool_map: Dict[str, BaseTool], color_mapping: Dict[str, str]
+    ) -> str:
+        """Async version of `_run_tool`."""
         # Otherwise we lookup the tool
         if output.tool in name_to_tool_map:
             tool = name_to_tool_map[output.tool]
             return_direct = tool.return_direct
             color = color_mapping[output.tool]
             llm_prefix = "" if return_direct else self.bot.llm_prefix
+            emit_stream_event(TOOL_START, {"tool": output.tool, "input": output.tool_input})
             # We then call the tool on the tool input to get an observation
-            observation = await tool.arun(
-                output.tool_input,
-                verbose=self.verbose,
-                color=color,
-                llm_prefix=llm_prefix,
-                observation_prefix=self.bot.observation_prefix,
-            )
+            try:
+                observation = await await_with_deadline(tool.arun(
+                    output.tool_input,
+                    verbose=self.verbose,
+                    color=color,
+                    llm_prefix=llm_prefix,
+                    observation_prefix=self.bot.observation_prefix,
+                ))
+            except DeadlineExceeded:
+                observation = self._deadline_observation(output.tool)
         else:
-            observation = await InvalidTool().arun(
+            observation = await InvalidTool(console=self.console).arun(
                 output.tool,
                 verbose=self.verbose,
                 color=None,
                 llm_prefix="",
                 observation_prefix=self.bot.observation_prefix,
             )
-            return_direct = False
-        return output, observation
+        emit_stream_event(TOOL_END, {"tool": output.tool, "observation": observation})
+        return observation
 
     async def _areturn(
-        self, output: BotFinish, intermediate_steps: list
+        self, output: BotFinish, intermediate_steps: list, iterations: int
     ) -> Dict[str, Any]:
+        ENGINE_ITERATIONS.observe(iterations)
         if self.callback_manager.is_async:
             await self.callback_manager.on_bot_finish(
                 output, color="green", verbose=self.verbose
@@ -319,11 +680,37 @@ class ToolEngine(Chain, BaseModel):
             self.callback_manager.on_bot_finish(
                 output, color="green", verbose=self.verbose
             )
+        emit_final_answer(output.return_values.get(self.bot.return_values[0], ""))
         final_output = output.return_values
         if self.return_intermediate_steps:
             final_output["intermediate_steps"] = intermediate_steps
         return final_output
 
+    def _run_with_deadline(self, inputs: Union[Dict[str, Any], Any], timeout: Optional[float]) -> Any:
+        # set here, in the stream's worker thread, not in the generator: there it
+        # would stay set in the consumer between events
+        with request_context(get_request_id()), deadline(timeout):
+            return self(inputs)
+
+    def stream(self, inputs: Union[Dict[str, Any], Any], timeout: Optional[float] = None) -> Iterator[StreamEvent]:
+        """Run the engine and yield its progress as StreamEvents.
+
+        Events are step_start, tool_start, tool_end, token (final-answer text as the
+        llm generates it, the tokens concatenated give the answer) and a closing final.
+        The run happens in a worker thread; closing the generator early stops it at
+        the next event. `timeout` puts the run under a request deadline.
+        """
+        ensure_stream_handler(self.bot.llm_chain.llm.callback_manager)
+        return stream_events(lambda: self._run_with_deadline(inputs, timeout))
+
+    async def astream(
+        self, inputs: Union[Dict[str, Any], Any], timeout: Optional[float] = None
+    ) -> AsyncIterator[StreamEvent]:
+        """Async version of `stream`, the engine still runs in a worker thread."""
+        ensure_stream_handler(self.bot.llm_chain.llm.callback_manager)
+        async for event in astream_events(lambda: self._run_with_deadline(inputs, timeout)):
+            yield event
+
     def get_tool_list(self) -> List[str]:
         _tool_list = []
         for tool in self.tools:
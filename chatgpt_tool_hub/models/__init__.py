@@ -9,10 +9,17 @@ from ..common.utils import get_from_dict_or_env
 verbose: bool = False
 llm_cache: Optional[BaseCache] = None
 
+
+def get_llm_cache() -> Optional[BaseCache]:
+    """Return the cache currently assigned to `models.llm_cache`."""
+    return llm_cache
+
+
 # default model
 DEFAULT_MODEL_NAME = "gpt-3.5-turbo-16k"
 
-# token manage strategy
+# token manage strategy, fallbacks only: bots and apps size their prompts
+# from the model's context window with models.token_budget
 ALL_MAX_TOKENS_NUM = 4000
 BOT_PROMPT = 1000
 MEMORY_MAX_TOKENS_NUM = 600
@@ -38,23 +45,31 @@ def list_openai_models(api_key: str):
         LOG.error(f"(list_openai_models) Error calling OpenAI API: {e}")
         return None
 
+def _set_env(key: str, value) -> None:
+    # os.environ writes go through putenv, skip the ones that change nothing
+    value = str(value)
+    if os.environ.get(key) != value:
+        os.environ[key] = value
+
+
 def build_model_params(kwargs: dict) -> dict:
     _api_key = get_from_dict_or_env(kwargs, "llm_api_key", "LLM_API_KEY")
     _proxy = get_from_dict_or_env(kwargs, "proxy", "PROXY", "")
     _model = get_from_dict_or_env(kwargs, "model_name", "MODEL_NAME", DEFAULT_MODEL_NAME)
-    _timeout = get_from_dict_or_env(kwargs, "request_timeout", "REQUEST_TIMEOUT", 120)
+    # env values are strings, normalize so equal settings compare equal
+    _timeout = int(float(get_from_dict_or_env(kwargs, "request_timeout", "REQUEST_TIMEOUT", 120)))
     _llm_api_base_url = get_from_dict_or_env(kwargs, "llm_api_base_url", "LLM_API_BASE_URL", openai_default_api_base)
     _deployment_id = get_from_dict_or_env(kwargs, "deployment_id", "DEPLOYMENT_ID", "")
 
     # tool llm need them
-    os.environ["LLM_API_KEY"] = str(_api_key)
+    _set_env("LLM_API_KEY", _api_key)
     if _proxy and not _proxy.startswith("http://") and not _proxy.startswith("https://"):
         _proxy = "http://" + _proxy
-    os.environ["PROXY"] = str(_proxy)
-    os.environ["MODEL_NAME"] = str(_model)
-    os.environ["REQUEST_TIMEOUT"] = str(_timeout)
-    os.environ["LLM_API_BASE_URL"] = str(_llm_api_base_url)
-    os.environ["DEPLOYMENT_ID"] = str(_deployment_id)
+    _set_env("PROXY", _proxy)
+    _set_env("MODEL_NAME", _model)
+    _set_env("REQUEST_TIMEOUT", _timeout)
+    _set_env("LLM_API_BASE_URL", _llm_api_base_url)
+    _set_env("DEPLOYMENT_ID", _deployment_id)
 
     model_params_dict = {
         "llm_api_key": _api_key,
@@ -63,10 +78,18 @@ def build_model_params(kwargs: dict) -> dict:
         "top_p": 1,
         "frequency_penalty": 0.0,  # [-2,2]之间，该值越大则更倾向于产生不同的内容
         "presence_penalty": 0.0,  # [-2,2]之间，该值越大则更倾向于产生不同的内容
-        "temperature": get_from_dict_or_env(kwargs, "temperature", "TEMPERATURE", 0),
+        "temperature": float(get_from_dict_or_env(kwargs, "temperature", "TEMPERATURE", 0)),
         "proxy": _proxy,
         "request_timeout": _timeout,
-        "max_retries": 2
+        "max_retries": 2,
+        "max_concurrency": int(get_from_dict_or_env(kwargs, "llm_max_concurrency", "LLM_MAX_CONCURRENCY", 4)),
+        "max_connections": int(get_from_dict_or_env(kwargs, "llm_max_connections", "LLM_MAX_CONNECTIONS", 10)),
+        "connect_timeout": float(get_from_dict_or_env(kwargs, "llm_connect_timeout", "LLM_CONNECT_TIMEOUT", 10)),
+        "rate_limit_rpm": int(get_from_dict_or_env(kwargs, "llm_rate_limit_rpm", "LLM_RATE_LIMIT_RPM", 0)),
+        "rate_limit_tpm": int(get_from_dict_or_env(kwargs, "llm_rate_limit_tpm", "LLM_RATE_LIMIT_TPM", 0)),
+        # list or json string of endpoints, see models.router.parse_endpoints
+        "endpoints": get_from_dict_or_env(kwargs, "llm_endpoints", "LLM_ENDPOINTS", "") or None,
+        "hedge_requests": str(get_from_dict_or_env(kwargs, "llm_hedge_requests", "LLM_HEDGE_REQUESTS", False)).lower() == "true",
     }
 
     if _deployment_id:
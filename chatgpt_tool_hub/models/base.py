@@ -9,8 +9,9 @@ from pydantic import BaseModel, Field, field_validator
 
 from ..common.callbacks import BaseCallbackManager
 from ..common.callbacks import get_callback_manager
+from ..common.metrics import LLM_CACHE_LOOKUPS
 from ..common.schema import BaseLanguageModel, Generation, LLMResult, PromptValue
-from . import llm_cache
+from . import get_llm_cache
 
 
 def _get_verbosity() -> bool:
@@ -25,6 +26,7 @@ def get_prompts(
     missing_prompts = []
     missing_prompt_idxs = []
     existing_prompts = {}
+    llm_cache = get_llm_cache()
     for i, prompt in enumerate(prompts):
         if llm_cache is not None:
             cache_val = llm_cache.lookup(prompt, llm_string)
@@ -33,6 +35,9 @@ def get_prompts(
             else:
                 missing_prompts.append(prompt)
                 missing_prompt_idxs.append(i)
+    if llm_cache is not None:
+        LLM_CACHE_LOOKUPS.inc(len(existing_prompts), result="hit")
+        LLM_CACHE_LOOKUPS.inc(len(missing_prompts), result="miss")
     return existing_prompts, llm_string, missing_prompt_idxs, missing_prompts
 
 
@@ -44,6 +49,7 @@ def update_cache(
     prompts: List[str],
 ) -> Optional[dict]:
     """Update the cache and get the LLM output."""
+    llm_cache = get_llm_cache()
     for i, result in enumerate(new_results.generations):
         existing_prompts[missing_prompt_idxs[i]] = result
         prompt = prompts[missing_prompt_idxs[i]]
@@ -121,7 +127,7 @@ class BaseLLM(BaseLanguageModel, BaseModel, ABC):
                 f" argument of type {type(prompts)}."
             )
         disregard_cache = self.cache is not None and not self.cache
-        if llm_cache is None or disregard_cache:
+        if get_llm_cache() is None or disregard_cache:
             # This happens when lib.cache is None, but self.cache is True
             if self.cache is not None and self.cache:
                 raise ValueError(
@@ -168,7 +174,7 @@ class BaseLLM(BaseLanguageModel, BaseModel, ABC):
     ) -> LLMResult:
         """Run the LLM on the given prompt and input."""
         disregard_cache = self.cache is not None and not self.cache
-        if llm_cache is None or disregard_cache:
+        if get_llm_cache() is None or disregard_cache:
             # This happens when lib.cache is None, but self.cache is True
             if self.cache is not None and self.cache:
                 raise ValueError(
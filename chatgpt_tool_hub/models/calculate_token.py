@@ -1,17 +1,11 @@
 from ..common.log import LOG
 from . import DEFAULT_MODEL_NAME
+from .tokenizer import count_tokens, count_tokens_batch
 
 # refer to https://github.com/openai/openai-cookbook/blob/main/examples/How_to_count_tokens_with_tiktoken.ipynb
 
 def count_message_tokens(messages, model=DEFAULT_MODEL_NAME):
-    import tiktoken
-
     """Return the number of tokens used by a list of messages."""
-    try:
-        encoding = tiktoken.encoding_for_model(model)
-    except KeyError:
-        LOG.debug("Warning: model not found. Using cl100k_base encoding.")
-        encoding = tiktoken.get_encoding("cl100k_base")
     if model in {
         "gpt-3.5-turbo-0613",
         "gpt-3.5-turbo-16k-0613",
@@ -36,12 +30,14 @@ def count_message_tokens(messages, model=DEFAULT_MODEL_NAME):
             f"""num_tokens_from_messages() is not implemented for model {model}. See https://github.com/openai/openai-python/blob/main/chatml.md for information on how messages are converted to tokens."""
         )
     num_tokens = 0
+    values = []
     for message in messages:
         num_tokens += tokens_per_message
         for key, value in message.items():
-            num_tokens += len(encoding.encode(value))
+            values.append(value)
             if key == "name":
                 num_tokens += tokens_per_name
+    num_tokens += sum(count_tokens_batch(values, model))
     num_tokens += 3  # every reply is primed with <|start|>assistant<|message|>
     return num_tokens
 
@@ -57,7 +53,4 @@ def count_string_tokens(string: str, model_name: str = DEFAULT_MODEL_NAME) -> in
     Returns:
     int: The number of tokens in the text string.
     """
-    import tiktoken
-
-    encoding = tiktoken.encoding_for_model(model_name)
-    return len(encoding.encode(string))
+    return count_tokens(string, model_name)
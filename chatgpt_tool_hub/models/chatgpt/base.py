@@ -1,10 +1,14 @@
+import json
 from abc import ABC, abstractmethod
-from typing import List, Optional
+from typing import Any, List, Mapping, Optional, Tuple
 
 from pydantic import BaseModel, Field, field_validator
 
+from .. import get_llm_cache
 from ...common.callbacks import BaseCallbackManager
 from ...common.callbacks import get_callback_manager
+from ...common.concurrency import gather_with_concurrency, map_with_concurrency
+from ...common.metrics import LLM_CACHE_LOOKUPS
 from ...common.schema import (
     AIMessage,
     BaseLanguageModel,
@@ -14,6 +18,7 @@ from ...common.schema import (
     HumanMessage,
     LLMResult,
     PromptValue,
+    messages_to_dict,
 )
 
 
@@ -22,8 +27,11 @@ def _get_verbosity() -> bool:
 
 
 class BaseChatModel(BaseLanguageModel, BaseModel, ABC):
+    cache: Optional[bool] = None
     verbose: bool = Field(default_factory=_get_verbosity)
     """Whether to print out response text."""
+    max_concurrency: int = Field(default=4)
+    """Maximum number of message lists generated at the same time in one batch."""
     callback_manager: BaseCallbackManager = Field(default_factory=get_callback_manager, validate_default=True)
 
     class Config:
@@ -49,7 +57,14 @@ class BaseChatModel(BaseLanguageModel, BaseModel, ABC):
         self, messages: List[List[BaseMessage]], stop: Optional[List[str]] = None
     ) -> LLMResult:
         """Top Level call"""
-        results = [self._generate(m, stop=stop) for m in messages]
+        if not self._use_cache():
+            results = self._generate_batch(messages, stop=stop)
+        else:
+            results, llm_string, missing_idxs = self._lookup_cache(messages, stop)
+            new_results = self._generate_batch([messages[i] for i in missing_idxs], stop=stop)
+            for i, result in zip(missing_idxs, new_results):
+                results[i] = result
+            self._update_cache(messages, llm_string, missing_idxs, results)
         llm_output = self._combine_llm_outputs([res.llm_output for res in results])
         generations = [res.generations for res in results]
         return LLMResult(generations=generations, llm_output=llm_output)
@@ -58,11 +73,86 @@ class BaseChatModel(BaseLanguageModel, BaseModel, ABC):
         self, messages: List[List[BaseMessage]], stop: Optional[List[str]] = None
     ) -> LLMResult:
         """Top Level call"""
-        results = [await self._agenerate(m, stop=stop) for m in messages]
+        if not self._use_cache():
+            results = await self._agenerate_batch(messages, stop=stop)
+        else:
+            results, llm_string, missing_idxs = self._lookup_cache(messages, stop)
+            new_results = await self._agenerate_batch([messages[i] for i in missing_idxs], stop=stop)
+            for i, result in zip(missing_idxs, new_results):
+                results[i] = result
+            self._update_cache(messages, llm_string, missing_idxs, results)
         llm_output = self._combine_llm_outputs([res.llm_output for res in results])
         generations = [res.generations for res in results]
         return LLMResult(generations=generations, llm_output=llm_output)
 
+    def _generate_batch(
+        self, messages: List[List[BaseMessage]], stop: Optional[List[str]] = None
+    ) -> List[ChatResult]:
+        """Run _generate over a batch on the shared thread pool, keeping input order."""
+        return map_with_concurrency(
+            lambda m: self._generate(m, stop=stop), messages, self.max_concurrency
+        )
+
+    async def _agenerate_batch(
+        self, messages: List[List[BaseMessage]], stop: Optional[List[str]] = None
+    ) -> List[ChatResult]:
+        """Run _agenerate over a batch concurrently, keeping input order."""
+        if len(messages) <= 1:
+            return [await self._agenerate(m, stop=stop) for m in messages]
+        return await gather_with_concurrency(
+            (self._agenerate(m, stop=stop) for m in messages), self.max_concurrency
+        )
+
+    def _use_cache(self) -> bool:
+        """Whether `models.llm_cache` should be consulted for this call."""
+        if self.cache is not None and not self.cache:
+            return False
+        if get_llm_cache() is None:
+            if self.cache:
+                raise ValueError("Asked to cache, but no cache found at `models.llm_cache`.")
+            return False
+        return True
+
+    def _get_llm_string(self, stop: Optional[List[str]] = None) -> str:
+        params = dict(self._identifying_params)
+        params["stop"] = stop
+        return str(sorted(params.items()))
+
+    @staticmethod
+    def _get_prompt_key(messages: List[BaseMessage]) -> str:
+        return json.dumps(messages_to_dict(messages), ensure_ascii=False, sort_keys=True)
+
+    def _lookup_cache(
+        self, messages: List[List[BaseMessage]], stop: Optional[List[str]] = None
+    ) -> Tuple[List[Optional[ChatResult]], str, List[int]]:
+        """Get results that are already cached, and the indexes of those missing."""
+        llm_cache = get_llm_cache()
+        llm_string = self._get_llm_string(stop)
+        results: List[Optional[ChatResult]] = []
+        missing_idxs = []
+        for i, m in enumerate(messages):
+            cache_val = llm_cache.lookup(self._get_prompt_key(m), llm_string)
+            if isinstance(cache_val, list):
+                # cached results carry no token usage, they cost nothing
+                results.append(ChatResult(generations=cache_val, llm_output=None))
+            else:
+                results.append(None)
+                missing_idxs.append(i)
+        LLM_CACHE_LOOKUPS.inc(len(messages) - len(missing_idxs), result="hit")
+        LLM_CACHE_LOOKUPS.inc(len(missing_idxs), result="miss")
+        return results, llm_string, missing_idxs
+
+    def _update_cache(
+        self,
+        messages: List[List[BaseMessage]],
+        llm_string: str,
+        missing_idxs: List[int],
+        results: List[ChatResult],
+    ) -> None:
+        llm_cache = get_llm_cache()
+        for i in missing_idxs:
+            llm_cache.update(self._get_prompt_key(messages[i]), llm_string, results[i].generations)
+
     def generate_prompt(
         self, prompts: List[PromptValue], stop: Optional[List[str]] = None
     ) -> LLMResult:
@@ -118,6 +208,11 @@ class BaseChatModel(BaseLanguageModel, BaseModel, ABC):
     ) -> ChatResult:
         """Top Level call"""
 
+    @property
+    def _identifying_params(self) -> Mapping[str, Any]:
+        """Get the identifying parameters."""
+        return {}
+
     def __call__(
         self, messages: List[BaseMessage], stop: Optional[List[str]] = None
     ) -> BaseMessage:
@@ -1,23 +1,25 @@
 """OpenAI chatgpt wrapper."""
 from __future__ import annotations
 
-import logging
 import sys
-from typing import Any, Callable, Dict, List, Mapping, Optional, Tuple
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Mapping, Optional, Tuple
 
 from pydantic import BaseModel, Field, model_validator
-from tenacity import (
-    before_sleep_log,
-    retry,
-    retry_if_exception_type,
-    stop_after_attempt,
-    wait_exponential,
-)
 
 from .base import BaseChatModel
+from .http_client import get_chat_completion_client
 from .. import DEFAULT_MODEL_NAME
+from ..calculate_token import count_message_tokens
+from ..tokenizer import count_tokens
+from ..rate_limiter import RateLimiter, get_rate_limiter
+from ..retry import RetryPolicy, retry_metrics
+from ..router import get_endpoint_router, parse_endpoints
 from ...common.constants import openai_default_api_base
+from ...common.deadline import bound_timeout
 from ...common.log import LOG
+from ...common.metrics import LLM_REQUEST_SECONDS, LLM_REQUESTS, LLM_TOKENS
 from ...common.schema import (
     AIMessage,
     BaseMessage,
@@ -27,41 +29,34 @@ from ...common.schema import (
     HumanMessage,
     SystemMessage,
 )
+from ...common.stream import streaming_requested
 from ...common.utils import get_from_dict_or_env
 
 
-def _create_retry_decorator(llm: ChatOpenAI) -> Callable[[Any], Any]:
-    import openai
-
-    min_seconds = 15
-    max_seconds = 30
-    # Wait 2^x * 1 second between each retry starting with
-    # 4 seconds, then up to 10 seconds, then 10 seconds afterwards
-    return retry(
-        reraise=True,
-        stop=stop_after_attempt(llm.max_retries),
-        wait=wait_exponential(multiplier=1, min=min_seconds, max=max_seconds),
-        retry=(
-            retry_if_exception_type(openai.error.Timeout)
-            | retry_if_exception_type(openai.error.APIError)
-            | retry_if_exception_type(openai.error.APIConnectionError)
-            | retry_if_exception_type(openai.error.RateLimitError)
-            | retry_if_exception_type(openai.error.ServiceUnavailableError)
-        ),
-        before_sleep=before_sleep_log(LOG, logging.WARNING),
-    )
-
-
 async def acompletion_with_retry(llm: ChatOpenAI, **kwargs: Any) -> Any:
     """Use tenacity to retry the async completion call."""
-    retry_decorator = _create_retry_decorator(llm)
+    retry_decorator = llm._create_retry_decorator()
+    rate_limiter = llm.get_rate_limiter()
+    estimated_tokens = llm.estimate_request_tokens(kwargs.get("messages", [])) if rate_limiter else 0
 
     @retry_decorator
     async def _completion_with_retry(**kwargs: Any) -> Any:
+        if rate_limiter:
+            await rate_limiter.aacquire(estimated_tokens)
+        # every attempt gets only the time left to the request deadline
+        kwargs["request_timeout"] = bound_timeout(llm.request_timeout)
         # Use OpenAI's async api https://github.com/openai/openai-python#async-api
-        return await llm.client.acreate(**kwargs)
+        response = await llm.client.acreate(**kwargs)
+        if rate_limiter and not kwargs.get("stream"):
+            rate_limiter.settle(estimated_tokens, response.get("usage", {}).get("total_tokens"))
+        return response
 
-    return await _completion_with_retry(**kwargs)
+    retry_metrics.record_call()
+    try:
+        return await _completion_with_retry(**kwargs)
+    except Exception:
+        retry_metrics.record_failure()
+        raise
 
 
 def _convert_dict_to_message(_dict: dict) -> BaseMessage:
@@ -92,6 +87,26 @@ def _convert_message_to_dict(message: BaseMessage) -> dict:
     return message_dict
 
 
+@contextmanager
+def _track_request(model: str) -> Iterator[None]:
+    """Time a generation, retries included, and count it by outcome."""
+    start = time.perf_counter()
+    status = "error"
+    try:
+        yield
+        status = "ok"
+    finally:
+        LLM_REQUEST_SECONDS.observe(time.perf_counter() - start, model=model)
+        LLM_REQUESTS.inc(model=model, status=status)
+
+
+def _record_usage(model: str, response: Mapping[str, Any]) -> None:
+    # streamed responses carry no usage
+    usage = response.get("usage") or {}
+    LLM_TOKENS.inc(usage.get("prompt_tokens", 0), model=model, direction="prompt")
+    LLM_TOKENS.inc(usage.get("completion_tokens", 0), model=model, direction="completion")
+
+
 def _create_chat_result(response: Mapping[str, Any]) -> ChatResult:
     generations = []
     for res in response["choices"]:
@@ -131,6 +146,8 @@ class ChatOpenAI(BaseChatModel, BaseModel):
     request_timeout: int = Field(default=60)
     """Maximum number of retries to make when generating."""
     max_retries: int = Field(default=6)
+    """Custom `RetryPolicy`, defaults to one built from `max_retries`."""
+    retry_policy: Optional[Any] = Field(default=None)
     """Whether to stream the results or not."""
     streaming: bool = Field(default=False)
     """Number of chat completions to generate for each prompt."""
@@ -139,7 +156,18 @@ class ChatOpenAI(BaseChatModel, BaseModel):
     max_tokens: Optional[int] = Field(default=4096)
     """the proxy to use"""
     proxy: Optional[str] = Field(default="")
-    """"""
+    """Size of the keep-alive connection pool shared by models with the same endpoint."""
+    max_connections: int = Field(default=10)
+    """Timeout in seconds for establishing a connection, `request_timeout` bounds the read."""
+    connect_timeout: float = Field(default=10)
+    """Client-side requests per minute for this api key and model, 0 means unlimited."""
+    rate_limit_rpm: int = Field(default=0)
+    """Client-side tokens per minute for this api key and model, 0 means unlimited."""
+    rate_limit_tpm: int = Field(default=0)
+    """Endpoints to route calls across, see `models.router.parse_endpoints` for the format."""
+    endpoints: Optional[List[Dict[str, str]]] = Field(default=None)
+    """Also send a call still pending after the endpoint's p95 latency to the runner-up."""
+    hedge_requests: bool = Field(default=False)
 
     class Config:
         """Configuration for this pydantic object."""
@@ -166,6 +194,12 @@ class ChatOpenAI(BaseChatModel, BaseModel):
 
         values["llm_model_kwargs"] = extra
 
+        _endpoints = parse_endpoints(values.get("endpoints"))
+        values["endpoints"] = _endpoints or None
+        if _endpoints:
+            # the first endpoint stands for the model where a single one is expected
+            values.setdefault("llm_api_key", _endpoints[0]["api_key"])
+            values.setdefault("llm_api_base_url", _endpoints[0]["api_base"])
 
         _llm_api_key = get_from_dict_or_env(
             values, "llm_api_key", "LLM_API_KEY"
@@ -173,53 +207,55 @@ class ChatOpenAI(BaseChatModel, BaseModel):
         _llm_api_base_url = get_from_dict_or_env(
             values, "llm_api_base_url", "LLM_API_BASE_URL",
             openai_default_api_base)
+        for endpoint in _endpoints:
+            endpoint["api_key"] = endpoint["api_key"] or _llm_api_key
         _proxy = get_from_dict_or_env(
             values, "proxy", "PROXY", ""
         )
-        _deployment_id = get_from_dict_or_env(
+        _deployment_id = extra.get("deployment_id") or get_from_dict_or_env(
             values, "deployment_id", "DEPLOYMENT_ID", ""
         )
-        try:
-            import openai
-
-            if openai.proxy != _proxy:
-                if _proxy:
-                    openai.proxy = _proxy
-                    values["proxy"] = _proxy
-                    if not cls._validation_executed:
-                        LOG.info(f"success use proxy: {_proxy}")
-                elif not cls._validation_executed:
-                    LOG.info("proxy no find, directly request to chatgpt instead")
-
-            if openai.api_base != _llm_api_base_url:
-                openai.api_base = _llm_api_base_url
-                values["llm_api_base_url"] = _llm_api_base_url
-                if not cls._validation_executed:
-                    LOG.info(f"success use customized api base url: {_llm_api_base_url}")
-
-            if openai.api_key != _llm_api_key:
-                openai.api_key = _llm_api_key
-                values["llm_api_key"] = _llm_api_key
-                if not cls._validation_executed:
-                    LOG.debug(f"success use llm api key: {_llm_api_key}")
-
-            if _deployment_id:
-                openai.api_type = "azure"
-                openai.api_version = "2023-03-15-preview"
+        if _deployment_id and not _endpoints:
+            extra.setdefault("deployment_id", _deployment_id)
+
+        values["llm_api_key"] = _llm_api_key
+        values["llm_api_base_url"] = _llm_api_base_url
+        values["proxy"] = _proxy
 
+        try:
+            import openai  # noqa: F401
         except ImportError:
             raise ValueError(
                 "Could not import openai python package. "
                 "Please it install it with `pip install openai`."
             )
 
-        try:
-            values["client"] = openai.ChatCompletion
-        except AttributeError:
-            raise ValueError(
-                "`openai` has no `ChatCompletion` attribute, this is likely "
-                "due to an old version of the openai package. Try upgrading it "
-                "with `pip install --upgrade openai`."
+        if not cls._validation_executed:
+            if _proxy:
+                LOG.info(f"success use proxy: {_proxy}")
+            else:
+                LOG.info("proxy no find, directly request to chatgpt instead")
+            if _llm_api_base_url != openai_default_api_base:
+                LOG.info(f"success use customized api base url: {_llm_api_base_url}")
+
+        # every model gets its own endpoint-bound client, models with identical
+        # endpoint settings share one connection pool
+        if _endpoints:
+            values["client"] = get_endpoint_router(
+                _endpoints,
+                proxy=_proxy,
+                max_connections=values.get("max_connections", 10),
+                connect_timeout=values.get("connect_timeout", 10),
+                hedge=str(values.get("hedge_requests", False)).lower() in ("true", "1"),
+            )
+        else:
+            values["client"] = get_chat_completion_client(
+                api_key=_llm_api_key,
+                api_base=_llm_api_base_url,
+                proxy=_proxy,
+                deployment_id=_deployment_id,
+                max_connections=values.get("max_connections", 10),
+                connect_timeout=values.get("connect_timeout", 10),
             )
         if values.get("n") and values["n"] < 1:
             raise ValueError("n must be at least 1.")
@@ -242,36 +278,46 @@ class ChatOpenAI(BaseChatModel, BaseModel):
         }
 
     def _create_retry_decorator(self) -> Callable[[Any], Any]:
-        import openai
-
-        min_seconds = 15
-        max_seconds = 30
-        # Wait 2^x * 1 second between each retry starting with
-        # 4 seconds, then up to 10 seconds, then 10 seconds afterwards
-        return retry(
-            reraise=True,
-            stop=stop_after_attempt(self.max_retries),
-            wait=wait_exponential(multiplier=1, min=min_seconds, max=max_seconds),
-            # todo RateLimitError
-            retry=(
-                retry_if_exception_type(openai.error.Timeout)
-                | retry_if_exception_type(openai.error.APIError)
-                | retry_if_exception_type(openai.error.APIConnectionError)
-                | retry_if_exception_type(openai.error.RateLimitError)
-                | retry_if_exception_type(openai.error.ServiceUnavailableError)
-            ),
-            before_sleep=before_sleep_log(LOG, logging.WARNING),
-        )
+        policy = self.retry_policy or RetryPolicy(max_retries=self.max_retries)
+        return policy.decorator()
+
+    def get_rate_limiter(self) -> Optional[RateLimiter]:
+        """The process-wide limiter for this api key and model, None if disabled."""
+        return get_rate_limiter(self.llm_api_key, self.llm_model_name,
+                                self.rate_limit_rpm, self.rate_limit_tpm)
+
+    def estimate_request_tokens(self, message_dicts: List[Dict[str, Any]]) -> int:
+        """Estimate prompt tokens of a request before sending it."""
+        try:
+            return count_message_tokens(message_dicts, model=self.llm_model_name)
+        except Exception:
+            # unknown model for tiktoken, about 4 characters per token
+            return sum(len(str(m.get("content", ""))) for m in message_dicts) // 4
 
     def completion_with_retry(self, **kwargs: Any) -> Any:
         """Use tenacity to retry the completion call."""
         retry_decorator = self._create_retry_decorator()
+        rate_limiter = self.get_rate_limiter()
+        estimated_tokens = self.estimate_request_tokens(kwargs.get("messages", [])) if rate_limiter else 0
 
         @retry_decorator
         def _completion_with_retry(**kwargs: Any) -> Any:
-            return self.client.create(**kwargs)
-
-        return _completion_with_retry(**kwargs)
+            if rate_limiter:
+                rate_limiter.acquire(estimated_tokens)
+            # every attempt gets only the time left to the request deadline
+            kwargs["request_timeout"] = bound_timeout(self.request_timeout)
+            response = self.client.create(**kwargs)
+            if rate_limiter and not kwargs.get("stream"):
+                # streamed responses carry no usage, the estimate stands
+                rate_limiter.settle(estimated_tokens, response.get("usage", {}).get("total_tokens"))
+            return response
+
+        retry_metrics.record_call()
+        try:
+            return _completion_with_retry(**kwargs)
+        except Exception:
+            retry_metrics.record_failure()
+            raise
 
     def _combine_llm_outputs(self, llm_outputs: List[Optional[dict]]) -> dict:
         overall_token_usage: dict = {}
@@ -290,29 +336,35 @@ class ChatOpenAI(BaseChatModel, BaseModel):
     def _generate(
         self, messages: List[BaseMessage], stop: Optional[List[str]] = None
     ) -> ChatResult:
-        message_dicts, params = self._create_message_dicts(messages, stop)
-
-        if self.streaming:
-            inner_completion = ""
-            role = "assistant"
-            params["stream"] = True
-            for stream_resp in self.completion_with_retry(
-                messages=message_dicts, **params
-            ):
-                role = stream_resp["choices"][0]["delta"].get("role", role)
-                token = stream_resp["choices"][0]["delta"].get("content", "")
-                inner_completion += token
-                self.callback_manager.on_llm_new_token(
-                    token,
-                    verbose=self.verbose,
+        with _track_request(self.llm_model_name):
+            message_dicts, params = self._create_message_dicts(messages, stop)
+
+            if self._should_stream():
+                inner_completion = ""
+                role = "assistant"
+                params["stream"] = True
+                for stream_resp in self.completion_with_retry(
+                    messages=message_dicts, **params
+                ):
+                    role = stream_resp["choices"][0]["delta"].get("role", role)
+                    token = stream_resp["choices"][0]["delta"].get("content", "")
+                    inner_completion += token
+                    self.callback_manager.on_llm_new_token(
+                        token,
+                        verbose=self.verbose,
+                    )
+                message = _convert_dict_to_message(
+                    {"content": inner_completion, "role": role}
                 )
-            message = _convert_dict_to_message(
-                {"content": inner_completion, "role": role}
-            )
-            return ChatResult(generations=[ChatGeneration(message=message)])
+                return ChatResult(generations=[ChatGeneration(message=message)])
+
+            response = self.completion_with_retry(messages=message_dicts, **params)
+            _record_usage(self.llm_model_name, response)
+            return _create_chat_result(response)
 
-        response = self.completion_with_retry(messages=message_dicts, **params)
-        return _create_chat_result(response)
+    def _should_stream(self) -> bool:
+        # an engine stream consumer wants the final answer token by token
+        return self.streaming or (self.n == 1 and streaming_requested())
 
     def _create_message_dicts(
         self, messages: List[BaseMessage], stop: Optional[List[str]]
@@ -328,36 +380,38 @@ class ChatOpenAI(BaseChatModel, BaseModel):
     async def _agenerate(
         self, messages: List[BaseMessage], stop: Optional[List[str]] = None
     ) -> ChatResult:
-        message_dicts, params = self._create_message_dicts(messages, stop)
-        if self.streaming:
-            inner_completion = ""
-            role = "assistant"
-            params["stream"] = True
-            async for stream_resp in await acompletion_with_retry(
-                self, messages=message_dicts, **params
-            ):
-                role = stream_resp["choices"][0]["delta"].get("role", role)
-                token = stream_resp["choices"][0]["delta"].get("content", "")
-                inner_completion += token
-                if self.callback_manager.is_async:
-                    await self.callback_manager.on_llm_new_token(
-                        token,
-                        verbose=self.verbose,
-                    )
-                else:
-                    self.callback_manager.on_llm_new_token(
-                        token,
-                        verbose=self.verbose,
-                    )
-            message = _convert_dict_to_message(
-                {"content": inner_completion, "role": role}
-            )
-            return ChatResult(generations=[ChatGeneration(message=message)])
-        else:
-            response = await acompletion_with_retry(
-                self, messages=message_dicts, **params
-            )
-            return _create_chat_result(response)
+        with _track_request(self.llm_model_name):
+            message_dicts, params = self._create_message_dicts(messages, stop)
+            if self._should_stream():
+                inner_completion = ""
+                role = "assistant"
+                params["stream"] = True
+                async for stream_resp in await acompletion_with_retry(
+                    self, messages=message_dicts, **params
+                ):
+                    role = stream_resp["choices"][0]["delta"].get("role", role)
+                    token = stream_resp["choices"][0]["delta"].get("content", "")
+                    inner_completion += token
+                    if self.callback_manager.is_async:
+                        await self.callback_manager.on_llm_new_token(
+                            token,
+                            verbose=self.verbose,
+                        )
+                    else:
+                        self.callback_manager.on_llm_new_token(
+                            token,
+                            verbose=self.verbose,
+                        )
+                message = _convert_dict_to_message(
+                    {"content": inner_completion, "role": role}
+                )
+                return ChatResult(generations=[ChatGeneration(message=message)])
+            else:
+                response = await acompletion_with_retry(
+                    self, messages=message_dicts, **params
+                )
+                _record_usage(self.llm_model_name, response)
+                return _create_chat_result(response)
 
     @property
     def _identifying_params(self) -> Mapping[str, Any]:
@@ -369,56 +423,11 @@ class ChatOpenAI(BaseChatModel, BaseModel):
         # tiktoken NOT supported for Python 3.8 or below
         if sys.version_info[1] <= 8:
             return super().get_num_tokens(text)
-        try:
-            import tiktoken
-        except ImportError:
-            raise ValueError(
-                "Could not import tiktoken python package. "
-                "This is needed in order to calculate get_num_tokens. "
-                "Please it install it with `pip install tiktoken`."
-            )
-        # create a gpt-3.5-Turbo encoder instance
-        enc = tiktoken.encoding_for_model(self.llm_model_name)
-
-        # encode the text using the gpt-3.5-Turbo encoder
-        tokenized_text = enc.encode(text)
-
-        # calculate the number of tokens in the encoded text
-        return len(tokenized_text)
+        return count_tokens(text, self.llm_model_name)
 
     def get_num_tokens_from_messages(
-        self, messages: List[BaseMessage], model: str = DEFAULT_MODEL_NAME
+        self, messages: List[BaseMessage], model: Optional[str] = None
     ) -> int:
-        """Calculate num tokens for gpt-3.5-turbo with tiktoken package."""
-        try:
-            import tiktoken
-        except ImportError:
-            raise ValueError(
-                "Could not import tiktoken python package. "
-                "This is needed in order to calculate get_num_tokens. "
-                "Please it install it with `pip install tiktoken`."
-            )
-
-        """Returns the number of tokens used by a list of messages."""
-        try:
-            encoding = tiktoken.encoding_for_model(model)
-        except KeyError:
-            encoding = tiktoken.get_encoding("cl100k_base")
-        if not model.startswith("gpt-3.5-turbo"):
-            raise NotImplementedError(
-                f"get_num_tokens_from_messages() is not presently implemented "
-                f"for model {model}."
-                "See https://github.com/openai/openai-python/blob/main/chatml.md for "
-                "information on how messages are converted to tokens."
-            )
-        num_tokens = 0
+        """Calculate num tokens of chat messages with tiktoken package, for this model by default."""
         messages_dict = [_convert_message_to_dict(m) for m in messages]
-        for message in messages_dict:
-            # every message follows <im_start>{role/name}\n{content}<im_end>\n
-            num_tokens += 4
-            for key, value in message.items():
-                num_tokens += len(encoding.encode(value))
-                if key == "name":  # if there's a name, the role is omitted
-                    num_tokens += -1  # role is always required and always 1 token
-        num_tokens += 2  # every reply is primed with <im_start>assistant
-        return num_tokens
+        return count_message_tokens(messages_dict, model=model or self.llm_model_name)
@@ -0,0 +1,185 @@
+"""Per-endpoint pooled client for the openai chat completion api."""
+import asyncio
+import threading
+import time
+import weakref
+from typing import Any, Dict, Tuple
+
+from ...common.constants import openai_default_api_base
+from ...common.log import LOG
+from ..retry import get_circuit_breaker
+
+AZURE_API_VERSION = "2023-03-15-preview"
+
+
+class _ProxiedClientSession:
+    """Forward requests to an aiohttp session, filling in the proxy.
+
+    openai passes its module-level proxy to every aiohttp request, we want the
+    one configured on the client instead.
+    """
+
+    def __init__(self, session: Any, proxy: str):
+        self._session = session
+        self._proxy = proxy
+
+    def request(self, *args: Any, **kwargs: Any) -> Any:
+        if not kwargs.get("proxy"):
+            kwargs["proxy"] = self._proxy
+        return self._session.request(*args, **kwargs)
+
+    def __getattr__(self, item: str) -> Any:
+        return getattr(self._session, item)
+
+
+class ChatCompletionClient:
+    """Drop-in replacement of `openai.ChatCompletion` bound to one endpoint.
+
+    Credentials and endpoint are passed to openai on every call instead of being
+    written to the openai module, and requests go through a keep-alive connection
+    pool owned by this client (one `requests.Session` shared by all threads and
+    one `aiohttp.ClientSession` per event loop).
+
+    The openai 0.27 transport is requests/aiohttp, so connections are HTTP/1.1.
+    """
+
+    def __init__(
+        self,
+        api_key: str,
+        api_base: str = openai_default_api_base,
+        proxy: str = "",
+        deployment_id: str = "",
+        max_connections: int = 10,
+        connect_timeout: float = 10,
+        keepalive_expiry: float = 60,
+    ):
+        self.api_key = api_key
+        self.api_base = api_base
+        self.proxy = proxy
+        self.deployment_id = deployment_id
+        self.max_connections = max(int(max_connections), 1)
+        self.connect_timeout = connect_timeout
+        self.keepalive_expiry = keepalive_expiry
+
+        # shared with every client hitting the same endpoint, whatever the key
+        self.circuit_breaker = get_circuit_breaker(api_base)
+
+        self._session = None
+        self._session_lock = threading.Lock()
+        self._aiosessions: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Any]" = weakref.WeakKeyDictionary()
+
+    @property
+    def session(self) -> Any:
+        """requests session backed by a pool of `max_connections` connections."""
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    import requests
+                    from requests.adapters import HTTPAdapter
+
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_connections,
+                                          max_retries=0, pool_block=False)
+                    session.mount("https://", adapter)
+                    session.mount("http://", adapter)
+                    if self.proxy:
+                        session.proxies = {"http": self.proxy, "https": self.proxy}
+                    self._session = session
+        return self._session
+
+    def _get_aiosession(self) -> Any:
+        import aiohttp
+
+        loop = asyncio.get_running_loop()
+        session = self._aiosessions.get(loop)
+        if session is None or session.closed:
+            connector = aiohttp.TCPConnector(limit=self.max_connections,
+                                             keepalive_timeout=self.keepalive_expiry)
+            session = aiohttp.ClientSession(connector=connector)
+            self._aiosessions[loop] = session
+        return _ProxiedClientSession(session, self.proxy) if self.proxy else session
+
+    def _build_kwargs(self, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        params = {**kwargs, "api_key": self.api_key, "api_base": self.api_base}
+        if self.deployment_id:
+            params["api_type"] = "azure"
+            params["api_version"] = AZURE_API_VERSION
+            params.setdefault("deployment_id", self.deployment_id)
+        request_timeout = params.get("request_timeout")
+        if request_timeout and not isinstance(request_timeout, tuple):
+            # (connect, read)
+            params["request_timeout"] = (min(self.connect_timeout, request_timeout), request_timeout)
+        return params
+
+    def create(self, **kwargs: Any) -> Any:
+        """Same as `openai.ChatCompletion.create`, through this client's pool."""
+        import openai
+        from openai import api_requestor
+
+        # openai keeps one session per thread, point it at our pool for this call
+        thread_context = api_requestor._thread_context
+        thread_context.session = self.session
+        thread_context.session_create_time = time.time()
+        self.circuit_breaker.before_call()
+        try:
+            response = openai.ChatCompletion.create(**self._build_kwargs(kwargs))
+        except Exception as e:
+            self.circuit_breaker.record_failure(e)
+            raise
+        self.circuit_breaker.record_success()
+        return response
+
+    async def acreate(self, **kwargs: Any) -> Any:
+        """Same as `openai.ChatCompletion.acreate`, through this client's pool."""
+        import openai
+
+        self.circuit_breaker.before_call()
+        token = openai.aiosession.set(self._get_aiosession())
+        try:
+            response = await openai.ChatCompletion.acreate(**self._build_kwargs(kwargs))
+        except Exception as e:
+            self.circuit_breaker.record_failure(e)
+            raise
+        finally:
+            openai.aiosession.reset(token)
+        self.circuit_breaker.record_success()
+        return response
+
+    def close(self) -> None:
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+
+    async def aclose(self) -> None:
+        for session in list(self._aiosessions.values()):
+            await session.close()
+        self._aiosessions.clear()
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}(api_base={self.api_base!r}, max_connections={self.max_connections})"
+
+
+_clients: Dict[Tuple, ChatCompletionClient] = {}
+_clients_lock = threading.Lock()
+
+
+def get_chat_completion_client(
+    api_key: str,
+    api_base: str = openai_default_api_base,
+    proxy: str = "",
+    deployment_id: str = "",
+    max_connections: int = 10,
+    connect_timeout: float = 10,
+    keepalive_expiry: float = 60,
+) -> ChatCompletionClient:
+    """Return the client for these endpoint settings, shared by every model using them."""
+    key = (api_key, api_base, proxy, deployment_id, int(max_connections), float(connect_timeout), float(keepalive_expiry))
+    client = _clients.get(key)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(key)
+            if client is None:
+                client = ChatCompletionClient(*key)
+                _clients[key] = client
+                LOG.debug(f"create chat completion client: {client}")
+    return client
@@ -1,8 +1,21 @@
+import json
+import os
+import threading
+from typing import Any, Dict, Optional
+
+from ..common.log import LOG
 from ..common.utils import get_from_dict_or_env
 from . import ChatOpenAI
 from . import DEFAULT_MODEL_NAME
 
+# env vars ChatOpenAI falls back to, part of the registry key
+_MODEL_ENV_KEYS = ("LLM_API_KEY", "LLM_API_BASE_URL", "PROXY", "DEPLOYMENT_ID", "MODEL_NAME")
+
+
 class ModelFactory:
+    # models shared process-wide, keyed by their effective parameters
+    _registry: Dict[str, Any] = {}
+    _registry_lock = threading.Lock()
 
     def __init__(self):
         self.available_models_prefix = {
@@ -27,10 +40,59 @@ class ModelFactory:
                 return v
         return ""
 
-    def create_llm_model(self, **llm_model_kwargs):
+    @staticmethod
+    def _registry_key(llm_model_kwargs: dict) -> Optional[str]:
+        env = {key: os.environ.get(key, "") for key in _MODEL_ENV_KEYS}
+        try:
+            return json.dumps({"kwargs": llm_model_kwargs, "env": env}, sort_keys=True)
+        except TypeError:
+            # callback managers and the like, don't guess whether two are the same
+            return None
+
+    def create_llm_model(self, endpoints: list = None, shared: bool = True, **llm_model_kwargs):
+        """endpoints: several (base url, key, deployment id) to route calls across,
+        see models.router.parse_endpoints for the accepted forms.
+
+        shared: return the instance already built with the same parameters, if any.
+        Models hold no per-call state, so one instance can serve every thread.
+        """
+        if endpoints:
+            llm_model_kwargs["endpoints"] = endpoints
+        key = self._registry_key(llm_model_kwargs) if shared else None
+        if key is None:
+            return self._create_llm_model(llm_model_kwargs)
+
+        model = self._registry.get(key)
+        if model is None:
+            with self._registry_lock:
+                model = self._registry.get(key)
+                if model is None:
+                    model = self._create_llm_model(llm_model_kwargs)
+                    self._registry[key] = model
+                    LOG.debug(f"[ModelFactory] create shared model, {len(self._registry)} in registry")
+        return model
+
+    def _create_llm_model(self, llm_model_kwargs: dict):
+        # validation fills in nested dicts in place, keep the caller's untouched
+        llm_model_kwargs = {k: dict(v) if isinstance(v, dict) else v for k, v in llm_model_kwargs.items()}
         _model = get_from_dict_or_env(llm_model_kwargs, "model_name", "MODEL_NAME", DEFAULT_MODEL_NAME)
         match_llm_model = self.match_model(_model)
         if True or match_llm_model == "chatgpt":
             return ChatOpenAI(**llm_model_kwargs)
         else:
             raise NotImplementedError("implement me!")
+
+    @classmethod
+    def invalidate(cls, endpoints: list = None, **llm_model_kwargs) -> bool:
+        """Drop the shared model built with these parameters, the next call builds a new one."""
+        if endpoints:
+            llm_model_kwargs["endpoints"] = endpoints
+        key = cls._registry_key(llm_model_kwargs)
+        with cls._registry_lock:
+            return cls._registry.pop(key, None) is not None
+
+    @classmethod
+    def clear(cls) -> None:
+        """Drop every shared model."""
+        with cls._registry_lock:
+            cls._registry.clear()
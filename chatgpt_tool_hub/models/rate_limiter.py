@@ -0,0 +1,138 @@
+"""Client-side token bucket rate limiter shared by every model in the process."""
+import asyncio
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from ..common.log import LOG
+
+
+class TokenBucket:
+    """A token bucket that hands out reservations.
+
+    `reserve` takes the amount right away, possibly driving the balance negative,
+    and returns how long the caller must wait until the debt is paid back. This keeps
+    callers roughly first-come first-served without a wait queue.
+    """
+
+    def __init__(self, capacity: float, refill_per_second: float):
+        self.capacity = float(capacity)
+        self.refill_per_second = float(refill_per_second)
+        self._balance = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        elapsed = now - self._updated_at
+        self._updated_at = now
+        self._balance = min(self.capacity, self._balance + elapsed * self.refill_per_second)
+
+    def reserve(self, amount: float) -> float:
+        """Take `amount` from the bucket, return seconds to wait before using it."""
+        # a single request larger than the bucket could never be served otherwise
+        amount = min(float(amount), self.capacity)
+        with self._lock:
+            self._refill(time.monotonic())
+            self._balance -= amount
+            if self._balance >= 0:
+                return 0.0
+            return -self._balance / self.refill_per_second
+
+    def give_back(self, amount: float) -> None:
+        """Return (or, with a negative amount, take) tokens after the fact."""
+        with self._lock:
+            self._refill(time.monotonic())
+            self._balance = min(self.capacity, self._balance + amount)
+
+    def update(self, capacity: float, refill_per_second: float) -> None:
+        with self._lock:
+            self._refill(time.monotonic())
+            self.capacity = float(capacity)
+            self.refill_per_second = float(refill_per_second)
+            self._balance = min(self._balance, self.capacity)
+
+
+class RateLimiter:
+    """Requests-per-minute and tokens-per-minute budget for one (api key, model).
+
+    A limit of 0 disables that budget.
+    """
+
+    def __init__(self, requests_per_minute: int = 0, tokens_per_minute: int = 0):
+        self.requests_per_minute = 0
+        self.tokens_per_minute = 0
+        self._request_bucket: Optional[TokenBucket] = None
+        self._token_bucket: Optional[TokenBucket] = None
+        self.update(requests_per_minute, tokens_per_minute)
+
+        self.throttled_num = 0
+        self.throttled_seconds = 0.0
+
+    def update(self, requests_per_minute: int, tokens_per_minute: int) -> None:
+        self.requests_per_minute = int(requests_per_minute or 0)
+        self.tokens_per_minute = int(tokens_per_minute or 0)
+        self._request_bucket = self._update_bucket(self._request_bucket, self.requests_per_minute)
+        self._token_bucket = self._update_bucket(self._token_bucket, self.tokens_per_minute)
+
+    @staticmethod
+    def _update_bucket(bucket: Optional[TokenBucket], per_minute: int) -> Optional[TokenBucket]:
+        if per_minute <= 0:
+            return None
+        if bucket is None:
+            return TokenBucket(per_minute, per_minute / 60)
+        bucket.update(per_minute, per_minute / 60)
+        return bucket
+
+    def _reserve(self, tokens: int) -> float:
+        wait = 0.0
+        if self._request_bucket is not None:
+            wait = max(wait, self._request_bucket.reserve(1))
+        if self._token_bucket is not None and tokens > 0:
+            wait = max(wait, self._token_bucket.reserve(tokens))
+        if wait > 0:
+            self.throttled_num += 1
+            self.throttled_seconds += wait
+            LOG.debug(f"[rate_limiter] throttle {wait:.2f}s for {tokens} tokens")
+        return wait
+
+    def acquire(self, tokens: int = 0) -> None:
+        """Block until one request carrying `tokens` tokens fits the budget."""
+        wait = self._reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+
+    async def aacquire(self, tokens: int = 0) -> None:
+        """Wait until one request carrying `tokens` tokens fits the budget."""
+        wait = self._reserve(tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def settle(self, estimated_tokens: int, actual_tokens: Optional[int]) -> None:
+        """Correct the token budget once the real usage is known."""
+        if self._token_bucket is None or actual_tokens is None:
+            return
+        self._token_bucket.give_back(estimated_tokens - actual_tokens)
+
+
+_limiters: Dict[Tuple[str, str], RateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(
+    api_key: str, model_name: str, requests_per_minute: int = 0, tokens_per_minute: int = 0
+) -> Optional[RateLimiter]:
+    """Return the limiter shared by every model using this api key and model.
+
+    Returns None when both limits are disabled.
+    """
+    if not requests_per_minute and not tokens_per_minute:
+        return None
+    key = (api_key, model_name)
+    with _limiters_lock:
+        limiter = _limiters.get(key)
+        if limiter is None:
+            limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+            _limiters[key] = limiter
+        elif (limiter.requests_per_minute, limiter.tokens_per_minute) != (requests_per_minute, tokens_per_minute):
+            limiter.update(requests_per_minute, tokens_per_minute)
+    return limiter
@@ -0,0 +1,304 @@
+"""Retry policy and per-endpoint circuit breaker for llm api calls."""
+import email.utils
+import random
+import re
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+from tenacity import RetryCallState, retry, stop_after_attempt
+
+from ..common.deadline import remaining_time
+from ..common.log import LOG
+from ..common.metrics import LLM_RETRIES
+
+# error kinds, used both for backoff floors and metrics
+CONNECTION = "connection"
+RATE_LIMIT = "rate_limit"
+SERVER = "server"
+FATAL = "fatal"
+
+
+class CircuitOpenError(Exception):
+    """Raised without calling the endpoint while its circuit breaker is open."""
+
+    def __init__(self, endpoint: str, retry_in: float):
+        super().__init__(f"circuit breaker open for {endpoint}, retry in {retry_in:.1f}s")
+        self.endpoint = endpoint
+        self.retry_in = retry_in
+
+
+def classify_error(exc: BaseException) -> str:
+    """Map an openai exception to one of CONNECTION / RATE_LIMIT / SERVER / FATAL."""
+    import openai
+
+    if isinstance(exc, CircuitOpenError):
+        return FATAL
+    if isinstance(exc, (openai.error.Timeout, openai.error.APIConnectionError)):
+        return CONNECTION
+    if isinstance(exc, openai.error.RateLimitError):
+        # an exhausted quota won't come back by waiting
+        if getattr(exc, "code", None) == "insufficient_quota":
+            return FATAL
+        return RATE_LIMIT
+    if isinstance(exc, (openai.error.ServiceUnavailableError, openai.error.TryAgain)):
+        return SERVER
+    if isinstance(exc, openai.error.APIError):
+        status = getattr(exc, "http_status", None)
+        if status is None or status >= 500:
+            return SERVER
+    return FATAL
+
+
+_DURATION_RE = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+
+def _parse_duration(value: str) -> Optional[float]:
+    """Parse openai reset durations such as "20ms", "1s" or "6m0s"."""
+    value = value.strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION_RE.findall(value)
+    if not parts:
+        return None
+    return sum(float(num) * _DURATION_UNITS[unit] for num, unit in parts)
+
+
+def parse_retry_after(headers: Optional[Dict[str, str]]) -> Optional[float]:
+    """Return the seconds the server asked us to wait, None if it didn't say."""
+    if not headers:
+        return None
+    headers = {str(k).lower(): str(v) for k, v in dict(headers).items()}
+
+    if "retry-after-ms" in headers:
+        try:
+            return float(headers["retry-after-ms"]) / 1000
+        except ValueError:
+            pass
+    if "retry-after" in headers:
+        value = headers["retry-after"]
+        try:
+            return float(value)
+        except ValueError:
+            parsed = email.utils.parsedate_to_datetime(value) if value else None
+            if parsed is not None:
+                return max(parsed.timestamp() - time.time(), 0.0)
+
+    # no explicit hint, wait until whichever exhausted budget resets
+    resets = []
+    for budget in ("requests", "tokens"):
+        remaining = headers.get(f"x-ratelimit-remaining-{budget}")
+        reset = headers.get(f"x-ratelimit-reset-{budget}")
+        if reset is None or (remaining is not None and remaining not in ("0", "0.0")):
+            continue
+        seconds = _parse_duration(reset)
+        if seconds is not None:
+            resets.append(seconds)
+    return max(resets) if resets else None
+
+
+class RetryMetrics:
+    """Process-wide counters of retries and the time spent waiting on them."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        self.calls = 0
+        self.retries = 0
+        self.failures = 0
+        self.wait_seconds = 0.0
+        self.retries_by_kind: Dict[str, int] = {}
+        self.circuit_rejections = 0
+
+    def record_retry(self, kind: str, wait: float) -> None:
+        with self._lock:
+            self.retries += 1
+            self.wait_seconds += wait
+            self.retries_by_kind[kind] = self.retries_by_kind.get(kind, 0) + 1
+        LLM_RETRIES.inc(kind=kind)
+
+    def record_call(self) -> None:
+        with self._lock:
+            self.calls += 1
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+
+    def record_circuit_rejection(self) -> None:
+        with self._lock:
+            self.circuit_rejections += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "retries": self.retries,
+                "failures": self.failures,
+                "wait_seconds": round(self.wait_seconds, 3),
+                "retries_by_kind": dict(self.retries_by_kind),
+                "circuit_rejections": self.circuit_rejections,
+            }
+
+
+retry_metrics = RetryMetrics()
+
+
+class RetryPolicy:
+    """Decide whether and how long to wait before retrying a failed api call.
+
+    Server hints (`Retry-After`, `x-ratelimit-reset-*`) win when present. Otherwise
+    backoff is full jitter, `uniform(floor, min(cap, base * 2 ** attempt))`, with a
+    short floor for connection errors and a longer one for rate limits.
+    """
+
+    def __init__(
+        self,
+        max_retries: int = 6,
+        base_delay: float = 1.0,
+        max_delay: float = 60.0,
+        floors: Optional[Dict[str, float]] = None,
+    ):
+        self.max_retries = max(int(max_retries), 1)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.floors = {CONNECTION: 0.2, SERVER: 1.0, RATE_LIMIT: 2.0}
+        self.floors.update(floors or {})
+
+    def should_retry(self, exc: BaseException) -> bool:
+        return classify_error(exc) != FATAL
+
+    def compute_wait(self, exc: BaseException, attempt: int) -> float:
+        """Seconds to sleep after the `attempt`-th failed attempt (1-based)."""
+        kind = classify_error(exc)
+        hinted = parse_retry_after(getattr(exc, "headers", None))
+        if hinted is not None:
+            return min(hinted, self.max_delay)
+        floor = self.floors.get(kind, 0.0)
+        ceiling = min(self.max_delay, self.base_delay * 2 ** attempt)
+        return random.uniform(floor, max(floor, ceiling))
+
+    def _out_of_time(self, retry_state: RetryCallState) -> bool:
+        """Stop retrying when the request deadline leaves no room for the shortest wait."""
+        remaining = remaining_time()
+        if remaining is None:
+            return False
+        kind = classify_error(retry_state.outcome.exception())
+        return remaining <= self.floors.get(kind, 0.0)
+
+    def _wait(self, retry_state: RetryCallState) -> float:
+        exc = retry_state.outcome.exception()
+        wait = self.compute_wait(exc, retry_state.attempt_number)
+        remaining = remaining_time()
+        if remaining is not None:
+            # leave the next attempt half of what is left
+            wait = min(wait, remaining / 2)
+        retry_metrics.record_retry(classify_error(exc), wait)
+        return wait
+
+    def _retry(self, retry_state: RetryCallState) -> bool:
+        if not retry_state.outcome.failed:
+            return False
+        return self.should_retry(retry_state.outcome.exception())
+
+    def _before_sleep(self, retry_state: RetryCallState) -> None:
+        exc = retry_state.outcome.exception()
+        LOG.warning(f"Retrying {retry_state.fn.__name__ if retry_state.fn else 'call'} in "
+                    f"{retry_state.next_action.sleep:.2f}s as it raised "
+                    f"{exc.__class__.__name__}: {exc}.")
+
+    def decorator(self) -> Callable[[Any], Any]:
+        """A tenacity decorator applying this policy, works on sync and async functions."""
+        return retry(
+            reraise=True,
+            stop=stop_after_attempt(self.max_retries) | self._out_of_time,
+            wait=self._wait,
+            retry=self._retry,
+            before_sleep=self._before_sleep,
+        )
+
+
+class CircuitBreaker:
+    """Fail fast after `failure_threshold` consecutive failures of one endpoint.
+
+    After `recovery_timeout` seconds the breaker lets a single probe through
+    (half-open); its success closes the breaker, its failure re-opens it.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, endpoint: str, failure_threshold: int = 5, recovery_timeout: float = 30.0):
+        self.endpoint = endpoint
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.recovery_timeout:
+                return self.HALF_OPEN
+            return self._state
+
+    def before_call(self) -> None:
+        """Raise CircuitOpenError if the endpoint should not be called right now."""
+        with self._lock:
+            if self._state == self.CLOSED:
+                return
+            retry_in = self.recovery_timeout - (time.monotonic() - self._opened_at)
+            if retry_in <= 0 and not self._probing:
+                self._state = self.HALF_OPEN
+                self._probing = True
+                return
+        retry_metrics.record_circuit_rejection()
+        raise CircuitOpenError(self.endpoint, max(retry_in, 0.0))
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self._state != self.CLOSED:
+                LOG.info(f"[circuit_breaker] {self.endpoint} recovered")
+            self._state = self.CLOSED
+            self._failures = 0
+            self._probing = False
+
+    def record_failure(self, exc: BaseException) -> None:
+        # a bad request or a rate limit says nothing about the endpoint's health
+        if classify_error(exc) not in (CONNECTION, SERVER):
+            with self._lock:
+                self._probing = False
+            return
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    LOG.warning(f"[circuit_breaker] open for {self.endpoint} "
+                                f"after {self._failures} consecutive failures")
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+            self._probing = False
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(endpoint: str, failure_threshold: int = 5, recovery_timeout: float = 30.0) -> CircuitBreaker:
+    """Return the breaker shared by every client calling `endpoint`."""
+    with _breakers_lock:
+        breaker = _breakers.get(endpoint)
+        if breaker is None:
+            breaker = CircuitBreaker(endpoint, failure_threshold, recovery_timeout)
+            _breakers[endpoint] = breaker
+    return breaker
@@ -0,0 +1,408 @@
+"""Route chat completion calls across several endpoints."""
+import asyncio
+import json
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Dict, List, Optional, Sequence, Union
+
+from ..common.concurrency import DEFAULT_MAX_WORKERS, submit_with_context
+from ..common.constants import openai_default_api_base
+from ..common.log import LOG
+from .chatgpt.http_client import ChatCompletionClient, get_chat_completion_client
+from .retry import FATAL, CircuitBreaker, CircuitOpenError, classify_error
+
+EndpointSpec = Union[Dict[str, Any], Sequence[str], str]
+
+
+def parse_endpoints(endpoints: Union[str, Sequence[EndpointSpec], None]) -> List[Dict[str, str]]:
+    """Normalize endpoint specs to dicts with api_base, api_key and deployment_id.
+
+    Accepts a JSON string, or a list whose items are a base url, a
+    (base_url, api_key[, deployment_id]) sequence, or a dict using either the
+    short keys or the `llm_api_base_url` / `llm_api_key` names.
+    """
+    if not endpoints:
+        return []
+    if isinstance(endpoints, str):
+        endpoints = json.loads(endpoints)
+
+    parsed = []
+    for spec in endpoints:
+        if isinstance(spec, str):
+            spec = {"api_base": spec}
+        elif not isinstance(spec, dict):
+            spec = dict(zip(("api_base", "api_key", "deployment_id"), spec))
+        parsed.append({
+            "api_base": spec.get("api_base") or spec.get("llm_api_base_url") or openai_default_api_base,
+            "api_key": spec.get("api_key") or spec.get("llm_api_key") or "",
+            "deployment_id": spec.get("deployment_id") or "",
+            "proxy": spec.get("proxy") or "",
+        })
+    return parsed
+
+
+_hedge_executor: Optional[ThreadPoolExecutor] = None
+_hedge_executor_lock = threading.Lock()
+
+
+def get_hedge_executor() -> ThreadPoolExecutor:
+    """Return the pool hedged calls run on.
+
+    Callers of a hedged call are often shared pool workers themselves (batch
+    generation, summary folds), waiting on that pool from there could deadlock
+    it. This pool only ever runs single api calls, which wait on nothing.
+    """
+    global _hedge_executor
+    if _hedge_executor is None:
+        with _hedge_executor_lock:
+            if _hedge_executor is None:
+                _hedge_executor = ThreadPoolExecutor(max_workers=DEFAULT_MAX_WORKERS,
+                                                     thread_name_prefix="tool-hub-hedge")
+    return _hedge_executor
+
+
+class EndpointStats:
+    """EWMA latency / error rate and a window of recent latencies of one endpoint."""
+
+    def __init__(self, alpha: float = 0.2, window: int = 50):
+        self.alpha = alpha
+        self._lock = threading.Lock()
+        self.latency: Optional[float] = None
+        self.error_rate = 0.0
+        self.requests = 0
+        self.errors = 0
+        self.last_error_at = 0.0
+        self._recent = deque(maxlen=window)
+
+    def record_success(self, latency: float) -> None:
+        with self._lock:
+            self.requests += 1
+            self._recent.append(latency)
+            self.latency = latency if self.latency is None else \
+                (1 - self.alpha) * self.latency + self.alpha * latency
+            self.error_rate = (1 - self.alpha) * self.error_rate
+
+    def record_error(self) -> None:
+        with self._lock:
+            self.requests += 1
+            self.errors += 1
+            self.last_error_at = time.monotonic()
+            self.error_rate = (1 - self.alpha) * self.error_rate + self.alpha
+
+    def percentile(self, q: float) -> Optional[float]:
+        with self._lock:
+            if not self._recent:
+                return None
+            ordered = sorted(self._recent)
+        return ordered[min(int(len(ordered) * q), len(ordered) - 1)]
+
+    @property
+    def samples(self) -> int:
+        return len(self._recent)
+
+
+class Endpoint:
+    """One api base (and its key / deployment) the router can send calls to."""
+
+    def __init__(self, client: ChatCompletionClient):
+        self.client = client
+        self.stats = EndpointStats()
+
+    @property
+    def name(self) -> str:
+        return self.client.api_base
+
+    @property
+    def circuit_breaker(self) -> CircuitBreaker:
+        return self.client.circuit_breaker
+
+    def is_healthy(self, max_error_rate: float, recovery_timeout: float) -> bool:
+        if self.circuit_breaker.state == CircuitBreaker.OPEN:
+            return False
+        # an endpoint avoided for its errors gets no traffic to lower its error rate,
+        # give it another chance once it has been quiet for a while
+        return (self.stats.error_rate < max_error_rate
+                or time.monotonic() - self.stats.last_error_at > recovery_timeout)
+
+    def score(self) -> float:
+        # endpoints without samples score 0, so each one gets tried early on
+        latency = self.stats.latency or 0.0
+        return latency * (1 + 4 * self.stats.error_rate)
+
+    def __repr__(self) -> str:
+        return (f"Endpoint({self.name}, latency={self.stats.latency}, "
+                f"error_rate={self.stats.error_rate:.2f})")
+
+
+class EndpointRouter:
+    """Drop-in replacement of `ChatCompletionClient` spreading calls over endpoints.
+
+    Each call goes to the healthy endpoint with the lowest EWMA latency (weighted by
+    its error rate) and fails over to the next one on connection, server or rate limit
+    errors. With `hedge=True` a non-streaming call still pending after the endpoint's
+    p95 latency is also sent to the runner-up, and the first answer wins.
+    """
+
+    def __init__(
+        self,
+        endpoints: Sequence[Dict[str, str]],
+        proxy: str = "",
+        max_connections: int = 10,
+        connect_timeout: float = 10,
+        hedge: bool = False,
+        hedge_min_delay: float = 1.0,
+        hedge_initial_delay: float = 5.0,
+        max_error_rate: float = 0.5,
+        recovery_timeout: float = 30.0,
+    ):
+        if not endpoints:
+            raise ValueError("EndpointRouter needs at least one endpoint")
+        self.endpoints = [
+            Endpoint(get_chat_completion_client(
+                api_key=spec["api_key"], api_base=spec["api_base"], proxy=spec.get("proxy") or proxy,
+                deployment_id=spec.get("deployment_id", ""), max_connections=max_connections,
+                connect_timeout=connect_timeout,
+            ))
+            for spec in endpoints
+        ]
+        self.hedge = hedge
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_initial_delay = hedge_initial_delay
+        self.max_error_rate = max_error_rate
+        self.recovery_timeout = recovery_timeout
+
+        self.hedged_num = 0
+        self.hedge_wins = 0
+        self.failover_num = 0
+
+    @property
+    def api_base(self) -> str:
+        return self.endpoints[0].name
+
+    def ranked_endpoints(self) -> List[Endpoint]:
+        """Healthy endpoints fastest first, then the unhealthy ones as a last resort."""
+        healthy = [e for e in self.endpoints if e.is_healthy(self.max_error_rate, self.recovery_timeout)]
+        unhealthy = [e for e in self.endpoints if e not in healthy]
+        return sorted(healthy, key=Endpoint.score) + sorted(unhealthy, key=Endpoint.score)
+
+    def hedge_delay(self, endpoint: Endpoint) -> float:
+        p95 = endpoint.stats.percentile(0.95) if endpoint.stats.samples >= 5 else None
+        return max(self.hedge_min_delay, p95 if p95 is not None else self.hedge_initial_delay)
+
+    @staticmethod
+    def _can_fail_over(exc: BaseException) -> bool:
+        # another endpoint may well answer what this one refused or dropped
+        return isinstance(exc, CircuitOpenError) or classify_error(exc) != FATAL
+
+    def _call(self, endpoint: Endpoint, kwargs: Dict[str, Any]) -> Any:
+        start = time.monotonic()
+        try:
+            response = endpoint.client.create(**kwargs)
+        except Exception:
+            endpoint.stats.record_error()
+            raise
+        endpoint.stats.record_success(time.monotonic() - start)
+        return response
+
+    async def _acall(self, endpoint: Endpoint, kwargs: Dict[str, Any]) -> Any:
+        start = time.monotonic()
+        try:
+            response = await endpoint.client.acreate(**kwargs)
+        except Exception:
+            endpoint.stats.record_error()
+            raise
+        endpoint.stats.record_success(time.monotonic() - start)
+        return response
+
+    def _hedged_call(self, primary: Endpoint, backup: Endpoint, kwargs: Dict[str, Any]) -> Any:
+        executor = get_hedge_executor()
+        futures = {submit_with_context(executor, self._call, primary, kwargs): primary}
+        done, _ = wait(futures, timeout=self.hedge_delay(primary))
+        if not done:
+            LOG.debug(f"[router] hedge {primary.name} with {backup.name}")
+            self.hedged_num += 1
+            futures[submit_with_context(executor, self._call, backup, kwargs)] = backup
+
+        error: Optional[BaseException] = None
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    # the loser can't be aborted mid-request, it finishes in the background
+                    if futures[future] is backup:
+                        self.hedge_wins += 1
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    async def _ahedged_call(self, primary: Endpoint, backup: Endpoint, kwargs: Dict[str, Any]) -> Any:
+        tasks = {asyncio.ensure_future(self._acall(primary, kwargs)): primary}
+        done, _ = await asyncio.wait(tasks, timeout=self.hedge_delay(primary))
+        if not done:
+            LOG.debug(f"[router] hedge {primary.name} with {backup.name}")
+            self.hedged_num += 1
+            tasks[asyncio.ensure_future(self._acall(backup, kwargs))] = backup
+
+        error: Optional[BaseException] = None
+        pending = set(tasks)
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if tasks[task] is backup:
+                            self.hedge_wins += 1
+                        return task.result()
+                    error = task.exception()
+        finally:
+            for task in pending:
+                task.cancel()
+        raise error
+
+    def _should_hedge(self, ranked: List[Endpoint], kwargs: Dict[str, Any]) -> bool:
+        # a stream is consumed lazily by the caller, there is no single answer to race
+        return self.hedge and len(ranked) > 1 and not kwargs.get("stream")
+
+    def create(self, **kwargs: Any) -> Any:
+        """Same as `ChatCompletionClient.create`, on the best endpoint available."""
+        ranked = self.ranked_endpoints()
+        error: Optional[BaseException] = None
+        for idx, endpoint in enumerate(ranked):
+            try:
+                if idx == 0 and self._should_hedge(ranked, kwargs):
+                    return self._hedged_call(endpoint, ranked[1], kwargs)
+                return self._call(endpoint, kwargs)
+            except Exception as e:
+                if not self._can_fail_over(e):
+                    raise
+                error = e
+                if idx + 1 < len(ranked):
+                    self.failover_num += 1
+                    LOG.warning(f"[router] {endpoint.name} failed ({e.__class__.__name__}), "
+                                f"fail over to {ranked[idx + 1].name}")
+        raise error
+
+    async def acreate(self, **kwargs: Any) -> Any:
+        """Same as `ChatCompletionClient.acreate`, on the best endpoint available."""
+        ranked = self.ranked_endpoints()
+        error: Optional[BaseException] = None
+        for idx, endpoint in enumerate(ranked):
+            try:
+                if idx == 0 and self._should_hedge(ranked, kwargs):
+                    return await self._ahedged_call(endpoint, ranked[1], kwargs)
+                return await self._acall(endpoint, kwargs)
+            except Exception as e:
+                if not self._can_fail_over(e):
+                    raise
+                error = e
+                if idx + 1 < len(ranked):
+                    self.failover_num += 1
+                    LOG.warning(f"[router] {endpoint.name} failed ({e.__class__.__name__}), "
+                                f"fail over to {ranked[idx + 1].name}")
+        raise error
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "endpoints": [
+                {
+                    "api_base": e.name,
+                    "latency": e.stats.latency,
+                    "p95": e.stats.percentile(0.95),
+                    "error_rate": round(e.stats.error_rate, 3),
+                    "requests": e.stats.requests,
+                    "errors": e.stats.errors,
+                    "circuit": e.circuit_breaker.state,
+                }
+                for e in self.endpoints
+            ],
+            "hedged": self.hedged_num,
+            "hedge_wins": self.hedge_wins,
+            "failovers": self.failover_num,
+        }
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}({[e.name for e in self.endpoints]}, hedge={self.hedge})"
+
+
+_routers: Dict[tuple, EndpointRouter] = {}
+_routers_lock = threading.Lock()
+
+
+def get_endpoint_router(
+    endpoints: Sequence[Dict[str, str]],
+    proxy: str = "",
+    max_connections: int = 10,
+    connect_timeout: float = 10,
+    hedge: bool = False,
+) -> EndpointRouter:
+    """Return the router for these endpoints, so latency stats are shared process-wide."""
+    key = (
+        tuple((e["api_base"], e["api_key"], e.get("deployment_id", ""), e.get("proxy", "")) for e in endpoints),
+        proxy, int(max_connections), float(connect_timeout), bool(hedge),
+    )
+    with _routers_lock:
+        router = _routers.get(key)
+        if router is None:
+            router = EndpointRouter(endpoints, proxy=proxy, max_connections=max_connections,
+                                    connect_timeout=connect_timeout, hedge=hedge)
+            _routers[key] = router
+            LOG.debug(f"create endpoint router: {router}")
+    return router
+
+
+if __name__ == "__main__":
+    # check routing against local stub servers: a slow one, a fast one and one answering 503
+    from concurrent.futures import wait as wait_futures
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    from ..common.concurrency import get_shared_executor
+
+    def start_stub(delay: float, status: int = 200) -> str:
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                time.sleep(delay)
+                body = json.dumps({
+                    "id": "stub", "object": "chat.completion", "model": "stub",
+                    "choices": [{"index": 0, "finish_reason": "stop",
+                                 "message": {"role": "assistant", "content": f"{delay}s"}}],
+                    "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+                } if status == 200 else {"error": {"message": "unavailable", "type": "server_error"}}).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return f"http://127.0.0.1:{server.server_port}/v1"
+
+    slow, fast, broken = [(start_stub(delay, status), "sk-stub") for delay, status in ((1.5, 200), (0.05, 200), (0, 503))]
+    request = {"model": "stub", "messages": [{"role": "user", "content": "hi"}], "request_timeout": 10}
+
+    router = EndpointRouter(parse_endpoints([broken, fast]))
+    assert router.create(**request)["choices"][0]["message"]["content"] == "0.05s"
+    assert router.failover_num == 1
+    print("failover:", router.stats())
+
+    router = EndpointRouter(parse_endpoints([slow, fast]), hedge=True,
+                            hedge_min_delay=0.1, hedge_initial_delay=0.2)
+    start = time.monotonic()
+    assert router.create(**request)["choices"][0]["message"]["content"] == "0.05s"
+    assert router.hedge_wins == 1 and time.monotonic() - start < 1.5
+    print(f"hedge: answered in {time.monotonic() - start:.2f}s, {router.stats()}")
+
+    # hedged calls made from every shared pool worker at once must not starve each other
+    router = EndpointRouter(parse_endpoints([slow, fast]), hedge=True,
+                            hedge_min_delay=0.1, hedge_initial_delay=0.2)
+    futures = [get_shared_executor().submit(router.create, **request) for _ in range(DEFAULT_MAX_WORKERS)]
+    done, not_done = wait_futures(futures, timeout=10)
+    assert not not_done and all(f.exception() is None for f in done)
+    print(f"hedge from {len(done)} shared pool workers: all answered, {router.hedged_num} hedged")
@@ -0,0 +1,123 @@
+"""Split a model's context window between the prompt, memory, scratchpad and observations."""
+from typing import Any, Dict, Optional, Tuple
+
+from ..common.log import LOG
+from . import BOT_PROMPT, DEFAULT_MODEL_NAME
+from .tokenizer import count_tokens
+
+# model name prefix -> (context window, max output tokens). None means the
+# completion shares the context window with the prompt and has no cap of its own.
+# Looked up by longest matching prefix, so dated snapshots resolve to their family.
+MODEL_TOKEN_LIMITS: Dict[str, Tuple[int, Optional[int]]] = {
+    "gpt-3.5-turbo": (4096, None),
+    "gpt-3.5-turbo-16k": (16385, None),
+    "gpt-3.5-turbo-1106": (16385, 4096),
+    "gpt-3.5-turbo-0125": (16385, 4096),
+    "gpt-3.5-turbo-instruct": (4096, None),
+    "gpt-4": (8192, None),
+    "gpt-4-32k": (32768, None),
+    "gpt-4-1106-preview": (128000, 4096),
+    "gpt-4-0125-preview": (128000, 4096),
+    "gpt-4-vision-preview": (128000, 4096),
+    "gpt-4-turbo": (128000, 4096),
+    "gpt-4o": (128000, 4096),
+}
+DEFAULT_TOKEN_LIMITS = (4096, None)
+
+
+def get_model_token_limits(model_name: str) -> Tuple[int, Optional[int]]:
+    """(context window, max output tokens) of `model_name`, 4k for unknown models."""
+    best = ""
+    for prefix in MODEL_TOKEN_LIMITS:
+        if model_name.startswith(prefix) and len(prefix) > len(best):
+            best = prefix
+    if not best:
+        LOG.debug(f"unknown context window of {model_name}, assume {DEFAULT_TOKEN_LIMITS[0]} tokens")
+        return DEFAULT_TOKEN_LIMITS
+    return MODEL_TOKEN_LIMITS[best]
+
+
+class TokenBudget:
+    """Token budget of one bot prompt.
+
+    The room left once the completion and the static part of the prompt are
+    reserved is split between memory (`memory_ratio`) and the scratchpad; a single
+    observation may take at most `observation_ratio` of the scratchpad. Until
+    `measure_prompt` is called the static prompt is assumed to be BOT_PROMPT tokens.
+    """
+
+    def __init__(
+        self,
+        model_name: str = DEFAULT_MODEL_NAME,
+        max_output_tokens: Optional[int] = None,
+        memory_ratio: float = 0.25,
+        observation_ratio: float = 0.5,
+        safety_margin: int = 200,
+        min_scratchpad_tokens: int = 500,
+    ):
+        self.model_name = model_name
+        self.context_window, model_max_output = get_model_token_limits(model_name)
+        output_tokens = max_output_tokens or model_max_output or self.context_window // 4
+        if model_max_output:
+            output_tokens = min(output_tokens, model_max_output)
+        # a max_tokens as large as the whole window would leave no room for the prompt
+        self.output_tokens = min(output_tokens, self.context_window // 2)
+        self.memory_ratio = memory_ratio
+        self.observation_ratio = observation_ratio
+        self.safety_margin = safety_margin
+        self.min_scratchpad_tokens = min_scratchpad_tokens
+        self.static_prompt_tokens = BOT_PROMPT
+
+    def measure_prompt(self, prompt: Any) -> int:
+        """Count the tokens of `prompt` formatted with empty variables, once per budget."""
+        try:
+            static_text = prompt.format(**{name: "" for name in prompt.input_variables})
+        except Exception as e:
+            LOG.debug(f"can't measure the static prompt, keep {self.static_prompt_tokens} tokens: {repr(e)}")
+            return self.static_prompt_tokens
+        self.static_prompt_tokens = count_tokens(static_text, self.model_name)
+        return self.static_prompt_tokens
+
+    @property
+    def prompt_limit(self) -> int:
+        """Most tokens the whole prompt may have."""
+        return self.context_window - self.output_tokens - self.safety_margin
+
+    @property
+    def available(self) -> int:
+        """Room left for the variables of the prompt."""
+        return max(self.prompt_limit - self.static_prompt_tokens, 0)
+
+    @property
+    def memory_limit(self) -> int:
+        return int(self.available * self.memory_ratio)
+
+    @property
+    def scratchpad_limit(self) -> int:
+        return max(self.available - self.memory_limit, self.min_scratchpad_tokens)
+
+    @property
+    def observation_limit(self) -> int:
+        return int(self.scratchpad_limit * self.observation_ratio)
+
+    def remaining(self, *texts: str) -> int:
+        """Room left for the scratchpad once `texts` (input, chat history...) are in the prompt."""
+        used = sum(count_tokens(str(text), self.model_name) for text in texts if text)
+        return max(self.available - used, self.min_scratchpad_tokens)
+
+    def __repr__(self) -> str:
+        return (f"{self.__class__.__name__}(model={self.model_name}, context={self.context_window}, "
+                f"output={self.output_tokens}, static_prompt={self.static_prompt_tokens}, "
+                f"memory={self.memory_limit}, scratchpad={self.scratchpad_limit})")
+
+
+def get_token_budget(llm: Any, prompt: Any = None, **kwargs: Any) -> TokenBudget:
+    """Budget of a prompt sent to `llm`, with the static part of `prompt` measured if given."""
+    budget = TokenBudget(
+        model_name=getattr(llm, "llm_model_name", None) or DEFAULT_MODEL_NAME,
+        max_output_tokens=getattr(llm, "max_tokens", None),
+        **kwargs,
+    )
+    if prompt is not None:
+        budget.measure_prompt(prompt)
+    return budget
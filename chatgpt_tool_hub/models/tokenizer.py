@@ -0,0 +1,126 @@
+"""Process-wide tokenizer: cached encoders and a bounded cache of token counts."""
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from ..common.log import LOG
+from . import DEFAULT_MODEL_NAME
+
+DEFAULT_ENCODING_NAME = "cl100k_base"
+
+# strings longer than this are rarely counted twice (scratchpads, fetched pages),
+# keep them out of the count cache
+MAX_CACHED_TEXT_LENGTH = 8192
+
+
+@lru_cache(maxsize=None)
+def get_encoding(encoding_name: str = DEFAULT_ENCODING_NAME) -> Any:
+    """Return the tiktoken encoding called `encoding_name`, loaded once."""
+    import tiktoken
+
+    return tiktoken.get_encoding(encoding_name)
+
+
+@lru_cache(maxsize=None)
+def get_encoding_for_model(model_name: str = DEFAULT_MODEL_NAME) -> Any:
+    """Return the tiktoken encoding of `model_name`, cl100k_base for unknown models."""
+    import tiktoken
+
+    try:
+        return tiktoken.encoding_for_model(model_name)
+    except KeyError:
+        LOG.debug(f"model {model_name} not found in tiktoken, use {DEFAULT_ENCODING_NAME} encoding.")
+        return get_encoding(DEFAULT_ENCODING_NAME)
+
+
+class TokenCountCache:
+    """Thread-safe LRU of (encoding name, text) -> token count."""
+
+    def __init__(self, max_entries: int = 4096):
+        self.max_entries = max_entries
+        self._data: "OrderedDict[Tuple[str, str], int]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Tuple[str, str]) -> Optional[int]:
+        with self._lock:
+            count = self._data.get(key)
+            if count is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return count
+
+    def put(self, key: Tuple[str, str], count: int) -> None:
+        if len(key[1]) > MAX_CACHED_TEXT_LENGTH:
+            return
+        with self._lock:
+            self._data[key] = count
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._data)}
+
+
+token_count_cache = TokenCountCache()
+
+
+def encode(text: str, model_name: str = DEFAULT_MODEL_NAME) -> List[int]:
+    """Token ids of `text`, special tokens are encoded as plain text."""
+    return get_encoding_for_model(model_name).encode_ordinary(text)
+
+
+def encode_batch(texts: Sequence[str], model_name: str = DEFAULT_MODEL_NAME) -> List[List[int]]:
+    """Token ids of every text, encoded in parallel by tiktoken."""
+    return get_encoding_for_model(model_name).encode_ordinary_batch(list(texts))
+
+
+def count_tokens(text: str, model_name: str = DEFAULT_MODEL_NAME) -> int:
+    """Number of tokens in `text`, memoized for short strings."""
+    if not text:
+        return 0
+    encoding = get_encoding_for_model(model_name)
+    key = (encoding.name, text)
+    count = token_count_cache.get(key)
+    if count is None:
+        count = len(encoding.encode_ordinary(text))
+        token_count_cache.put(key, count)
+    return count
+
+
+def count_tokens_batch(texts: Sequence[str], model_name: str = DEFAULT_MODEL_NAME) -> List[int]:
+    """Number of tokens of every text, encoding only the ones not cached yet in one batch."""
+    encoding = get_encoding_for_model(model_name)
+    counts: List[Optional[int]] = []
+    missing: Dict[str, List[int]] = {}
+    for idx, text in enumerate(texts):
+        count = token_count_cache.get((encoding.name, text)) if text else 0
+        counts.append(count)
+        if count is None:
+            missing.setdefault(text, []).append(idx)
+
+    if missing:
+        missing_texts = list(missing)
+        for text, tokens in zip(missing_texts, encoding.encode_ordinary_batch(missing_texts)):
+            token_count_cache.put((encoding.name, text), len(tokens))
+            for idx in missing[text]:
+                counts[idx] = len(tokens)
+    return counts
+
+
+def truncate_tokens(text: str, max_tokens: int, model_name: str = DEFAULT_MODEL_NAME) -> str:
+    """First `max_tokens` tokens of `text`, `text` itself if it is short enough."""
+    if count_tokens(text, model_name) <= max_tokens:
+        return text
+    encoding = get_encoding_for_model(model_name)
+    return encoding.decode(encoding.encode_ordinary(text)[:max_tokens])
@@ -3,18 +3,20 @@ from __future__ import annotations
 
 import json
 from abc import ABC, abstractmethod
+from functools import lru_cache
 from pathlib import Path
 from typing import Any, Callable, Dict, List, Mapping, Optional, Union
 
 import yaml
 from pydantic import BaseModel, Field, model_validator
 
-from ..common.formatting import formatter
+from ..common.formatting import format_template
 from ..common.schema import BaseMessage, BaseOutputParser, HumanMessage, PromptValue
 
 
-def jinja2_formatter(template: str, **kwargs: Any) -> str:
-    """Format a template using jinja2."""
+@lru_cache(maxsize=128)
+def compile_jinja2_template(template: str) -> Any:
+    """Return the jinja2 Template of `template`, compiled once per distinct template."""
     try:
         from jinja2 import Template
     except ImportError:
@@ -23,11 +25,16 @@ def jinja2_formatter(template: str, **kwargs: Any) -> str:
             "Please install it with `pip install jinja2`."
         )
 
-    return Template(template).render(**kwargs)
+    return Template(template)
+
+
+def jinja2_formatter(template: str, **kwargs: Any) -> str:
+    """Format a template using jinja2."""
+    return compile_jinja2_template(template).render(**kwargs)
 
 
 DEFAULT_FORMATTER_MAPPING: Dict[str, Callable] = {
-    "f-string": formatter.format,
+    "f-string": format_template,
     "jinja2": jinja2_formatter,
 }
 
@@ -3,15 +3,16 @@ from __future__ import annotations
 
 from pathlib import Path
 from string import Formatter
-from typing import Any, List, Union
+from typing import Any, List, Optional, Union
 
-from pydantic import BaseModel
+from pydantic import BaseModel, PrivateAttr, model_validator
 
 from .base import (
     DEFAULT_FORMATTER_MAPPING,
     StringPromptTemplate,
     check_valid_template,
 )
+from ..common.formatting import CompiledTemplate, compile_template
 
 
 class PromptTemplate(StringPromptTemplate, BaseModel):
@@ -36,6 +37,8 @@ class PromptTemplate(StringPromptTemplate, BaseModel):
     validate_template: bool = True
     """Whether or not to try validating the template."""
 
+    _compiled: Optional[CompiledTemplate] = PrivateAttr(default=None)
+
     @property
     def _prompt_type(self) -> str:
         """Return the prompt type key."""
@@ -46,6 +49,13 @@ class PromptTemplate(StringPromptTemplate, BaseModel):
 
         extra = 'forbid'
 
+    @model_validator(mode='after')
+    def compile_f_string(self) -> PromptTemplate:
+        """Parse an f-string template once, instead of on every format."""
+        if self.template_format == "f-string":
+            self._compiled = compile_template(self.template)
+        return self
+
     def format(self, **kwargs: Any) -> str:
         """Format the prompt with the inputs.
 
@@ -62,7 +72,13 @@ class PromptTemplate(StringPromptTemplate, BaseModel):
             prompt.format(variable1="foo")
         """
         kwargs = self._merge_partial_and_user_variables(**kwargs)
-        return DEFAULT_FORMATTER_MAPPING[self.template_format](self.template, **kwargs)
+        if self.template_format != "f-string":
+            return DEFAULT_FORMATTER_MAPPING[self.template_format](self.template, **kwargs)
+        compiled = self._compiled
+        if compiled is None or compiled.template is not self.template:
+            # the template was reassigned after construction
+            compiled = self._compiled = compile_template(self.template)
+        return compiled.format(**kwargs)
 
     @classmethod
     def from_examples(
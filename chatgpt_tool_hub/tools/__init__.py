@@ -40,11 +40,12 @@ def dynamic_tool_loader(**kwargs):
     for tool in invalid_tool_list:
         main_tool_register.unregister_tool(tool)
 
-from .base_tool import BaseTool
+from .base_tool import BaseTool, ErrorObservation
 from .summary import SummaryTool
 
 __all__ = [
     "BaseTool",
+    "ErrorObservation",
     "SummaryTool",
 
     "ToolRegister",
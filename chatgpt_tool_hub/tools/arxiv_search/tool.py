@@ -18,6 +18,7 @@ default_tool_name = "arxiv"
 class ArxivTool(BaseTool):
     """ a tool to call arxiv api """
     name: str = default_tool_name
+    cache_ttl: float = 86400  # 1 day
     description: str = (
         "Useful for when you need to answer questions about scientific research or search for papers "
         "Like: which papers has a certain author published? "
@@ -38,6 +39,12 @@ class ArxivTool(BaseTool):
             template=ARXIV_PROMPT,
         ))
 
+    @property
+    def cache_namespace(self) -> str:
+        w = self.api_wrapper
+        return (f"{super().cache_namespace}:top_k={w.arxiv_top_k_results}:simple={w.arxiv_simple}"
+                f":output={w.arxiv_output_type}:sort={w.arxiv_sort_by},{w.arxiv_sort_order}:debug={bool(self.debug)}")
+
     def _run(self, query: str) -> str:
         """Use the Arxiv tool."""
 
@@ -5,6 +5,7 @@ from pydantic import BaseModel, model_validator
 
 from ...common.utils import get_from_dict_or_env
 from ...common.log import LOG
+from ..base_tool import ErrorObservation
 
 class OutputType(str, Enum):
     Text = "text"
@@ -71,7 +72,7 @@ class ArxivAPIWrapper(BaseModel):
     def run(self, query_json_str: str, retry_num: int = 0, **kwargs) -> str:
         import arxiv
         if (retry_num > self.max_retry_num):
-            return "exceed max_retry_num"
+            return ErrorObservation("exceed max_retry_num")
         
         query_json = json.loads(query_json_str)
 
@@ -1,12 +1,29 @@
 """Base implementation for tools."""
+import time
 from abc import abstractmethod
 from typing import Any, Optional
 
 from pydantic import BaseModel, Field, field_validator
 from rich.console import Console
 
+from ..common.cache import BaseObservationCache, InMemoryObservationCache
 from ..common.callbacks import BaseCallbackManager
+from ..common.concurrency import get_tool_executor, run_in_executor
 from ..common.callbacks import get_callback_manager
+from ..common.metrics import TOOL_CACHE_LOOKUPS, TOOL_CALLS, TOOL_SECONDS
+
+# observation cache shared by every tool, only tools declaring a cache_ttl use it.
+# assign a SQLiteObservationCache to keep observations across restarts, None disables caching
+observation_cache: Optional[BaseObservationCache] = InMemoryObservationCache()
+
+
+def get_observation_cache() -> Optional[BaseObservationCache]:
+    """Return the cache currently assigned to `base_tool.observation_cache`."""
+    return observation_cache
+
+
+class ErrorObservation(str):
+    """An observation reporting a failure: handed to the bot like any other, but never cached."""
 
 
 class BaseTool(BaseModel):
@@ -17,6 +34,12 @@ class BaseTool(BaseModel):
     version: str = "1.0"
     author: str = ""
     return_direct: bool = False
+    # calls of this tool one engine step may run at once, None leaves it to the engine
+    max_concurrency: Optional[int] = None
+    # seconds an observation may be reused for the same input, None: never cached
+    cache_ttl: Optional[float] = None
+    # tools acting on the world (sending messages, running commands) are never cached
+    side_effects: bool = False
     verbose: bool = False
     bot: Any = None  # TODO replace `Any`
     console: Optional[Console]
@@ -42,9 +65,47 @@ class BaseTool(BaseModel):
     def _run(self, tool_input: str) -> str:
         """Use the tool."""
 
-    @abstractmethod
     async def _arun(self, tool_input: str) -> str:
-        """Use the tool asynchronously."""
+        """Use the tool asynchronously, tools without it run `_run` on the tool pool."""
+        raise NotImplementedError(f"{self.name} does not support async")
+
+    @property
+    def cache_namespace(self) -> str:
+        """Part of the cache key telling this tool apart.
+
+        Observations are shared by every instance with the same namespace, so
+        tools override this to add the settings changing their output (result
+        count, output format, endpoint...): apps configured differently mustn't
+        get each other's results.
+        """
+        return f"{self.name}@{self.version}"
+
+    @property
+    def cacheable(self) -> bool:
+        return bool(self.cache_ttl) and not self.side_effects and get_observation_cache() is not None
+
+    @staticmethod
+    def normalize_input(tool_input: str) -> str:
+        """Cache key of an input, inputs differing only by whitespace share it."""
+        return " ".join(str(tool_input).split())
+
+    def _lookup_cache(self, tool_input: str) -> Optional[str]:
+        if not self.cacheable:
+            return None
+        return get_observation_cache().lookup(self.cache_namespace, self.normalize_input(tool_input))
+
+    def _update_cache(self, tool_input: str, observation: str) -> None:
+        # an empty observation is more likely a hiccup than an answer worth keeping
+        if self.cacheable and observation and not isinstance(observation, ErrorObservation):
+            get_observation_cache().update(self.cache_namespace, self.normalize_input(tool_input),
+                                           observation, self.cache_ttl)
+
+    def _record_cache_lookup(self, hit: bool) -> None:
+        TOOL_CACHE_LOOKUPS.inc(tool=self.name, result="hit" if hit else "miss")
+
+    def _record_call(self, start: float, status: str) -> None:
+        TOOL_SECONDS.observe(time.perf_counter() - start, tool=self.name)
+        TOOL_CALLS.inc(tool=self.name, status=status)
 
     def __call__(self, tool_input: str) -> str:
         """Make tools callable with str input."""
@@ -68,11 +129,20 @@ class BaseTool(BaseModel):
             color=start_color,
             **kwargs,
         )
+        start = time.perf_counter()
         try:
-            observation = self._run(tool_input)
+            observation = self._lookup_cache(tool_input)
+            if self.cacheable:
+                self._record_cache_lookup(observation is not None)
+                self.callback_manager.on_tool_cache(self.name, tool_input, observation is not None, verbose=verbose)
+            if observation is None:
+                observation = self._run(tool_input)
+                self._update_cache(tool_input, observation)
         except (Exception, KeyboardInterrupt) as e:
+            self._record_call(start, "error")
             self.callback_manager.on_tool_error(e, verbose=verbose)
             raise e
+        self._record_call(start, "error" if isinstance(observation, ErrorObservation) else "ok")
         self.callback_manager.on_tool_end(
             observation, verbose=verbose, color=color, **kwargs
         )
@@ -105,15 +175,33 @@ class BaseTool(BaseModel):
                 color=start_color,
                 **kwargs,
             )
+        start = time.perf_counter()
         try:
-            # We then call the tool on the tool input to get an observation
-            observation = await self._arun(tool_input)
+            observation = self._lookup_cache(tool_input)
+            if self.cacheable:
+                self._record_cache_lookup(observation is not None)
+                if self.callback_manager.is_async:
+                    await self.callback_manager.on_tool_cache(self.name, tool_input, observation is not None,
+                                                              verbose=verbose)
+                else:
+                    self.callback_manager.on_tool_cache(self.name, tool_input, observation is not None,
+                                                        verbose=verbose)
+            if observation is None:
+                # We then call the tool on the tool input to get an observation
+                try:
+                    observation = await self._arun(tool_input)
+                except NotImplementedError:
+                    # sync-only tool, keep the event loop free while it works
+                    observation = await run_in_executor(self._run, tool_input, executor=get_tool_executor())
+                self._update_cache(tool_input, observation)
         except (Exception, KeyboardInterrupt) as e:
+            self._record_call(start, "error")
             if self.callback_manager.is_async:
                 await self.callback_manager.on_tool_error(e, verbose=verbose)
             else:
                 self.callback_manager.on_tool_error(e, verbose=verbose)
             raise e
+        self._record_call(start, "error" if isinstance(observation, ErrorObservation) else "ok")
         if self.callback_manager.is_async:
             await self.callback_manager.on_tool_end(
                 observation, verbose=verbose, color=color, **kwargs
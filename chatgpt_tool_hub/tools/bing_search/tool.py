@@ -23,6 +23,7 @@ class BingSearchTool(BaseTool):
     """
 
     name: str = default_tool_name
+    cache_ttl: float = 3600  # 1 hour
     description: str = (
         "A wrapper around Bing Search. "
         "Useful for when you need to answer questions about current events. "
@@ -40,6 +41,12 @@ class BingSearchTool(BaseTool):
 
         self.debug = get_from_dict_or_env(tool_kwargs, "bing_search_debug", "BING_SEARCH_DEBUG", False)
 
+    @property
+    def cache_namespace(self) -> str:
+        w = self.api_wrapper
+        return (f"{super().cache_namespace}:top_k={w.bing_search_top_k_results}:simple={w.bing_search_simple}"
+                f":output={w.bing_search_output_type}:url={w.bing_search_url}:debug={bool(self.debug)}")
+
     def _run(self, query: str) -> str:
         """Use the tool."""
         query = self.bot(query)
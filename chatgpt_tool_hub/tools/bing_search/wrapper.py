@@ -6,6 +6,7 @@ from pydantic import BaseModel, model_validator
 
 from ...common.log import LOG
 from ...common.utils import get_from_dict_or_env
+from ..base_tool import ErrorObservation
 from ..web_requests import filter_text
 from ..web_requests.wrapper import RequestsWrapper
 
@@ -78,7 +79,7 @@ class BingSearchAPIWrapper(BaseModel):
             return self.to_json(query)
         results = self._bing_search_results(query, count=self.bing_search_top_k_results)
         if len(results) == 0:
-            return "No good Bing Search Result was found"
+            return ErrorObservation("No good Bing Search Result was found")
         
         _contents = []
         for idx, result in enumerate(results):
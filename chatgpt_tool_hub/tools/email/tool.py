@@ -28,6 +28,7 @@ class EmailTool(BaseTool):
     https://service.mail.qq.com/detail/0/75"""
 
     name: str = default_tool_name
+    side_effects: bool = True
     description: str = (
         "A Tool can send email. "
     )
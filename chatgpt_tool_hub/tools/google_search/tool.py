@@ -20,6 +20,7 @@ class GoogleSearchTool(BaseTool):
     """Tool that adds the capability to query the Google search API."""
 
     name: str = default_tool_name
+    cache_ttl: float = 3600  # 1 hour
     description: str = (
         "A wrapper around Google Search. "
         "Useful for when you need to answer questions about current events. "
@@ -37,6 +38,12 @@ class GoogleSearchTool(BaseTool):
 
         self.debug = get_from_dict_or_env(tool_kwargs, "google_debug", "GOOGLE_DEBUG", False)
 
+    @property
+    def cache_namespace(self) -> str:
+        w = self.api_wrapper
+        return (f"{super().cache_namespace}:top_k={w.google_top_k_results}:simple={w.google_simple}"
+                f":output={w.google_output_type}:cse={w.google_cse_id}:debug={bool(self.debug)}")
+
     def _run(self, query: str) -> str:
         """Use the tool."""
         query = self.bot(query)
@@ -6,6 +6,7 @@ from pydantic import BaseModel, model_validator
 
 from ...common.log import LOG
 from ...common.utils import get_from_dict_or_env
+from ..base_tool import ErrorObservation
 from ..web_requests import filter_text
 
 class OutputType(str, Enum):
@@ -108,7 +109,7 @@ class GoogleSearchAPIWrapper(BaseModel):
             return self.to_json(query)
         results = self._google_search_results(query, num=self.google_top_k_results)
         if len(results) == 0:
-            return "No good Google Search Result was found"
+            return ErrorObservation("No good Google Search Result was found")
         LOG.debug(f"[google_search] output: {str(results)}")
 
         _contents = []
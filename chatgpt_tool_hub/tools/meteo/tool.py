@@ -14,6 +14,7 @@ default_tool_name = "meteo"
 
 class MeteoWeatherTool(BaseTool):
     name: str = default_tool_name
+    cache_ttl: float = 900  # 15 minutes
     description: str = (
         "When you want to obtain weather information, use this tool. Analyze which weather information the user wants, "
         "describe the problem rigorously in natural language, and then pass it on to this tool."
@@ -1,6 +1,7 @@
 """A tool for running python code in a REPL."""
 
 import sys
+import threading
 from io import StringIO
 from typing import Any
 from typing import Dict, Optional
@@ -20,6 +21,8 @@ from .prompt import QUERY_PROMPT
 
 default_tool_name = "python"
 
+_stdout_lock = threading.Lock()
+
 
 class PythonREPL(BaseModel):
     """Simulates a standalone Python REPL."""
@@ -29,24 +32,26 @@ class PythonREPL(BaseModel):
 
     def run(self, command: str) -> str:
         """Run command with own globals/locals and returns anything printed."""
-        # Stores the original stdout for later use
-        old_stdout = sys.stdout
-        # Redirects the stdout to a StringIO object for capturing printed output
-        sys.stdout = mystdout = StringIO()
-
         # 过滤所有`字符，换行符统一单行
         command = "\n".join(filter(lambda s: s, command.split("\n"))).replace("`", "").strip()
 
-        try:
-            exec(command, self.globals, self.locals)
-            sys.stdout = old_stdout
-            # Retrieves the captured output from the StringIO object
-            output = mystdout.getvalue()
-            LOG.debug(f"[python] output: {str(output)}")
-        except Exception as e:
-            sys.stdout = old_stdout
-            output = repr(e)
-            LOG.error(f"[python] {output}")
+        # sys.stdout is process-wide, two commands capturing it at once would
+        # mix their outputs and could leave it redirected for good
+        with _stdout_lock:
+            # Stores the original stdout for later use
+            old_stdout = sys.stdout
+            # Redirects the stdout to a StringIO object for capturing printed output
+            sys.stdout = mystdout = StringIO()
+            try:
+                exec(command, self.globals, self.locals)
+                # Retrieves the captured output from the StringIO object
+                output = mystdout.getvalue()
+                LOG.debug(f"[python] output: {str(output)}")
+            except Exception as e:
+                output = repr(e)
+                LOG.error(f"[python] {output}")
+            finally:
+                sys.stdout = old_stdout
         return output
 
 
@@ -58,6 +63,8 @@ class PythonTool(BaseTool):
     """A tool for running python code in a REPL."""
 
     name: str = default_tool_name
+    side_effects: bool = True
+    max_concurrency: Optional[int] = 1
     description: str = (
         "A Python shell. Use this to execute python commands. "
         "Input should be a valid python command. "
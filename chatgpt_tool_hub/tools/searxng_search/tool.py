@@ -20,6 +20,7 @@ class SearXNGSearchTool(BaseTool):
     """Tool that adds the capability to query a Searx instance."""
 
     name: str = default_tool_name
+    cache_ttl: float = 3600  # 1 hour
     description: str = (
         "A meta search engine."
         "Useful for when you need to answer questions about current events."
@@ -37,6 +38,13 @@ class SearXNGSearchTool(BaseTool):
 
         self.debug = get_from_dict_or_env(tool_kwargs, "searxng_search_debug", "SEARXNG_SEARCH_DEBUG", False)
 
+    @property
+    def cache_namespace(self) -> str:
+        w = self.api_wrapper
+        return (f"{super().cache_namespace}:top_k={w.searxng_search_top_k_results}"
+                f":output={w.searxng_search_output_type}:host={w.searxng_search_host}"
+                f":params={sorted(w.params.items())}:debug={bool(self.debug)}")
+
     def _run(self, query: str) -> str:
         """Use the tool."""
         query = self.bot(query)
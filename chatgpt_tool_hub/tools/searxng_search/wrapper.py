@@ -37,6 +37,7 @@ import aiohttp
 from pydantic import BaseModel, Field, PrivateAttr, model_validator, field_validator
 from ...common.log import LOG
 from ...common.utils import get_from_dict_or_env
+from ..base_tool import ErrorObservation
 from ..web_requests import RequestsWrapper, filter_text
 
 
@@ -277,7 +278,7 @@ class SearxSearchWrapper(BaseModel):
                 _contents.append(f"{_header}\n{_body}\n[{_link}]\n\n---\n")
             return "\n".join(_contents)
 
-        return "No good search result found"
+        return ErrorObservation("No good search result found")
 
     async def arun(
         self,
@@ -312,7 +313,7 @@ class SearxSearchWrapper(BaseModel):
                 [r.get("content", "") for r in res.results[: self.searxng_search_top_k_results]]
             )
         else:
-            return "No good search result found"
+            return ErrorObservation("No good search result found")
 
     def to_json(
         self,
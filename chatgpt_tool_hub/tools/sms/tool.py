@@ -23,6 +23,7 @@ class SMSTool(BaseTool):
     https://www.smsbao.com/openapi"""
 
     name: str = default_tool_name
+    side_effects: bool = True
     description: str = (
         "A Tool can send short sessage. "
     )
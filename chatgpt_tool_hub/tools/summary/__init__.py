@@ -1,5 +1,6 @@
-from .tool import SummaryTool
+from .tool import SummaryTool, get_summary_tool
 
 __all__ = [
-    "SummaryTool"
-]
\ No newline at end of file
+    "SummaryTool",
+    "get_summary_tool",
+]
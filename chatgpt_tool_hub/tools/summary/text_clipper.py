@@ -1,6 +1,7 @@
 from typing import List
 
 from ...models.calculate_token import count_string_tokens as get_token_num
+from ...models.tokenizer import count_tokens_batch
 
 
 class TextClipper:
@@ -36,14 +37,18 @@ class TextClipper:
         segments = text.split(self.seperator)
         segments = list(filter(lambda x: x.strip() != "", segments))
         _segment_num = len(segments)
+        # count every segment once, a merged chunk is about the sum of its parts
+        _segment_tokens = count_tokens_batch(segments)
+        _seperator_tokens = get_token_num(self.seperator)
 
         clip_list = []
         segment_cache = ""
+        cache_token_num = 0
 
         now_ctn, total_ctn = 0, 0
         for iter in range(_segment_num):
             _mix_text = self.seperator.join([segment_cache, segments[iter]])
-            _token_num_of_mix = get_token_num(_mix_text)
+            _token_num_of_mix = cache_token_num + _seperator_tokens + _segment_tokens[iter]
             if _token_num_of_mix > self.max_segment_length:
                 # 长文本
                 if now_ctn == 1:
@@ -57,9 +62,11 @@ class TextClipper:
                     segment_cache = ""
                     break
                 segment_cache = segments[iter]
+                cache_token_num = _segment_tokens[iter]
                 now_ctn = 1
             else:
                 segment_cache = _mix_text
+                cache_token_num = _token_num_of_mix
                 now_ctn += 1
         if segment_cache:
             clip_list.extend(self._clip_single_long_text(segment_cache))
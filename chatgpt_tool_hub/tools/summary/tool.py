@@ -1,6 +1,8 @@
 import os
-import asyncio
-from typing import Any, List
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Optional, Tuple
 
 from rich.console import Console
 from rich.panel import Panel
@@ -8,6 +10,9 @@ from rich.panel import Panel
 from ...chains.llm import LLMChain
 from ...models.calculate_token import count_string_tokens as get_token_num
 from ...common.log import LOG
+from ...common.schema import BaseLanguageModel
+from ...common.metrics import SUMMARY_ROUNDS
+from ...common.tracing import trace_span
 from ...common.utils import get_from_dict_or_env
 from ...models import build_model_params
 from ...models.model_factory import ModelFactory
@@ -35,52 +40,41 @@ class SummaryTool(BaseTool):
     reduce_bot: Any = None
     clipper: TextClipper = None
 
-    def __init__(self, console: Console = Console(), **tool_kwargs: Any):
+    def __init__(self, console: Console = Console(), llm: Optional[BaseLanguageModel] = None, **tool_kwargs: Any):
         super().__init__(console=console)
         # 总结到多少token停止
         self.max_segment_length = get_from_dict_or_env(tool_kwargs, "summary_max_segment_length", "SUMMARY_MAX_SEGMENT_LENGTH", 2500)
         if self.max_segment_length < 500: self.max_segment_length = 500  # avoid too small
         if self.max_segment_length > 4000: self.max_segment_length = 4000 # upper bound
-        llm = ModelFactory().create_llm_model(**build_model_params(tool_kwargs))
+        # the caller's llm, e.g. the bot's, else one built from tool_kwargs and the environment
+        llm = llm or ModelFactory().create_llm_model(**build_model_params(tool_kwargs))
 
         self.map_bot = LLMChain(llm=llm, prompt=MAP_QUERY_PROMPT)
         self.reduce_bot = LLMChain(llm=llm, prompt=REDUCE_QUERY_PROMPT)
         self.clipper = TextClipper(self.max_segment_length)
 
-    async def _acall(self, bot: LLMChain, clip_text_list: List[str]):
-        tasks = []
-        for text in clip_text_list:
-            task = asyncio.create_task(bot.arun(text=text))
-            tasks.append(task)
-        return await asyncio.gather(*tasks)
-
-    def _summary(self, text: str) -> str:
+    def _summary(self, text: str, max_tokens: Optional[int] = None) -> str:
         ctn = 0
         _text = text
-        while get_token_num(_text) >= self.max_segment_length:
+        max_tokens = max_tokens or self.max_segment_length
+        while get_token_num(_text) >= max_tokens:
             ctn += 1
             if ctn > 3:
                 LOG.warning(f"[summary] 我已经map-reduce {ctn}轮了，但是文本量还是很长，避免死循环我帮你关掉了~")
                 break
             # map
             _clip_text_list = self.clipper.clip(_text)
-            map_text_list = []
-            for _clip_text in _clip_text_list:
-                map_text_list.append(self.map_bot(_clip_text)["text"])
-                # TODO has serious performance issues.
-                # asyncio.run(self._acall(self.map_bot, _clip_text_list))
+            # chunks are independent, LLMChain.apply runs them concurrently
+            with trace_span("summary.map", round=ctn, chunks=len(_clip_text_list)):
+                map_text_list = [res["text"] for res in self.map_bot.apply([{"text": t} for t in _clip_text_list])]
 
             map_text = self.clipper.seperator.join(map_text_list)
             LOG.debug(f"[summary] round:{ctn}, map_text: \n{map_text}")
             # reduce
             _clip_summary_list = self.clipper.clip(map_text)
+            with trace_span("summary.reduce", round=ctn, chunks=len(_clip_summary_list)):
+                reduce_text_list = [res["text"] for res in self.reduce_bot.apply([{"text": t} for t in _clip_summary_list])]
 
-            reduce_text_list = []
-            for _clip_text in _clip_summary_list:
-                reduce_text_list.append(self.reduce_bot(_clip_text)["text"])
-            # TODO has serious performance issues.
-            # reduce_text_list = asyncio.run(self._acall(self.reduce_bot, _clip_summary_list))
-                
             reduce_text = self.clipper.seperator.join(reduce_text_list)
             LOG.debug(f"[summary] round:{ctn}, reduce_text: \n{reduce_text}")
             _text = reduce_text
@@ -89,6 +83,8 @@ class SummaryTool(BaseTool):
                                         title=f"[bright_magenta]Summary tool[/] 第{ctn}轮总结",
                                         highlight=True))
             
+        # the round that hit the limit broke out before running
+        SUMMARY_ROUNDS.observe(min(ctn, 3))
         if self.console and ctn > 2:
             self.console.print(Panel(f"{_text}",
                                     title=f"[bright_magenta]Summary tool[/] 最终总结",
@@ -103,8 +99,9 @@ class SummaryTool(BaseTool):
             source_text = f.read()
         return self._summary(source_text)
 
-    def text(self, text: str) -> str:
-        return self._summary(text)
+    def text(self, text: str, max_tokens: Optional[int] = None) -> str:
+        """summarize text in memory until it is shorter than max_tokens (default max_segment_length)"""
+        return self._summary(text, max_tokens)
 
     def _run(self, url: str) -> str:
         """run the tool"""
@@ -121,9 +118,34 @@ class SummaryTool(BaseTool):
             LOG.error(repr(e))
             return "[summary] unknown error"
 
-    async def _arun(self, url: str) -> str:
-        """use this tool async."""
-        raise NotImplementedError("summary tool not support async yet")
+
+# summary tools kept for reuse, the least recently used beyond this many are dropped
+MAX_SHARED_SUMMARY_TOOLS = 32
+
+_summary_tools: "OrderedDict[Tuple[int, int, str], SummaryTool]" = OrderedDict()
+_summary_tools_lock = threading.Lock()
+
+
+def get_summary_tool(
+    console: Optional[Console] = None, llm: Optional[BaseLanguageModel] = None, **tool_kwargs: Any
+) -> SummaryTool:
+    """Return the long-lived SummaryTool for this console, llm and these settings.
+
+    Use it with `.text(...)` to summarize in memory, without building llm chains per call.
+    A kept tool holds its console and llm, so their ids can't be reused while it is kept.
+    """
+    key = (id(console), id(llm), json.dumps(tool_kwargs, sort_keys=True, default=str))
+    with _summary_tools_lock:
+        tool = _summary_tools.get(key)
+        if tool is None:
+            tool = SummaryTool(console, llm=llm, **tool_kwargs)
+            _summary_tools[key] = tool
+            while len(_summary_tools) > MAX_SHARED_SUMMARY_TOOLS:
+                _summary_tools.popitem(last=False)
+        else:
+            _summary_tools.move_to_end(key)
+    return tool
+
 
 # register the tool
 main_tool_register.register_tool(default_tool_name, lambda console=None, **kwargs: SummaryTool(console, **kwargs), [])
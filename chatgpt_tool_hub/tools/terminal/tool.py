@@ -5,6 +5,7 @@ from typing import Any, List, Union, Optional
 
 from rich.console import Console
 
+from ...common.deadline import bound_timeout
 from ...common.log import LOG
 from ...chains.llm import LLMChain
 from ...models import build_model_params
@@ -79,7 +80,8 @@ class BashProcess:
                 check=True,  # raises a CalledProcessError when exit code is non-zero
                 stdout=subprocess.PIPE,
                 stderr=subprocess.STDOUT,
-                timeout=self.timeout  # raises TimeoutExpired after running 20s
+                # raises TimeoutExpired after running 20s, or at the request deadline
+                timeout=bound_timeout(float(self.timeout))
             ).stdout.decode()
         except subprocess.CalledProcessError as error:
             LOG.error(f"[Terminal] {str(error)}")
@@ -95,6 +97,8 @@ class BashProcess:
 
 class TerminalTool(BaseTool):
     name: str = default_tool_name
+    side_effects: bool = True
+    max_concurrency: Optional[int] = 1
     description: str = (
         f"Executes commands in a terminal. Input should be valid commands in {sys.platform} platform, "
         "and the output will be any output from running that command."
@@ -1,14 +1,12 @@
 """Tools for making requests to an API endpoint."""
 import re
-import os
-import tempfile
 
 from bs4 import BeautifulSoup
 from pydantic import BaseModel
 from rich.console import Console
 
 from ...common.log import LOG
-from ..summary import SummaryTool
+from ..summary import get_summary_tool
 
 
 def filter_text(html: str, use_summary=False, console: Console=None) -> str:
@@ -33,20 +31,13 @@ def filter_text(html: str, use_summary=False, console: Console=None) -> str:
     # compress text size
     if use_summary:
         try:
-            temp_file = tempfile.mkstemp()
-            file_path = temp_file[1]
-
-            with open(file_path, "w") as f:
-                f.write(text + "\n")
-
-            _summary = SummaryTool(console=console).path(file_path)
-            os.remove(file_path)
+            text = get_summary_tool(console).text(text)
         except Exception as e:
-            LOG.error(f"summary {file_path} failed... error_info: {repr(e)}")
+            LOG.error(f"summary failed... error_info: {repr(e)}")
             # fake summary
             _text_list = text.split()
             if len(_text_list) >= 500:
-                text = _text_list[:3000]  # english or any others
+                text = " ".join(_text_list[:3000])  # english or any others
             else:
                 text = text[:3000]  # chinese
     _summary = text
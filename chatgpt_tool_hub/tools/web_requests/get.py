@@ -6,7 +6,7 @@ from rich.console import Console
 from ...common.log import LOG
 from ...common.utils import get_from_dict_or_env
 from ..tool_register import main_tool_register
-from .. import BaseTool
+from .. import BaseTool, ErrorObservation
 from . import BaseRequestsTool, filter_text, RequestsWrapper
 
 default_tool_name = "url-get"
@@ -16,6 +16,7 @@ class RequestsGetTool(BaseRequestsTool, BaseTool):
     """Tool for making a GET request to an API endpoint."""
 
     name: str = default_tool_name
+    cache_ttl: float = 600  # 10 minutes
     description: str = (
         "A portal to the internet. Use this when you need to get specific content from a website. "
         "Input should be a url (i.e. https://www.google.com). "
@@ -31,6 +32,11 @@ class RequestsGetTool(BaseRequestsTool, BaseTool):
             tool_kwargs, 'url_get_use_summary', "URL_GET_USE_SUMMARY", True
         )
 
+    @property
+    def cache_namespace(self) -> str:
+        # a summarized page is a different observation than the filtered one
+        return f"{super().cache_namespace}:summary={bool(self.use_summary)}"
+
     def _run(self, url: str) -> str:
         """Run the tool."""
         try:
@@ -39,7 +45,7 @@ class RequestsGetTool(BaseRequestsTool, BaseTool):
             LOG.debug(f"[url-get] output: {str(_content)}")
         except Exception as e:
             LOG.error(f"[url-get] {str(e)}")
-            _content = repr(e)
+            _content = ErrorObservation(repr(e))
         return _content
 
     async def _arun(self, url: str) -> str:
@@ -50,7 +56,7 @@ class RequestsGetTool(BaseRequestsTool, BaseTool):
             LOG.debug(f"[url-get] output: {str(_content)}")
         except Exception as e:
             LOG.error(f"[url-get] {str(e)}")
-            _content = repr(e)
+            _content = ErrorObservation(repr(e))
         return _content
 
 # register the tool
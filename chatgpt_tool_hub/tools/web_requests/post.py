@@ -11,6 +11,7 @@ class RequestsPostTool(BaseRequestsTool, BaseTool):
     """Tool for making a POST request to an API endpoint."""
 
     name: str = default_tool_name
+    side_effects: bool = True
     description: str = """Use this when you want to POST to a website.
     Input should be a json string with two keys: "url" and "data".
     The value of "url" should be a string, and the value of "data" should be a dictionary of 
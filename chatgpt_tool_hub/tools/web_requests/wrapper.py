@@ -5,6 +5,7 @@ import aiohttp
 import requests
 from pydantic import BaseModel, model_validator
 
+from ...common.deadline import bound_timeout
 from ...common.log import LOG
 from ...common.utils import get_from_dict_or_env
 from .  import DEFAULT_HEADER
@@ -17,6 +18,8 @@ class RequestsWrapper(BaseModel):
     aiosession: Optional[aiohttp.ClientSession] = None
 
     proxy: Optional[str]
+    # seconds per request, shortened to what is left of the request deadline
+    timeout: Optional[float] = None
 
     class Config:
         """Configuration for this pydantic object."""
@@ -31,9 +34,15 @@ class RequestsWrapper(BaseModel):
             values, 'proxy', "PROXY", ""
         )
         values["proxy"] = proxy
+        values["timeout"] = float(get_from_dict_or_env(
+            values, 'requests_timeout', "REQUESTS_TIMEOUT", 30
+        ))
 
         return values
 
+    def _timeout_kwargs(self, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        return {**kwargs, "timeout": bound_timeout(kwargs.get("timeout", self.timeout))}
+
     def get(self, url: str, params: Dict[str, Any] = None, raise_for_status: bool = False, **kwargs) -> str:
         """GET the URL and return the text."""
         self.headers.update(DEFAULT_HEADER)
@@ -41,7 +50,8 @@ class RequestsWrapper(BaseModel):
             'http': self.proxy,
             'https': self.proxy,
         }
-        response = requests.get(url, headers=self.headers, params=params, proxies=proxies, **kwargs)
+        response = requests.get(url, headers=self.headers, params=params, proxies=proxies,
+                                **self._timeout_kwargs(kwargs))
         if raise_for_status:
             try:
                 response.raise_for_status()
@@ -57,7 +67,8 @@ class RequestsWrapper(BaseModel):
             'http': self.proxy,
             'https': self.proxy,
         }
-        return requests.post(url, data=data, headers=self.headers, proxies=proxies, **kwargs).text
+        return requests.post(url, data=data, headers=self.headers, proxies=proxies,
+                             **self._timeout_kwargs(kwargs)).text
 
     def patch(self, url: str, data: Dict[str, Any]) -> str:
         """PATCH the URL and return the text."""
@@ -66,7 +77,7 @@ class RequestsWrapper(BaseModel):
             if self.headers
             else {}.update(DEFAULT_HEADER)
         )
-        return requests.patch(url, json=data, headers=self.headers).text
+        return requests.patch(url, json=data, headers=self.headers, **self._timeout_kwargs({})).text
 
     def put(self, url: str, data: Dict[str, Any]) -> str:
         """PUT the URL and return the text."""
@@ -75,7 +86,7 @@ class RequestsWrapper(BaseModel):
             if self.headers
             else {}.update(DEFAULT_HEADER)
         )
-        return requests.put(url, json=data, headers=self.headers).text
+        return requests.put(url, json=data, headers=self.headers, **self._timeout_kwargs({})).text
 
     def delete(self, url: str) -> str:
         """DELETE the URL and return the text."""
@@ -84,11 +95,14 @@ class RequestsWrapper(BaseModel):
             if self.headers
             else {}.update(DEFAULT_HEADER)
         )
-        return requests.delete(url, headers=self.headers).text
+        return requests.delete(url, headers=self.headers, **self._timeout_kwargs({})).text
 
     async def _arequest(self, method: str, url: str, **kwargs: Any) -> str:
         """Make an async request."""
         self.headers.update(DEFAULT_HEADER)
+        timeout = bound_timeout(self.timeout)
+        if timeout:
+            kwargs.setdefault("timeout", aiohttp.ClientTimeout(total=timeout))
         proxies = {
             'http': self.proxy,
             'https': self.proxy,
@@ -18,6 +18,7 @@ default_tool_name = "wechat"
 class WeChatTool(BaseTool):
     """Tool that sends wechat."""
     name: str = default_tool_name
+    side_effects: bool = True
     description: str = (
         "A Tool can send wechat. "
     )
@@ -20,6 +20,7 @@ class WikipediaTool(BaseTool):
     """Tool that adds the capability to search using the Wikipedia API."""
 
     name: str = default_tool_name
+    cache_ttl: float = 86400  # 1 day
     description: str = (
         "Useful for when you need to answer general questions about "
         "people, places, companies, historical events, or other subjects. "
@@ -38,6 +39,11 @@ class WikipediaTool(BaseTool):
 
         self.debug = get_from_dict_or_env(tool_kwargs, "wikipedia_debug", "WIKIPEDIA_DEBUG", False)
 
+    @property
+    def cache_namespace(self) -> str:
+        w = self.api_wrapper
+        return f"{super().cache_namespace}:top_k={w.wikipedia_top_k_results}:debug={bool(self.debug)}"
+
     def _run(self, query: str) -> str:
         """Use the Wikipedia tool."""
         query = self.bot(query)
@@ -21,6 +21,7 @@ class WolframAlphaTool(BaseTool):
     """Tool that adds the capability to query using the Wolfram Alpha SDK."""
 
     name: str = default_tool_name
+    cache_ttl: float = 86400  # 1 day
     description: str = (
         "A wrapper around Wolfram Alpha. "
         "Useful for when you need to answer questions about Math, "
@@ -40,6 +41,11 @@ class WolframAlphaTool(BaseTool):
 
         self.debug = get_from_dict_or_env(tool_kwargs, "wolfram_alpha_debug", "WOLFRAM_ALPHA_DEBUG", False)
 
+    @property
+    def cache_namespace(self) -> str:
+        # a debug run answers with the rewritten query, not the result
+        return f"{super().cache_namespace}:debug={bool(self.debug)}"
+
     def _run(self, query: str) -> str:
         """Use the WolframAlpha tool."""
         query = self.bot(query)
@@ -4,6 +4,7 @@ from typing import Any, Dict, Optional
 from pydantic import BaseModel, model_validator
 
 from ...common.log import LOG
+from ..base_tool import ErrorObservation
 from ...common.utils import get_from_dict_or_env
 
 
@@ -52,6 +53,6 @@ class WolframAlphaAPIWrapper(BaseModel):
 
         if answer is None or answer == "":
             # We don't want to return the assumption alone if answer is empty
-            return "No good Wolfram Alpha Result was found"
+            return ErrorObservation("No good Wolfram Alpha Result was found")
         else:
             return f"Assumption: {assumption}\nAnswer: {answer}"